@@ -0,0 +1,130 @@
+"""
+Benchmark of the explicit-stack converters against the recursive implementations they replaced,
+on synthetic chain-shaped and star-shaped dependency trees.
+
+usage: python benchmarks/bench_recursion.py --lengths 100 1000 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pyconll
+from nltk.tree import Tree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.converter import *
+
+
+def chain_conllu(length):
+    # every token depends on its right neighbour, so the tree is as deep as the sentence is long
+    lines = []
+    for i in range(1, length + 1):
+        head, deprel = (i + 1, 'dep') if i < length else (0, 'root')
+        lines.append(f'{i}\tw{i}\tw{i}\tNOUN\t_\t_\t{head}\t{deprel}\t_\t_')
+    return '\n'.join(lines) + '\n'
+
+
+def star_conllu(length):
+    # every token depends on the middle token, so the tree is one level deep and maximally wide
+    root = (length + 1) // 2
+    lines = []
+    for i in range(1, length + 1):
+        head, deprel = (root, 'dep') if i != root else (0, 'root')
+        lines.append(f'{i}\tw{i}\tw{i}\tNOUN\t_\t_\t{head}\t{deprel}\t_\t_')
+    return '\n'.join(lines) + '\n'
+
+
+# recursive reference implementations (per-dependent recursion over the dependency index)
+def recursive_flat_converter(index, token, get_nt):
+    token_id = int(token.id)
+    if not index.left_children[token_id] and not index.right_children[token_id]:
+        return create_leaf(get_nt(token), token.form)
+    constituency = f'({get_nt(token)} '
+    for child_id in index.children(token_id):
+        if child_id == token_id:
+            sub_constituency = create_leaf(get_nt(token), token.form)
+        else:
+            sub_constituency = recursive_flat_converter(
+                index, index.tokens[child_id], get_nt)
+        constituency += sub_constituency
+    return constituency.rstrip() + ') '
+
+
+def recursive_phrase(index, token, left_children_ids, right_children_ids,
+                     get_nt, from_left):
+    def full_phrase(child_id):
+        return recursive_phrase(index, index.tokens[child_id],
+                                list(index.left_children[child_id]),
+                                list(index.right_children[child_id]), get_nt,
+                                from_left)
+
+    def rest():
+        return recursive_phrase(index, token, left_children_ids,
+                                right_children_ids, get_nt, from_left)
+
+    if left_children_ids == [] and right_children_ids == []:
+        return Tree(get_nt(token), [sanitize_form(token.form)])
+    if left_children_ids != [] and (from_left or right_children_ids == []):
+        l_phrase = full_phrase(left_children_ids.pop(0))
+        return Tree(get_nt(token), [l_phrase, rest()])
+    r_id = right_children_ids.pop(-1)
+    return Tree(get_nt(token), [rest(), full_phrase(r_id)])
+
+
+def recursive_left_converter(index, token, get_nt):
+    token_id = int(token.id)
+    return recursive_phrase(index, token, list(index.left_children[token_id]),
+                            list(index.right_children[token_id]), get_nt,
+                            True).pformat(margin=1e100)
+
+
+def recursive_right_converter(index, token, get_nt):
+    token_id = int(token.id)
+    return recursive_phrase(index, token, list(index.left_children[token_id]),
+                            list(index.right_children[token_id]), get_nt,
+                            False).pformat(margin=1e100)
+
+
+def time_function(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lengths', nargs='+', type=int,
+                        default=[100, 1000, 10000, 30000])
+    parser.add_argument('--repeat', default=3, type=int)
+    args = parser.parse_args()
+
+    pairs = [
+        ('flat', flat_converter, recursive_flat_converter),
+        ('left', left_converter, recursive_left_converter),
+        ('right', right_converter, recursive_right_converter),
+    ]
+    print('shape\tlength\tmethod\titerative(s)\trecursive(s)')
+    for shape, make_conllu in [('chain', chain_conllu), ('star', star_conllu)]:
+        for length in args.lengths:
+            sentence = pyconll.load.load_from_string(make_conllu(length))[0]
+            index = DependencyIndex(sentence)
+            for method, iterative, recursive in pairs:
+                iterative_time, iterative_result = time_function(
+                    lambda: iterative(sentence, index.root, get_X_nt, index),
+                    args.repeat)
+                try:
+                    recursive_time, recursive_result = time_function(
+                        lambda: recursive(index, index.root, get_X_nt),
+                        args.repeat)
+                    assert iterative_result.rstrip() == recursive_result.rstrip()
+                    recursive_str = f'{recursive_time:.5f}'
+                except RecursionError:
+                    recursive_str = 'RecursionError'
+                print(f'{shape}\t{length}\t{method}\t{iterative_time:.5f}\t{recursive_str}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of general_converter with the one-pass validate_sentence against the checks it used to run
+(pyconll's find_nonprojective_deps, then rootcross_included, then conversion until a bad form is hit),
+on a synthetic corpus with a configurable rate of non-projective sentences.
+Both sides convert (flat, X labels) and generate the tokens of the accepted sentences.
+
+usage: python benchmarks/bench_validation.py --sentences 20000 --nonproj_rate 0.5
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from pyconll.util import find_nonprojective_deps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.converter import *
+from src.conllu_reader import LightSentence
+from synthetic import random_sentence_lines
+
+
+def legacy_rejection(sentence):
+    try:
+        if len(find_nonprojective_deps(sentence)) != 0:
+            raise NonProjError
+        index = DependencyIndex(sentence)
+        if rootcross_included(sentence, index):
+            raise RootNonProjError
+        flat_converter(sentence, index.root, get_X_nt, index)
+        generate_tokens(sentence)
+    except KeyError:
+        return 'inclempty'
+    except Exception as e:
+        return {error: reason for reason, error in REJECTION_ERRORS.items()}[type(e)]
+    return None
+
+
+def new_rejection(sentence):
+    try:
+        general_converter(flat_converter, sentence, get_X_nt)
+        generate_tokens(sentence)
+    except KeyError:
+        return 'inclempty'
+    except Exception as e:
+        return {error: reason for reason, error in REJECTION_ERRORS.items()}[type(e)]
+    return None
+
+
+# structural checks only (no conversion), as run before general_converter converts anything
+def legacy_checks(sentence):
+    if len(find_nonprojective_deps(sentence)) != 0:
+        return 'nonproj'
+    try:
+        if rootcross_included(sentence):
+            return 'root_nonproj'
+    except NotContainRootError:
+        return 'notcontainroot'
+    return None
+
+
+def new_checks(sentence):
+    rejection = validate_sentence(DependencyIndex(sentence))
+    return rejection if rejection in ('nonproj', 'root_nonproj', 'notcontainroot') else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentences', default=20000, type=int)
+    parser.add_argument('--min_length', default=5, type=int)
+    parser.add_argument('--max_length', default=40, type=int)
+    parser.add_argument('--nonproj_rate', default=0.5, type=float)
+    parser.add_argument('--seed', default=0, type=int)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [
+        LightSentence(random_sentence_lines(rng, rng.randint(args.min_length, args.max_length),
+                                            nonproj_rate=args.nonproj_rate))
+        for _ in range(args.sentences)
+    ]
+
+    for title, legacy, new in [('checks only', legacy_checks, new_checks),
+                               ('checks and conversion', legacy_rejection, new_rejection)]:
+        print(f'# {title}')
+        results = {}
+        for name, check in [('legacy', legacy), ('one-pass', new)]:
+            start = time.perf_counter()
+            results[name] = [check(sentence) for sentence in corpus]
+            elapsed = time.perf_counter() - start
+            print(f'{name}\t{elapsed:.3f}s\t{len(corpus) / elapsed:.0f} sent/s')
+        assert results['legacy'] == results['one-pass']
+        print('rejections:', dict(Counter(results['legacy'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark suite for the converter hot paths and the end-to-end convert_conllu_files loop.
+
+A synthetic corpus (see synthetic.py) is generated, every benchmark reports sentences/sec, tokens/sec and the
+peak traced memory, and the throughput is compared against a stored baseline (benchmarks/baseline.json).
+The baseline is machine dependent: regenerate it with --save_baseline before comparing on a new machine.
+
+usage: python benchmarks/run_benchmarks.py [--sentences 2000] [--save_baseline] [--tolerance 0.2]
+
+With --corpus, the benchmarks run on a given CoNLL-U file instead, e.g. the <file>.slowest.conllu sentences that
+generate_dataset.py --profile wrote; there is no baseline comparison then.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..'))
+from src.converter import *
+from src.conllu_reader import iter_sentences
+from src import generate_dataset
+from synthetic import generate_corpus
+
+
+def measure(function, repeat):
+    # the best of `repeat` timed runs, and the peak memory of a separate traced run
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def converter_benchmarks(sentences):
+    indexed = [(sentence, DependencyIndex(sentence)) for sentence in sentences]
+    valid = [(sentence, index) for sentence, index in indexed if validate_sentence(index) is None]
+
+    def run_extract_children():
+        for sentence, index in valid:
+            extract_children(sentence, index.root)
+
+    def run_converter(converter):
+        def run():
+            for sentence, index in valid:
+                converter(sentence, index.root, get_pos_nt, index)
+        return run
+
+    def run_general_converter():
+        for sentence in sentences:
+            try:
+                general_converter(flat_converter, sentence, get_pos_nt)
+            except (KeyError, NonProjError, RootNonProjError, CFContainedError,
+                    ContainNoneError, NotContainRootError):
+                pass
+
+    valid_sentences = [sentence for sentence, _ in valid]
+    return [
+        ('extract_children', run_extract_children, valid_sentences),
+        ('flat_converter', run_converter(flat_converter), valid_sentences),
+        ('left_converter', run_converter(left_converter), valid_sentences),
+        ('right_converter', run_converter(right_converter), valid_sentences),
+        ('general_converter', run_general_converter, sentences),
+    ]
+
+
+def end_to_end_benchmark(source_dir, output_path, sentences):
+    args = generate_dataset.build_parser().parse_args([
+        '--source_path', str(source_dir), '--output_path', str(output_path),
+        '--convert_method', 'flat', '--use_pos_label',
+        '--dev_test_sentence_num', str(len(sentences) + 1)
+    ])
+    output_dir = Path(output_path) / get_method_str(args)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    return ('convert_conllu_files', lambda: generate_dataset.convert_conllu_files(args), sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentences', default=2000, type=int)
+    parser.add_argument('--min_length', default=5, type=int)
+    parser.add_argument('--max_length', default=40, type=int)
+    parser.add_argument('--branching', default=3, type=int)
+    parser.add_argument('--nonproj_rate', default=0.1, type=float)
+    parser.add_argument('--multiword_rate', default=0.02, type=float)
+    parser.add_argument('--corpus', default='')
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'baseline.json'))
+    parser.add_argument('--save_baseline', action='store_true')
+    # relative slowdown of sentences/sec against the baseline that is reported as a regression
+    parser.add_argument('--tolerance', default=0.2, type=float)
+    args = parser.parse_args()
+    if args.corpus and args.save_baseline:
+        parser.error('the baseline is only saved for the synthetic corpus')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / 'source'
+        source_dir.mkdir()
+        if args.corpus:
+            shutil.copyfile(args.corpus, source_dir / 'dev.conllu')
+        else:
+            generate_corpus(source_dir / 'dev.conllu', args.sentences,
+                            args.min_length, args.max_length, args.branching,
+                            args.nonproj_rate, args.multiword_rate)
+        sentences = list(iter_sentences(source_dir / 'dev.conllu'))
+        benchmarks = converter_benchmarks(sentences)
+        benchmarks.append(end_to_end_benchmark(source_dir, Path(tmp_dir) / 'output', sentences))
+
+        results = {}
+        for name, function, measured_sentences in benchmarks:
+            elapsed, peak = measure(function, args.repeat)
+            token_num = sum(len(sentence) for sentence in measured_sentences)
+            results[name] = {
+                'sentences_per_sec': len(measured_sentences) / elapsed,
+                'tokens_per_sec': token_num / elapsed,
+                'peak_memory_kb': peak / 1024,
+            }
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline and not args.corpus:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f'{"benchmark":<22}{"sent/s":>12}{"tokens/s":>12}{"peak KB":>10}{"vs baseline":>14}')
+    for name, result in results.items():
+        comparison = ''
+        if name in baseline:
+            ratio = result['sentences_per_sec'] / baseline[name]['sentences_per_sec']
+            comparison = f'{ratio:.2f}x'
+            if ratio < 1 - args.tolerance:
+                comparison += ' SLOWER'
+                regressions.append(name)
+        print(f'{name:<22}{result["sentences_per_sec"]:>12.0f}{result["tokens_per_sec"]:>12.0f}'
+              f'{result["peak_memory_kb"]:>10.0f}{comparison:>14}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'baseline saved to {args.baseline}')
+    if regressions:
+        print(f'regressions: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
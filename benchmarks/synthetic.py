@@ -0,0 +1,84 @@
+"""
+Synthetic CoNLL-U corpora for the benchmarks.
+
+Sentences are random projective trees in which every token has at most `branching` dependents.
+With probability `nonproj_rate`, one token of a sentence is reattached to a random token outside its own subtree
+(which usually makes the tree non-projective), and every token starts a two-word multiword token
+with probability `multiword_rate`.
+"""
+
+import random
+
+UPOS = ['NOUN', 'VERB', 'ADJ', 'ADV', 'PRON', 'DET', 'ADP', 'PROPN', 'PUNCT']
+DEPRELS = ['nsubj', 'obj', 'obl', 'amod', 'advmod', 'det', 'case', 'nmod', 'punct']
+
+
+def split_span(rng, lo, hi, parts):
+    # split lo..hi into `parts` contiguous non-empty spans
+    cuts = sorted(rng.sample(range(lo + 1, hi + 1), parts - 1))
+    bounds = [lo] + cuts + [hi + 1]
+    return [(start, end - 1) for start, end in zip(bounds, bounds[1:])]
+
+
+def random_heads(rng, length, branching):
+    # pick a head in each span and split the rest of the span into at most `branching` child spans
+    heads = [0] * (length + 1)
+    spans = [(1, length, 0)]
+    while spans:
+        lo, hi, parent = spans.pop()
+        head = rng.randint(lo, hi) if branching > 1 else rng.choice([lo, hi])
+        heads[head] = parent
+        left_len, right_len = head - lo, hi - head
+        if left_len and right_len:
+            left_parts = rng.randint(1, max(1, branching - 1))
+            right_parts = rng.randint(1, max(1, branching - left_parts))
+        else:
+            left_parts = right_parts = rng.randint(1, branching)
+        if left_len:
+            spans += [(start, end, head) for start, end in split_span(rng, lo, head - 1, min(left_parts, left_len))]
+        if right_len:
+            spans += [(start, end, head) for start, end in split_span(rng, head + 1, hi, min(right_parts, right_len))]
+    return heads
+
+
+def reattach(rng, heads):
+    length = len(heads) - 1
+    dependent = rng.choice([i for i in range(1, length + 1) if heads[i] != 0])
+    subtree = {dependent}
+    changed = True
+    while changed:
+        changed = False
+        for i in range(1, length + 1):
+            if i not in subtree and heads[i] in subtree:
+                subtree.add(i)
+                changed = True
+    candidates = [i for i in range(1, length + 1) if i not in subtree]
+    heads[dependent] = rng.choice(candidates)
+
+
+def random_sentence_lines(rng, length, branching=3, nonproj_rate=0.0,
+                          multiword_rate=0.0, sent_id=None):
+    heads = random_heads(rng, length, branching)
+    if length > 2 and rng.random() < nonproj_rate:
+        reattach(rng, heads)
+    lines = [] if sent_id is None else [f'# sent_id = {sent_id}']
+    for i in range(1, length + 1):
+        if i < length and rng.random() < multiword_rate:
+            lines.append(f'{i}-{i + 1}\tw{i}w{i + 1}\t_\t_\t_\t_\t_\t_\t_\t_')
+        deprel = 'root' if heads[i] == 0 else rng.choice(DEPRELS)
+        lines.append(f'{i}\tw{i}\tw{i}\t{rng.choice(UPOS)}\t_\tNumber=Sing\t{heads[i]}\t{deprel}\t_\tSpaceAfter=No')
+    return lines
+
+
+def generate_corpus(path, sentence_num, min_length=5, max_length=40,
+                    branching=3, nonproj_rate=0.0, multiword_rate=0.0,
+                    seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        for i in range(sentence_num):
+            length = rng.randint(min_length, max_length)
+            lines = random_sentence_lines(rng, length, branching,
+                                          nonproj_rate, multiword_rate,
+                                          sent_id=f'synthetic-{i}')
+            f.write('\n'.join(lines))
+            f.write('\n\n')
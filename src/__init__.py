@@ -0,0 +1,6 @@
+# The library API (see api.py) is imported on first use, so that importing a submodule stays cheap.
+def __getattr__(name):
+    if name in ('convert_stream', 'convert_file'):
+        from . import api
+        return getattr(api, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
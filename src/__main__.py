@@ -0,0 +1,40 @@
+"""
+Command line entry point of the package:
+
+    python -m src convert [options]   convert CoNLL-U files into phrase structures (generate_dataset.py)
+    python -m src split [options]     split CoNLL-U shards into train / dev / test (tdt_split.py)
+    python -m src serve [options]     run the conversion service (server.py)
+
+Installed (pip install .), the package is named dep_to_const and the commands are also available as
+`dep-to-const convert|split|serve [options]`.
+
+Only the module of the command is imported.
+"""
+
+import importlib
+import sys
+
+COMMANDS = {
+    'convert': 'generate_dataset',
+    'split': 'tdt_split',
+    'serve': 'server',
+}
+
+
+def main(argv=None, prog=None):
+    argv = sys.argv[1:] if argv is None else argv
+    prog = prog or f'python -m {__package__}'
+    if not argv or argv[0] not in COMMANDS:
+        sys.stderr.write(f'usage: {prog} {{{",".join(COMMANDS)}}} [options]\n')
+        return 2
+    module = importlib.import_module(f'.{COMMANDS[argv[0]]}', __package__)
+    return module.main(argv[1:], prog=f'{prog} {argv[0]}')
+
+
+# The dep-to-const console script of the installed package.
+def cli():
+    return main(prog='dep-to-const')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
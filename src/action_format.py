@@ -0,0 +1,170 @@
+"""
+Compact binary output of the converted trees (`<stem>.actions`), for training code that would otherwise re-parse
+the bracketed .txt lines.
+
+A tree is stored as its top-down action sequence: OPEN(label) opens a phrase, SHIFT adds the next leaf (a word
+with its preterminal label) and REDUCE closes the innermost open phrase. The actions are produced from the
+dependency index by the same walk as emit_bracketing, without building the bracketed string.
+
+The file is a sequence of records of native unsigned 32-bit integers, one per converted sentence:
+
+    n_words, n_actions, word ids (n_words), leaf label ids (n_words), actions (n_actions)
+
+where an action is SHIFT (0), REDUCE (1) or 2 + the label id of an OPEN. The words and labels of the ids are
+stored in `<stem>.actions.vocab.json`. ActionReader reads the records through mmap, as memoryviews into the file.
+decode_actions turns a record back into the exact line of the .txt output.
+"""
+
+import json
+import mmap
+import os
+from array import array
+
+try:
+    from .converter import expand_flat, expand_left, expand_right, flat_converter, left_converter, right_converter
+except ImportError:
+    from converter import expand_flat, expand_left, expand_right, flat_converter, left_converter, right_converter
+
+SHIFT, REDUCE = 0, 1
+OPEN_OFFSET = 2
+ACTIONS_SUFFIX = '.actions'
+VOCAB_SUFFIX = '.actions.vocab.json'
+
+EXPANDERS = {
+    flat_converter: expand_flat,
+    left_converter: expand_left,
+    right_converter: expand_right,
+}
+
+
+# The (words, leaf labels, actions) of the tree that converter(sentence, index.root, get_nt, index) brackets,
+# with OPEN actions given by their label. Like convert_validated, a single-token sentence gets one more phrase.
+def convert_actions(converter, sentence, get_nt, index):
+    words, leaf_labels, actions = [], [], []
+    forms = index.sanitized_forms()
+    tokens, lefts, rights = index.tokens, index.left_children, index.right_children
+    expand = EXPANDERS[converter]
+    # the stack items of emit_bracketing, with (label, ) tuples in place of the open_nt strings
+    stack = [int(index.root.id)]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            actions.extend([REDUCE] * item.count(')'))
+        elif type(item) is tuple:
+            actions.append(item[0])
+        elif item < 0 or (not lefts[item] and not rights[item]):
+            token_id = abs(item)
+            words.append(forms[token_id])
+            leaf_labels.append(get_nt(tokens[token_id]))
+            actions.append(SHIFT)
+        else:
+            stack.extend(reversed(expand(item, (get_nt(tokens[item]), ), lefts[item], rights[item])))
+    if len(sentence) == 1:
+        actions = [get_nt(sentence[0])] + actions + [REDUCE]
+    return words, leaf_labels, actions
+
+
+# The bracketed line of a tree given by its words, leaf labels and actions (with OPEN actions given by label).
+def decode_actions(words, leaf_labels, actions):
+    output = []
+    word_num = 0
+    closed = False
+    for action in actions:
+        if action == REDUCE:
+            output.append(')')
+            closed = True
+            continue
+        if closed:
+            output.append(' ')
+        if action == SHIFT:
+            output.append(f'({leaf_labels[word_num]} {words[word_num]})')
+            word_num += 1
+            closed = True
+        else:
+            output.append(f'({action} ')
+            closed = False
+    return ''.join(output)
+
+
+class ActionWriter:
+    def __init__(self, path):
+        self.path = f'{path}{ACTIONS_SUFFIX}'
+        self.vocab_path = f'{path}{VOCAB_SUFFIX}'
+        self.tmp_path = f'{self.path}.tmp'
+        self.words = {}
+        self.labels = {}
+        self.file = open(self.tmp_path, 'wb')
+
+    def write(self, words, leaf_labels, actions):
+        record = array('I', [len(words), len(actions)])
+        record.extend(self.words.setdefault(word, len(self.words)) for word in words)
+        record.extend(self.labels.setdefault(label, len(self.labels)) for label in leaf_labels)
+        record.extend(action if type(action) is int else OPEN_OFFSET + self.labels.setdefault(action, len(self.labels))
+                      for action in actions)
+        record.tofile(self.file)
+
+    def close(self):
+        self.file.close()
+        with open(f'{self.vocab_path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'words': list(self.words), 'labels': list(self.labels)}, f, ensure_ascii=False)
+        os.replace(f'{self.vocab_path}.tmp', self.vocab_path)
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    # on error, the partial output is left in the .tmp file
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+class ActionReader:
+    # path is the output path without the .actions suffix, as given to ActionWriter
+    def __init__(self, path):
+        with open(f'{path}{VOCAB_SUFFIX}', encoding='utf-8') as f:
+            vocab = json.load(f)
+        self.words, self.labels = vocab['words'], vocab['labels']
+        with open(f'{path}{ACTIONS_SUFFIX}', 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+        self.view = memoryview(self.mm).cast('I') if self.mm is not None else memoryview(array('I'))
+
+    # Yield (word ids, leaf label ids, actions) of every record, as memoryviews into the file that are released
+    # when the next record is read (copy them to keep them).
+    def __iter__(self):
+        position = 0
+        while position < len(self.view):
+            word_num, action_num = self.view[position], self.view[position + 1]
+            position += 2
+            record = (self.view[position:position + word_num],
+                      self.view[position + word_num:position + 2 * word_num],
+                      self.view[position + 2 * word_num:position + 2 * word_num + action_num])
+            try:
+                yield record
+            finally:
+                for view in record:
+                    view.release()
+            position += 2 * word_num + action_num
+
+    # The (words, leaf labels, actions) of a record, with OPEN actions given by their label as convert_actions
+    # returns them.
+    def lookup(self, record):
+        word_ids, label_ids, actions = record
+        return ([self.words[i] for i in word_ids], [self.labels[i] for i in label_ids],
+                [action if action < OPEN_OFFSET else self.labels[action - OPEN_OFFSET] for action in actions])
+
+    def decode(self, record):
+        return decode_actions(*self.lookup(record))
+
+    def close(self):
+        self.view.release()
+        if self.mm is not None:
+            self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
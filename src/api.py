@@ -0,0 +1,40 @@
+"""
+Library API for pipelines that convert sentences in-process instead of running generate_dataset.py:
+
+    from src import convert_stream
+    for phrase_structure in convert_stream(sentences, method='left', label='POS'):
+        ...
+
+Sentences are parsed sentences (LightSentence, pyconll Sentence, ...) or CoNLL-U blocks as strings. The phrase
+structures are the lines generate_dataset.py writes to the .txt outputs. Rejected sentences (non-projective,
+crossing above the root, ...) are skipped, or raise their error (see REJECTION_ERRORS) with errors='raise'.
+"""
+
+try:
+    from .conllu_reader import LightSentence, iter_sentences
+    from .converter import (CONVERTERS, LABEL_FUNCTIONS, REJECTION_ERRORS, DependencyIndex, convert_validated,
+                            validate_sentence)
+except ImportError:
+    from conllu_reader import LightSentence, iter_sentences
+    from converter import (CONVERTERS, LABEL_FUNCTIONS, REJECTION_ERRORS, DependencyIndex, convert_validated,
+                           validate_sentence)
+
+
+def convert_stream(sentences, method='flat', label='X', errors='skip'):
+    if errors not in ('skip', 'raise'):
+        raise ValueError(f"errors must be 'skip' or 'raise', not {errors!r}")
+    converter, get_nt = CONVERTERS[method], LABEL_FUNCTIONS[label]
+    for sentence in sentences:
+        if isinstance(sentence, str):
+            sentence = LightSentence([line.strip() for line in sentence.splitlines() if line.strip()])
+        index = DependencyIndex(sentence)
+        rejection = validate_sentence(index)
+        if rejection is None:
+            yield convert_validated(converter, sentence, get_nt, index)
+        elif errors == 'raise':
+            raise REJECTION_ERRORS[rejection]
+
+
+# Convert every sentence of a CoNLL-U file, streaming it (see conllu_reader.py).
+def convert_file(source_path, method='flat', label='X', errors='skip', exclude_ids=None):
+    return convert_stream(iter_sentences(source_path, exclude_ids=exclude_ids), method, label, errors)
@@ -0,0 +1,293 @@
+"""
+Vectorized conversion engine for batches of sentences (opt-in, needs numpy).
+
+The sentences of a batch are packed into flat arrays (token positions, heads, label ids, sentence offsets), and
+the tree checks and the bracketing are computed with array operations over the whole batch instead of walking
+every sentence in Python:
+
+- tree check: every head pointer is followed to the root by pointer doubling, which also catches cycles;
+- non-projectivity: two arcs (l1, r1), (l2, r2) cross iff l1 < l2 < r1 < r2 (what validate_sentence finds with
+  its stack of open arcs), i.e. iff an arc starting strictly inside (l1, r1) ends after r1. The furthest end of
+  the arcs starting inside every arc is a range maximum, answered for all the arcs at once with a sparse table
+  of log2(sentence length) rows;
+- root crossing: an arc passes over the root;
+- bracketing: in a projective tree every subtree is a span, found by pointer doubling over the leftmost and
+  rightmost children. Every bracket of a head then is a (first token, last token) pair whose position depends
+  only on the method (see BRACKET_SPANS), and the output is the sequence of open brackets, leaves, close
+  brackets and spaces sorted by token position.
+
+The strings are only materialized at the end, by one join per sentence over the sorted pieces. The token lines
+are joined from the forms sanitized when packing.
+
+Sentences the packed representation does not cover (multiword or empty-node ids out of order, missing or
+dangling heads, no single root, cycles, None forms or forms with Cf characters) are converted by the Python
+engine, so the results are always the ones of general_converter.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('The numpy conversion engine needs the numpy package (pip install numpy)')
+
+try:
+    from .converter import (CFContainedError, CONVERTERS, ContainNoneError, DependencyIndex, generate_tokens,
+                            sanitize_form, validate_sentence)
+except ImportError:
+    from converter import (CFContainedError, CONVERTERS, ContainNoneError, DependencyIndex, generate_tokens,
+                           sanitize_form, validate_sentence)
+
+METHOD_NAMES = {converter: method for method, converter in CONVERTERS.items()}
+
+
+OPEN, LEAF, CLOSE, SPACE = range(4)
+
+
+class SentenceBatch:
+    # Packed tokens: the heads (0 for the root) and the root id of every sentence, the sanitized forms, and the
+    # labels of every label function. `selected` are the indices of the sentences in the input list.
+    def __init__(self, selected, lengths, heads, roots, forms, labels):
+        self.selected = selected
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.heads = np.asarray(heads, dtype=np.int64)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.forms = forms
+        self.labels = labels
+        self.offsets = np.zeros(len(self.lengths) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.positions = np.arange(len(self.heads))
+        self.sentence_of = np.repeat(np.arange(len(self.lengths)), self.lengths)
+        self.ids = self.positions - self.offsets[self.sentence_of] + 1
+        # positions of the heads in the flat arrays, with the root pointing to itself
+        self.head_positions = np.where(self.heads > 0, self.offsets[self.sentence_of] + self.heads - 1,
+                                       self.positions)
+        # enough pointer doubling rounds to walk up (or along) the longest sentence
+        self.doubling_rounds = int(self.lengths.max(initial=1)).bit_length() + 1
+
+    # Pack the sentences that pack_tokens accepts, and return the batch and the indices of the other sentences.
+    @classmethod
+    def pack(cls, sentences, get_nts):
+        selected, fallback = [], []
+        lengths, heads, roots, forms = [], [], [], []
+        labels = [[] for _ in get_nts]
+        for i, sentence in enumerate(sentences):
+            packed = pack_tokens(sentence)
+            if packed is None:
+                fallback.append(i)
+                continue
+            sentence_heads, root, sentence_forms = packed
+            selected.append(i)
+            lengths.append(len(sentence_heads))
+            heads.extend(sentence_heads)
+            roots.append(root)
+            forms.extend(sentence_forms)
+            words = [token for token in sentence if not token.is_multiword()]
+            for get_nt, function_labels in zip(get_nts, labels):
+                function_labels.extend(get_nt(token) for token in words)
+        return cls(selected, lengths, heads, roots, forms, labels), fallback
+
+    def __len__(self):
+        return len(self.selected)
+
+    # The batch of the packed sentences with the given indices (in this batch).
+    def subset(self, indices):
+        keep = np.zeros(len(self), dtype=bool)
+        keep[indices] = True
+        positions = np.flatnonzero(keep[self.sentence_of]).tolist()
+        return SentenceBatch([self.selected[i] for i in indices], self.lengths[indices],
+                             self.heads[positions], self.roots[indices],
+                             [self.forms[position] for position in positions],
+                             [[labels[position] for position in positions] for labels in self.labels])
+
+    # Indices of the sentences whose head pointers do not all lead to the root.
+    def cyclic(self):
+        ancestors = self.head_positions
+        for _ in range(self.doubling_rounds):
+            ancestors = ancestors[ancestors]
+        root_positions = self.offsets[:-1] + self.roots - 1
+        return np.unique(self.sentence_of[ancestors != root_positions[self.sentence_of]]).tolist()
+
+    # The rejection reason of every sentence ('nonproj', 'root_nonproj' or None), like validate_sentence.
+    def rejections(self):
+        arcs = self.heads > 0
+        starts = self.offsets[self.sentence_of]
+        lefts = (starts + np.minimum(self.ids, self.heads) - 1)[arcs]
+        rights = (starts + np.maximum(self.ids, self.heads) - 1)[arcs]
+
+        # an arc (l1, r1) is crossed iff the arcs starting strictly inside it reach past it (l1 < l2 < r1 < r2):
+        # the furthest right end of the arcs starting at every position, and its maximum over the inner
+        # positions of every arc with a sparse table (row k: the maximum of the 2**k positions from there)
+        reach = np.full(len(self.positions), -1, dtype=np.int64)
+        np.maximum.at(reach, lefts, rights)
+        inner = rights - lefts - 1
+        nested = inner > 0
+        lefts, rights, inner = lefts[nested], rights[nested], inner[nested]
+        levels = np.zeros(len(inner), dtype=np.int64)
+        table = [reach]
+        while len(inner) and 2 ** len(table) <= inner.max():
+            width = 2 ** (len(table) - 1)
+            previous = table[-1]
+            table.append(np.concatenate([np.maximum(previous[:-width], previous[width:]), previous[-width:]]))
+            levels[inner >= 2 ** (len(table) - 1)] += 1
+        table = np.stack(table)
+        furthest = np.maximum(table[levels, lefts + 1], table[levels, rights - 2 ** levels])
+        nonproj = np.zeros(len(self), dtype=bool)
+        nonproj[self.sentence_of[lefts[furthest > rights]]] = True
+
+        roots = self.roots[self.sentence_of]
+        over_root = ((self.ids < roots) & (roots < self.heads)) | ((self.ids > roots) & (roots > self.heads))
+        root_nonproj = np.zeros(len(self), dtype=bool)
+        root_nonproj[self.sentence_of[over_root]] = True
+
+        return [
+            'nonproj' if is_nonproj else 'root_nonproj' if is_root_nonproj else None
+            for is_nonproj, is_root_nonproj in zip(nonproj.tolist(), root_nonproj.tolist())
+        ]
+
+    # The first and last positions of the subtree of every token (the trees must be projective): the leftmost
+    # descendant is the leftmost descendant of the leftmost left child, and so on.
+    def spans(self):
+        arcs = self.heads > 0
+        children, heads = self.positions[arcs], self.head_positions[arcs]
+        starts, ends = self.positions.copy(), self.positions.copy()
+        left = children < heads
+        np.minimum.at(starts, heads[left], children[left])
+        np.maximum.at(ends, heads[~left], children[~left])
+        for _ in range(self.doubling_rounds):
+            starts = starts[starts]
+            ends = ends[ends]
+        return starts, ends
+
+    # The brackets of the method as (head, first token, last token) position arrays.
+    def brackets(self, method, spans):
+        starts, ends = spans
+        arcs = self.heads > 0
+        children, heads = self.positions[arcs], self.head_positions[arcs]
+        if method == 'flat':
+            heads = np.unique(heads)
+            return heads, starts[heads], ends[heads]
+        return (heads, ) + BRACKET_SPANS[method](children, heads, children < heads, starts, ends)
+
+    # The pieces of the bracketing of every sentence for one method, in output order: their kinds, their token
+    # positions (the head of a bracket, the token of a leaf), and where the pieces of each sentence start.
+    def pieces(self, method, spans):
+        heads, opens, closes = self.brackets(method, spans)
+        not_last = self.positions[self.positions + 1 < self.offsets[self.sentence_of + 1]]
+        piece_positions = np.concatenate([opens, self.positions, closes, not_last])
+        kinds = np.concatenate([np.full(len(opens), OPEN), np.full(len(self.positions), LEAF),
+                                np.full(len(closes), CLOSE), np.full(len(not_last), SPACE)])
+        # at the same token, opens come outer (later closing) first and closes inner (later opening) first
+        keys = np.concatenate([-closes, np.zeros(len(self.positions), dtype=np.int64), -opens,
+                               np.zeros(len(not_last), dtype=np.int64)])
+        values = np.concatenate([heads, self.positions, heads, not_last])
+        order = np.lexsort((keys, kinds, piece_positions))
+        bounds = np.searchsorted(piece_positions[order], self.offsets).tolist()
+        return kinds[order], values[order], bounds
+
+    # Materialize the bracketed string of every sentence from the pieces of a method, with the labels of the
+    # label function label_index.
+    def bracketing(self, pieces, label_index):
+        kinds, values, bounds = pieces
+        labels = self.labels[label_index]
+        vocabulary = {}
+        label_ids = np.array([vocabulary.setdefault(label, len(vocabulary)) for label in labels], dtype=np.int64)
+        leaf_offset = len(vocabulary)
+        table = np.array([f'({label} ' for label in vocabulary] +
+                         [f'({label} {form})' for label, form in zip(labels, self.forms)] +
+                         [')', ' '], dtype=object)
+        piece_ids = np.select([kinds == OPEN, kinds == LEAF, kinds == CLOSE],
+                              [label_ids[values], leaf_offset + values, len(table) - 2],
+                              len(table) - 1)
+        strings = table[piece_ids].tolist()
+        return [''.join(strings[bounds[i]:bounds[i + 1]]) for i in range(len(self))]
+
+
+# (first token, last token) of the bracket a head opens for each of its dependents:
+# left: (NT l1 (NT l2 ... (NT (NT head r1) r2) ... rn)), right: (NT (NT (NT l1 ... (NT lm head)) r1) ... rn)
+def left_spans(children, heads, left, starts, ends):
+    return np.where(left, starts[children], heads), np.where(left, ends[heads], ends[children])
+
+
+def right_spans(children, heads, left, starts, ends):
+    return np.where(left, starts[children], starts[heads]), np.where(left, heads, ends[children])
+
+
+BRACKET_SPANS = {
+    'left': left_spans,
+    'right': right_spans,
+}
+
+
+# (heads, root id, sanitized forms) of a sentence, or None if it has to be converted by the Python engine.
+# The ids must be 1..n once multiword tokens are skipped, and the only token attached to 0 must be the first
+# token labeled root.
+def pack_tokens(sentence):
+    heads, forms = [], []
+    root = first_root = None
+    for token in sentence:
+        if token.is_multiword():
+            continue
+        token_id = len(heads) + 1
+        if token.id != str(token_id) or token.head is None:
+            return None
+        try:
+            forms.append(sanitize_form(token.form))
+        except (CFContainedError, ContainNoneError):
+            return None
+        head = int(token.head)
+        if head == 0:
+            if root is not None:
+                return None
+            root = token_id
+        if first_root is None and token.deprel == 'root':
+            first_root = token_id
+        heads.append(head)
+    if root is None or root != first_root or max(heads) > len(heads):
+        return None
+    return heads, root, forms
+
+
+# Convert the sentences with every (converter, get_nt) pair and return, per sentence, the rejection reason (or
+# None), the phrase structures general_converter returns (or None) and the token line generate_tokens returns
+# (or None), built from the forms sanitized when packing.
+def convert_batch(sentences, functions):
+    results = [None] * len(sentences)
+    get_nts = list(dict.fromkeys(get_nt for _, get_nt in functions))
+    batch, fallback = SentenceBatch.pack(sentences, get_nts)
+
+    if len(batch):
+        cyclic = batch.cyclic()
+        if cyclic:
+            fallback.extend(batch.selected[i] for i in cyclic)
+            batch = batch.subset(sorted(set(range(len(batch))) - set(cyclic)))
+        accepted = []
+        for i, rejection in enumerate(batch.rejections()):
+            if rejection is None:
+                accepted.append(i)
+            else:
+                results[batch.selected[i]] = (rejection, None, None)
+        if len(accepted) < len(batch):
+            batch = batch.subset(accepted)
+
+    if len(batch):
+        spans = batch.spans()
+        phrase_structures = [[None] * len(functions) for _ in range(len(batch))]
+        for method in dict.fromkeys(METHOD_NAMES[converter] for converter, _ in functions):
+            pieces = batch.pieces(method, spans)
+            for function_index, (converter, get_nt) in enumerate(functions):
+                if METHOD_NAMES[converter] == method:
+                    for i, string in enumerate(batch.bracketing(pieces, get_nts.index(get_nt))):
+                        phrase_structures[i][function_index] = string
+        offsets = batch.offsets.tolist()
+        for i, sentence_structures in enumerate(phrase_structures):
+            tokens = ' '.join(batch.forms[offsets[i]:offsets[i + 1]]).rstrip()
+            results[batch.selected[i]] = (None, sentence_structures, tokens)
+
+    for i in fallback:
+        index = DependencyIndex(sentences[i])
+        rejection = validate_sentence(index)
+        if rejection is not None:
+            results[i] = (rejection, None, None)
+        else:
+            results[i] = (None, [converter(sentences[i], index.root, get_nt, index).rstrip()
+                                 for converter, get_nt in functions], generate_tokens(sentences[i], index))
+    return results
@@ -0,0 +1,56 @@
+"""
+Checkpoints of a running file conversion, so that a long convert_conllu_files run that fails (or is preempted)
+can be resumed with --resume instead of starting over from the first sentence.
+
+A checkpoint is a JSON file per source file recording the block number of the next sentence to read, the size
+of every output .tmp file and the running counters and log messages. It is only written after every output has
+been flushed and synced up to that point (BatchedWriter.checkpoint), and it is replaced atomically, so it always
+describes a consistent state of the outputs. On resume, the outputs are truncated to the recorded sizes and
+reading starts again at the recorded block.
+
+When a file is done, its checkpoint is replaced by a 'done' state with the log of the file, and all the
+checkpoints are removed at the end of the run. --resume skips the files that are done (their outputs are
+complete) instead of converting them again.
+
+The options that change the output (and the size and mtime of the source file) are recorded as well, and a
+checkpoint written with other options is not resumed.
+"""
+
+import json
+import os
+
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+
+
+def checkpoint_path(checkpoint_dir, source_path):
+    return os.path.join(checkpoint_dir, f'{os.path.basename(source_path)}{CHECKPOINT_SUFFIX}')
+
+
+class Checkpoint:
+    def __init__(self, path, options):
+        self.path = path
+        # round-trip through json, so that tuples and lists in the options compare equal after loading
+        self.options = json.loads(json.dumps(options))
+
+    # The saved state, or None if there is no checkpoint of a run with the same options.
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['options'] != self.options:
+            return None
+        return checkpoint['state']
+
+    def save(self, state):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'options': self.options, 'state': state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
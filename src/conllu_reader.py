@@ -0,0 +1,120 @@
+"""
+Streaming CoNLL-U reader.
+Sentences are read and parsed one at a time, so that a conversion that stops early (e.g. after the dev/test
+sentences or the train token cutoff) never reads the rest of the file, and memory does not grow with the corpus.
+
+By default only the columns needed for conversion (id, form, upos, head, deprel) are parsed into LightToken
+objects. Pass full=True to get pyconll Sentence objects instead, e.g. to write the dependency trees back out.
+
+Sentences whose sent_id is in exclude_ids (e.g. the G18 evaluation set) are dropped while reading: the rest of the
+block is skipped as soon as its sent_id comment is seen, so its token lines are never collected or parsed.
+A range of sentences can be read with first/last, and a SentenceIndex (see sentence_index.py) lets the reader seek
+to the first sentence of the range instead of scanning the file up to it.
+"""
+
+EMPTY = '_'
+
+
+# Minimal stand-in for pyconll.unit.token.Token with the same None/'_' conventions for the parsed columns.
+class LightToken:
+    __slots__ = ('id', 'form', 'upos', 'head', 'deprel')
+
+    def __init__(self, line):
+        fields = line.split('\t')
+        if len(fields) != 10:
+            raise ValueError(
+                f'The number of columns per token line must be 10. Invalid token: {line}')
+        self.id = fields[0]
+        # like pyconll, a '_' form is only read as empty if the lemma is not '_' as well
+        if fields[1] == EMPTY and fields[2] == EMPTY:
+            self.form = EMPTY
+        else:
+            self.form = None if fields[1] == EMPTY else fields[1]
+        self.upos = None if fields[3] == EMPTY else fields[3]
+        self.head = None if fields[6] == EMPTY else fields[6]
+        self.deprel = None if fields[7] == EMPTY else fields[7]
+
+    def is_multiword(self):
+        return '-' in self.id
+
+    def is_empty_node(self):
+        return '.' in self.id
+
+
+class LightSentence(list):
+    __slots__ = ('id', )
+
+    def __init__(self, sentence_lines):
+        super().__init__()
+        self.id = None
+        for line in sentence_lines:
+            if line[0] == '#':
+                sent_id = comment_sent_id(line)
+                if sent_id is not None:
+                    self.id = sent_id
+            else:
+                self.append(LightToken(line))
+
+
+# The value of a "# sent_id = ..." comment line, or None for other lines.
+def comment_sent_id(line):
+    key, sep, value = line[1:].partition('=')
+    if sep and key.strip() == 'sent_id':
+        return value.strip()
+    return None
+
+
+def load_sent_ids(sent_id_file):
+    with open(sent_id_file, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+# Yield the lines of each sentence block. Lines are stripped and blocks are separated by blank lines,
+# in the same way as pyconll.load_from_file.
+# Only the blocks first <= i < last of the file are yielded. With a SentenceIndex of the file, reading starts
+# directly at block `first`; otherwise the blocks before it are scanned and dropped.
+# With numbered=True, (block number in the file, lines) pairs are yielded.
+def read_conllu_blocks(source_path, exclude_ids=None, first=0, last=None, index=None, numbered=False):
+    if index is not None:
+        f = index.open_at(first)
+        block_num = first
+    else:
+        f = open(source_path, 'r', encoding='utf-8')
+        block_num = 0
+    with f:
+        sentence_lines = []
+        in_block = dropped = False
+        for line in f:
+            line = line.strip()
+            if line:
+                if not in_block:
+                    if last is not None and block_num >= last:
+                        return
+                    in_block = True
+                    dropped = block_num < first
+                if dropped:
+                    continue
+                if exclude_ids and line[0] == '#' and comment_sent_id(line) in exclude_ids:
+                    sentence_lines = []
+                    dropped = True
+                else:
+                    sentence_lines.append(line)
+            elif in_block:
+                in_block = False
+                block_num += 1
+                if sentence_lines:
+                    yield (block_num - 1, sentence_lines) if numbered else sentence_lines
+                    sentence_lines = []
+        if sentence_lines:
+            yield (block_num, sentence_lines) if numbered else sentence_lines
+
+
+def iter_sentences(source_path, full=False, exclude_ids=None, first=0, last=None, index=None, numbered=False):
+    blocks = read_conllu_blocks(source_path, exclude_ids, first, last, index, numbered=True)
+    if full:
+        from pyconll.unit.sentence import Sentence
+        make_sentence = lambda sentence_lines: Sentence('\n'.join(sentence_lines))
+    else:
+        make_sentence = LightSentence
+    for block_num, sentence_lines in blocks:
+        yield (block_num, make_sentence(sentence_lines)) if numbered else make_sentence(sentence_lines)
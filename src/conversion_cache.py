@@ -0,0 +1,98 @@
+"""
+Content-addressed cache of converted files, so that reruns over mostly unchanged treebanks skip the files
+that were already converted.
+
+An entry is keyed by the hash of the conllu file, the output kind (a method_str such as 'flat-X', or
+'original_deptree'), CONVERTER_VERSION and the options that change the output. It holds a copy of the output
+file(s) and a manifest.json with the error counters and the log messages of the conversion, so that convert.log
+can be reproduced on a cache hit. Entries are restored by hard link (or copy across file systems), and the least
+recently used entries are evicted once the cache grows over its size bound.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def hash_file(source_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(file_hash, output_kind, version, options):
+    key_material = json.dumps([file_hash, output_kind, version, options],
+                              sort_keys=True)
+    return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+
+def link_or_copy(source_path, target_path):
+    if os.path.exists(target_path):
+        os.unlink(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+class ConversionCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, key):
+        return self.cache_dir / key[:2] / key
+
+    # Return the manifest of the entry (and mark it as recently used), or None on a miss.
+    def lookup(self, key):
+        manifest_path = self.entry_dir(key) / MANIFEST_NAME
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(manifest_path)
+        return manifest
+
+    # Hard-link (or copy) the cached file `name` of the entry to target_path.
+    def restore(self, key, name, target_path):
+        link_or_copy(self.entry_dir(key) / name, target_path)
+
+    # files maps the names to store in the entry to the paths of the outputs to copy there.
+    # The entry is assembled in a temporary directory and renamed into place, so readers never see half of it.
+    def store(self, key, files, manifest):
+        entry_dir = self.entry_dir(key)
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=entry_dir.parent, prefix=f'.{key}.'))
+        for name, source_path in files.items():
+            shutil.copyfile(source_path, tmp_dir / name)
+        with open(tmp_dir / MANIFEST_NAME, 'w') as f:
+            json.dump(dict(manifest, stored_at=time.time()), f)
+        if entry_dir.exists():
+            shutil.rmtree(entry_dir)
+        os.rename(tmp_dir, entry_dir)
+        self.evict()
+
+    # Remove the least recently used entries until the cache fits in max_bytes.
+    def evict(self):
+        entries = []
+        total_bytes = 0
+        for manifest_path in self.cache_dir.glob(f'*/*/{MANIFEST_NAME}'):
+            entry_dir = manifest_path.parent
+            entry_bytes = sum(path.stat().st_size for path in entry_dir.iterdir())
+            entries.append((manifest_path.stat().st_mtime, entry_bytes, entry_dir))
+            total_bytes += entry_bytes
+        for _, entry_bytes, entry_dir in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir)
+            total_bytes -= entry_bytes
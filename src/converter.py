@@ -1,9 +1,12 @@
 import os
 from pathlib import Path
-import pyconll
-from pyconll.util import find_nonprojective_deps
-from nltk.tree import *
 import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+# Bump when the converted output changes, so that cached conversions (see conversion_cache.py) are not reused.
+CONVERTER_VERSION = '1'
+
 
 class NonProjError(Exception):
     pass
@@ -24,23 +27,137 @@ class ContainNoneError(Exception):
 class NotContainRootError(Exception):
     pass
 
+
+# Rejection reasons returned by validate_sentence and the errors general_converter raises for them.
+# Sentences with empty nodes raise KeyError, as pyconll.util.find_nonprojective_deps used to.
+REJECTION_ERRORS = {
+    'inclempty': KeyError,
+    'nonproj': NonProjError,
+    'notcontainroot': NotContainRootError,
+    'root_nonproj': RootNonProjError,
+    'contain_none': ContainNoneError,
+    'cfcontained': CFContainedError,
+}
+
+
+class DependencyIndex:
+    # One-pass index of a sentence so that the converters do not need to rescan it for every node.
+    # Multiword tokens and empty nodes are not part of the dependency tree and are skipped.
+    # Children are kept in id order and already split into those left and right of their head.
+    def __init__(self, sentence):
+        self.sentence = sentence
+        self.tokens = {}
+        self.heads = {}
+        self.left_children = defaultdict(list)
+        self.right_children = defaultdict(list)
+        self.root = None
+        # set when the sentence has an empty node or a token without head
+        self.missing_head = False
+        self._sanitized_forms = None
+        for token in sentence:
+            if token.is_multiword():
+                continue
+            if token.is_empty_node() or token.head is None:
+                self.missing_head = True
+                if token.is_empty_node():
+                    continue
+            token_id = int(token.id)
+            self.tokens[token_id] = token
+            if self.root is None and token.deprel == 'root':
+                self.root = token
+            if token.head is None:
+                continue
+            head_id = int(token.head)
+            self.heads[token_id] = head_id
+            if token_id < head_id:
+                self.left_children[head_id].append(token_id)
+            else:
+                self.right_children[head_id].append(token_id)
+
+    def children(self, token_id):
+        return self.left_children[token_id] + [token_id] + self.right_children[token_id]
+
+    # The sanitized forms of the tokens by id, computed once and shared by every converter and generate_tokens.
+    def sanitized_forms(self):
+        if self._sanitized_forms is None:
+            self._sanitized_forms = {token_id: sanitize_form(token.form) for token_id, token in self.tokens.items()}
+        return self._sanitized_forms
+
+
+# Check everything that makes general_converter reject a sentence in one pass over the dependency arcs
+# (and one over the forms of structurally valid sentences), and return the reason (a key of REJECTION_ERRORS) or None. When a sentence has several problems,
+# the reason is the one the checks used to report first: empty node, non-projective arcs, no root,
+# crossing above root, and then the first None form or form with a Cf character in conversion order.
+# Non-projectivity is checked among the non-root arcs only (like pyconll), which are non-crossing iff the
+# intervals they span are nested or disjoint: scanning arcs by left end (longest first), an arc must end
+# before the innermost still-open arc it starts in.
+def validate_sentence(index):
+    tokens, heads, rights = index.tokens, index.heads, index.right_children
+    if index.missing_head or any(head_id != 0 and head_id not in tokens
+                                 for head_id in set(heads.values())):
+        return 'inclempty'
+    root_id = int(index.root.id) if index.root is not None else 0
+    root_crossing = False
+    open_ends = []
+    for token_id, head_id in heads.items():
+        if root_id and ((token_id < root_id < head_id) or
+                        (token_id > root_id > head_id)):
+            root_crossing = True
+
+        while open_ends and open_ends[-1] <= token_id:
+            open_ends.pop()
+        arc_ends = rights[token_id]
+        if token_id < head_id:
+            arc_ends = sorted(arc_ends + [head_id]) if arc_ends else [head_id]
+        for arc_end in reversed(arc_ends):
+            if open_ends and arc_end > open_ends[-1]:
+                return 'nonproj'
+            open_ends.append(arc_end)
+    if not root_id:
+        return 'notcontainroot'
+    if root_crossing:
+        return 'root_nonproj'
+
+    form_rejections = []
+    for token_id, token in tokens.items():
+        if token.form is None:
+            form_rejections.append((token_id, 'contain_none'))
+        elif Cf_included(token.form):
+            form_rejections.append((token_id, 'cfcontained'))
+    if not form_rejections:
+        return None
+    # the tree is converted first and only then the tokens of the whole sentence (including tokens that are not
+    # reachable from the root, e.g. under a second root), so forms in the tree are reported first
+    reachable = set()
+    stack = [root_id]
+    while stack:
+        token_id = stack.pop()
+        if token_id not in reachable:
+            reachable.add(token_id)
+            stack.extend(index.left_children[token_id])
+            stack.extend(index.right_children[token_id])
+    for token_id, rejection in form_rejections:
+        if token_id in reachable:
+            return rejection
+    return form_rejections[0][1]
+
+
 # Since pyconll package sometimes fail to censor non-projective dependency tree that contains crossing above root edge,
 # function for handling this exception is defined here
-def rootcross_included(sentence):
-    if extract_head(sentence) is None:
+def rootcross_included(sentence, index=None):
+    if index is None:
+        index = DependencyIndex(sentence)
+    if index.root is None:
         raise NotContainRootError
-    root_id = int(extract_head(sentence).id)
+    root_id = int(index.root.id)
 
     def is_crossing_root(token_id, head_id):
         return (token_id < root_id
                 and root_id < head_id) or (token_id > root_id
                                            and root_id > head_id)
 
-    for token in sentence:
-        if token.is_multiword():
-            continue
-        head_id = token.head
-        if is_crossing_root(int(token.id), int(head_id)):
+    for token_id, token in index.tokens.items():
+        if is_crossing_root(token_id, int(token.head)):
             return True
 
     return False
@@ -49,6 +166,9 @@ def rootcross_included(sentence):
 def Cf_included(s):
     if s is None:
         raise ContainNoneError
+    # there is no format character in ASCII
+    if s.isascii():
+        return False
     for c in s:
         if unicodedata.category(c) == "Cf":
             return True
@@ -56,12 +176,8 @@ def Cf_included(s):
 
 
 def sentence_to_str(sentence):
-    s = ""
-    for token in sentence:
-        if token.form is not None:
-            s += token.form
-            s += " "
-    return s.rstrip()
+    return ' '.join(token.form for token in sentence
+                    if token.form is not None).rstrip()
 
 
 def get_token_with_id(sentence, token_id):
@@ -98,6 +214,11 @@ def extract_right_children(sentence, parent_token):
 # 2. Convert all the parens into -LRB- or -RRB- to resolve ambiguity of phrase structure.
 # 3. Remove space in form because preprocess.py expect each forms do not contain any space.
 # - Space is contained at least in French_GSD, but they are numeric, therefore possibly not problematic.
+# Forms follow a Zipfian distribution, so the sanitized forms are kept in a bounded LRU cache.
+SANITIZE_CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=SANITIZE_CACHE_SIZE)
 def sanitize_form(form):
     if Cf_included(form):
         raise CFContainedError
@@ -110,123 +231,215 @@ def create_leaf(nt, form):
     return f'({nt} {sanitize_form(form)}) '
 
 
+# nltk is an optional dependency, only imported when the caller asks for nltk.tree.Tree objects.
 def create_leaf_with_Tree(nt, form):
+    from nltk.tree import Tree
     return Tree(nt, [sanitize_form(form)])
 
 
+def to_tree(phrase_structure):
+    from nltk.tree import Tree
+    return Tree.fromstring(phrase_structure)
+
+
+# The universal POS tags and dependency relations of UD v2, for which the labels are computed up front.
+UPOS_TAGS = ['ADJ', 'ADP', 'ADV', 'AUX', 'CCONJ', 'DET', 'INTJ', 'NOUN', 'NUM', 'PART', 'PRON', 'PROPN', 'PUNCT',
+             'SCONJ', 'SYM', 'VERB', 'X']
+DEPRELS = ['acl', 'advcl', 'advmod', 'amod', 'appos', 'aux', 'case', 'cc', 'ccomp', 'clf', 'compound', 'conj',
+           'cop', 'csubj', 'dep', 'det', 'discourse', 'dislocated', 'expl', 'fixed', 'flat', 'goeswith', 'iobj',
+           'list', 'mark', 'nmod', 'nsubj', 'nummod', 'obj', 'obl', 'orphan', 'parataxis', 'punct', 'reparandum',
+           'root', 'vocative', 'xcomp']
+
+
+# Label of every tag seen so far. Tags outside the precomputed set (language-specific subtypes, None, ...)
+# are labeled on first use and kept, which stays small since tags come from small sets.
+class LabelTable(dict):
+    def __init__(self, make_label, tags):
+        super().__init__((tag, make_label(tag)) for tag in tags)
+        self.make_label = make_label
+
+    def __missing__(self, tag):
+        label = self[tag] = self.make_label(tag)
+        return label
+
+
+def pos_label(upos):
+    return f'{upos}P'
+
+
+def merge_pos_label(upos):
+    return pos_label(upos).replace('PRONP', 'NOUNP').replace(
+        'PROPNP', 'NOUNP').replace('DETP', 'NOUNP')
+
+
+def dep_label(deprel):
+    return f'{deprel}'
+
+
+POS_LABELS = LabelTable(pos_label, UPOS_TAGS)
+MERGED_POS_LABELS = LabelTable(merge_pos_label, UPOS_TAGS)
+DEP_LABELS = LabelTable(dep_label, DEPRELS)
+
+
 def get_X_nt(token):
     return 'X'
 
 
 def get_pos_nt(token):
-    return f'{token.upos}P'
+    return POS_LABELS[token.upos]
 
 
 def get_merge_pos_nt(token):
-    return get_pos_nt(token).replace('PRONP', 'NOUNP').replace(
-        'PROPNP', 'NOUNP').replace('DETP', 'NOUNP')
+    return MERGED_POS_LABELS[token.upos]
 
 
 def get_dep_nt(token):
-    return f'{token.deprel}'
+    return DEP_LABELS[token.deprel]
+
+
+# The converters below walk the dependency index with an explicit stack instead of recursing per dependent,
+# so that deep (e.g. chain-shaped) trees do not hit the recursion limit.
+# Stack items are either a literal string to emit, a positive token id whose phrase should be expanded,
+# or a negative token id whose leaf should be emitted. Leaves are emitted in sentence order, with the forms the
+# index sanitized once for the whole sentence.
+def emit_bracketing(index, token_id, get_nt, expand):
+    tokens, lefts, rights = index.tokens, index.left_children, index.right_children
+    forms = index.sanitized_forms()
+    output = []
+    stack = [token_id]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            output.append(item)
+        elif item < 0 or (not lefts[item] and not rights[item]):
+            token_id = abs(item)
+            output.append(f'({get_nt(tokens[token_id])} {forms[token_id]})')
+        else:
+            stack.extend(
+                reversed(
+                    expand(item, f'({get_nt(tokens[item])} ', lefts[item],
+                           rights[item])))
+    return ''.join(output)
+
+
+# (NT l1 ... head ... rn): all dependents become children at the same time.
+def expand_flat(token_id, open_nt, left_children, right_children):
+    items = [open_nt]
+    for child_id in left_children:
+        items += [child_id, ' ']
+    items.append(-token_id)
+    for child_id in right_children:
+        items += [' ', child_id]
+    items.append(')')
+    return items
+
+
+# The flat bracketing, walked with one iterator per open phrase instead of one stack item per dependent, so that
+# the dependents of a wide phrase (mostly leaves) are emitted in a single loop. Same output as
+# emit_bracketing(index, token_id, get_nt, expand_flat).
+def emit_flat(index, token_id, get_nt):
+    tokens, lefts, rights = index.tokens, index.left_children, index.right_children
+    forms = index.sanitized_forms()
+    output = []
+    # the (left dependents, -head, right dependents) of every open phrase
+    stack = [iter((token_id, ))]
+    while stack:
+        for child in stack[-1]:
+            # children are separated by a space, except right after the open_nt
+            if output and output[-1][-1] != ' ':
+                output.append(' ')
+            if child < 0 or (not lefts[child] and not rights[child]):
+                child = abs(child)
+                output.append(f'({get_nt(tokens[child])} {forms[child]})')
+            else:
+                output.append(f'({get_nt(tokens[child])} ')
+                stack.append(iter(lefts[child] + [-child] + rights[child]))
+                break
+        else:
+            stack.pop()
+            if stack:
+                output.append(')')
+    return ''.join(output)
 
 
-def flat_converter(sentence, token, get_nt):
-    children = extract_children(sentence, token)
-    if len(children) == 1:
-        return create_leaf(get_nt(token), token.form)
-    constituency = f'({get_nt(token)} '
-    for child_id in children:
-        if child_id == int(token.id):
-            sub_constituency = create_leaf(get_nt(token), token.form)
-        else:
-            sub_constituency = flat_converter(
-                sentence, get_token_with_id(sentence, child_id), get_nt)
-        constituency += sub_constituency
-    return constituency.rstrip() + ') '
+# (NT l1 (NT l2 ... (NT (NT head r1) ... rn))): left dependents are merged first (outermost).
+def expand_left(token_id, open_nt, left_children, right_children):
+    items = []
+    for child_id in left_children:
+        items += [open_nt, child_id, ' ']
+    items += [open_nt] * len(right_children)
+    items.append(-token_id)
+    for child_id in right_children:
+        items += [' ', child_id, ')']
+    items.append(')' * len(left_children))
+    return items
 
 
-def make_phrase_from_left(sentence, token, left_children_ids,
-                          right_children_ids, get_nt):
-    if left_children_ids == []:
-        if right_children_ids == []:
-            return create_leaf_with_Tree(get_nt(token), token.form)
-        else:
-            r_token = get_token_with_id(sentence, right_children_ids.pop(-1))
-            return Tree(get_nt(token), [
-                make_phrase_from_left(sentence, token, left_children_ids,
-                                      right_children_ids, get_nt),
-                make_phrase_from_left(
-                    sentence, r_token, extract_left_children(
-                        sentence, r_token),
-                    extract_right_children(sentence, r_token), get_nt)
-            ])
-
-    l_token = get_token_with_id(sentence, left_children_ids.pop(0))
-    return Tree(get_nt(token), [
-        make_phrase_from_left(
-            sentence, l_token, extract_left_children(sentence, l_token),
-            extract_right_children(sentence, l_token), get_nt),
-        make_phrase_from_left(sentence, token, left_children_ids,
-                              right_children_ids, get_nt)
-    ])
-
-
-def make_phrase_from_right(sentence, token, left_children_ids,
-                           right_children_ids, get_nt):
-    if right_children_ids == []:
-        if left_children_ids == []:
-            return create_leaf_with_Tree(get_nt(token), token.form)
-        else:
-            l_token = get_token_with_id(sentence, left_children_ids.pop(0))
-            return Tree(get_nt(token), [
-                make_phrase_from_right(
-                    sentence, l_token, extract_left_children(
-                        sentence, l_token),
-                    extract_right_children(sentence, l_token), get_nt),
-                make_phrase_from_right(sentence, token, left_children_ids,
-                                       right_children_ids, get_nt),
-            ])
-    r_token = get_token_with_id(sentence, right_children_ids.pop(-1))
-    return Tree(get_nt(token), [
-        make_phrase_from_right(sentence, token, left_children_ids,
-                               right_children_ids, get_nt),
-        make_phrase_from_right(
-            sentence, r_token, extract_left_children(sentence, r_token),
-            extract_right_children(sentence, r_token), get_nt)
-    ])
-
-
-def left_converter(sentence, head_token, get_nt):
-    return make_phrase_from_left(sentence, head_token,
-                                 extract_left_children(sentence, head_token),
-                                 extract_right_children(sentence, head_token),
-                                 get_nt).pformat(margin=1e100)
-
-
-def right_converter(sentence, head_token, get_nt):
-    return make_phrase_from_right(sentence, head_token,
-                                  extract_left_children(sentence, head_token),
-                                  extract_right_children(sentence, head_token),
-                                  get_nt).pformat(margin=1e100)
+# (NT (NT (NT l1 ... (NT lm head)) r1) ... rn): right dependents are merged first (outermost).
+def expand_right(token_id, open_nt, left_children, right_children):
+    items = [open_nt] * len(right_children)
+    for child_id in left_children:
+        items += [open_nt, child_id, ' ']
+    items.append(-token_id)
+    items.append(')' * len(left_children))
+    for child_id in right_children:
+        items += [' ', child_id, ')']
+    return items
 
 
-def general_converter(converter, sentence, get_nt):
-    if len(find_nonprojective_deps(sentence)) != 0:
-        raise NonProjError
-    if rootcross_included(sentence):
-        raise RootNonProjError
-    head_token = extract_head(sentence)
-    return converter(sentence, head_token, get_nt).rstrip()
+def flat_converter(sentence, token, get_nt, index=None):
+    if index is None:
+        index = DependencyIndex(sentence)
+    return emit_flat(index, int(token.id), get_nt) + ' '
 
 
-def generate_tokens(sentence):
-    plain_sentence = ""
-    for token in sentence:
-        if token.is_multiword():
-            continue
-        plain_sentence += sanitize_form(token.form) + ' '
-    return plain_sentence.rstrip()
+def left_converter(sentence, head_token, get_nt, index=None):
+    if index is None:
+        index = DependencyIndex(sentence)
+    return emit_bracketing(index, int(head_token.id), get_nt, expand_left)
+
+
+def right_converter(sentence, head_token, get_nt, index=None):
+    if index is None:
+        index = DependencyIndex(sentence)
+    return emit_bracketing(index, int(head_token.id), get_nt, expand_right)
+
+
+def general_converter(converter, sentence, get_nt):
+    index = DependencyIndex(sentence)
+    rejection = validate_sentence(index)
+    if rejection is not None:
+        raise REJECTION_ERRORS[rejection]
+    return converter(sentence, index.root, get_nt, index).rstrip()
+
+
+# The phrase structure of a sentence that passed validate_sentence, as written to the outputs: the bracketing
+# general_converter returns, with one more phrase above the leaf of a single-token sentence.
+def convert_validated(converter, sentence, get_nt, index):
+    phrase_structure = converter(sentence, index.root, get_nt, index).rstrip()
+    if len(sentence) == 1:
+        phrase_structure = f'({get_nt(sentence[0])} {phrase_structure})'
+    return phrase_structure
+
+
+# Opt-in vectorized engine (needs numpy, see batch_converter.py): convert a batch of sentences and return, per
+# sentence, the rejection reason and None, or None and what general_converter returns.
+def batch_general_converter(converter, sentences, get_nt):
+    if __package__:
+        from .batch_converter import convert_batch
+    else:
+        from batch_converter import convert_batch
+    return [(rejection, phrase_structures and phrase_structures[0])
+            for rejection, phrase_structures, _ in convert_batch(sentences, [(converter, get_nt)])]
+
+
+# With the DependencyIndex of the sentence, the forms already sanitized for the tree are reused. Its tokens
+# are all the tokens besides multiword tokens unless the sentence has an empty node.
+def generate_tokens(sentence, index=None):
+    if index is not None and not index.missing_head:
+        return ' '.join(index.sanitized_forms().values()).rstrip()
+    return ' '.join(sanitize_form(token.form) for token in sentence
+                    if not token.is_multiword()).rstrip()
 
 
 def setup_functions(args):
@@ -249,8 +462,7 @@ def setup_functions(args):
     return converter, get_nt
 
 
-def get_method_str(args):
-    convert_method_str = args.convert_method
+def get_label_method_str(args):
     if args.without_label:
         label_method_str = 'X'
     elif args.use_pos_label:
@@ -259,7 +471,36 @@ def get_method_str(args):
         label_method_str = 'M_POS'
     elif args.use_dep_label:
         label_method_str = 'DEP'
-    return f'{convert_method_str}-{label_method_str}'
+    return label_method_str
+
+
+def get_method_str(args):
+    return f'{args.convert_method}-{get_label_method_str(args)}'
+
+
+CONVERTERS = {
+    'flat': flat_converter,
+    'left': left_converter,
+    'right': right_converter,
+}
+
+LABEL_FUNCTIONS = {
+    'X': get_X_nt,
+    'POS': get_pos_nt,
+    'M_POS': get_merge_pos_nt,
+    'DEP': get_dep_nt,
+}
+
+
+# All the requested combinations of conversion method and labeling policy, as (method_str, converter, get_nt).
+# Without --convert_methods / --label_methods, this is the single method given by --convert_method and the label flag.
+def setup_method_grid(args):
+    convert_methods = args.convert_methods or [args.convert_method]
+    label_methods = args.label_methods or [get_label_method_str(args)]
+    return [(f'{convert_method}-{label_method}', CONVERTERS[convert_method],
+             LABEL_FUNCTIONS[label_method])
+            for convert_method in convert_methods
+            for label_method in label_methods]
 
 
 def find_conllu_files(source_path):
@@ -1,8 +1,31 @@
-import argparse
+# Modules that are only needed for some options (argparse, multiprocessing, the conversion cache, hashlib,
+# numpy) are imported where they are used, so that short jobs and library users start fast.
 import os
-import tempfile
-from converter import *
-import pyconll
+import random
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, closing
+from pathlib import Path
+try:
+    from .action_format import ACTIONS_SUFFIX, VOCAB_SUFFIX, ActionWriter, convert_actions
+    from .converter import (CONVERTER_VERSION, CONVERTERS, LABEL_FUNCTIONS, REJECTION_ERRORS, DependencyIndex,
+                            convert_validated, find_conllu_files, generate_tokens, sentence_to_str,
+                            setup_method_grid, validate_sentence)
+    from .checkpoint import Checkpoint, checkpoint_path
+    from .conllu_reader import iter_sentences, load_sent_ids
+    from .metrics import FileMetrics, ProgressLine, RunMetrics
+    from .output_writer import BatchedWriter, COMPRESSION_SUFFIXES, compressed_path
+    from .sentence_index import SentenceIndex, parse_sentence_range, source_signature
+except ImportError:
+    from action_format import ACTIONS_SUFFIX, VOCAB_SUFFIX, ActionWriter, convert_actions
+    from converter import (CONVERTER_VERSION, CONVERTERS, LABEL_FUNCTIONS, REJECTION_ERRORS, DependencyIndex,
+                           convert_validated, find_conllu_files, generate_tokens, sentence_to_str,
+                           setup_method_grid, validate_sentence)
+    from checkpoint import Checkpoint, checkpoint_path
+    from conllu_reader import iter_sentences, load_sent_ids
+    from metrics import FileMetrics, ProgressLine, RunMetrics
+    from output_writer import BatchedWriter, COMPRESSION_SUFFIXES, compressed_path
+    from sentence_index import SentenceIndex, parse_sentence_range, source_signature
 
 from logging import getLogger, FileHandler, Formatter, DEBUG
 fmt = "%(asctime)s %(levelname)s %(name)s :%(message)s"
@@ -11,145 +34,621 @@ logger = getLogger(__name__)
 logger.setLevel(DEBUG)
 logger.propagate = False
 
-parser = argparse.ArgumentParser()
 
-# directory parameters
-parser.add_argument('--source_path',
-                    default='../../../resource/ud-treebanks-v2.7/English_EWT')
-parser.add_argument('--G18_conllid_file',
-                    default='')
-parser.add_argument('--output_path',
-                    default='../../../resource/ud-converted')
+def build_parser(prog=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog)
 
-# method specification parameters
-parser.add_argument('--convert_method', default='flat')
-parser.add_argument('--without_label', action='store_true')
-parser.add_argument('--use_pos_label', action='store_true')
-parser.add_argument('--use_merged_pos_label', action='store_true')
-parser.add_argument('--use_dep_label', action='store_true')
+    # directory parameters
+    parser.add_argument('--source_path',
+                        default='../../../resource/ud-treebanks-v2.7/English_EWT')
+    # sentences whose sent_id is listed in this file (the G18 evaluation set) are left out of the outputs
+    parser.add_argument('--G18_conllid_file',
+                        default='')
+    parser.add_argument('--output_path',
+                        default='../../../resource/ud-converted')
 
-# other parameter(s)
-parser.add_argument('--dev_test_sentence_num', default=5000, type=int)
-parser.add_argument('--train_token_num', default=40000000, type=int)
-parser.add_argument('--write_deptree', action='store_true')
+    # method specification parameters
+    parser.add_argument('--convert_method', default='flat')
+    parser.add_argument('--without_label', action='store_true')
+    parser.add_argument('--use_pos_label', action='store_true')
+    parser.add_argument('--use_merged_pos_label', action='store_true')
+    parser.add_argument('--use_dep_label', action='store_true')
+    # convert into several method/label combinations at once, e.g. --convert_methods flat left right --label_methods X POS
+    parser.add_argument('--convert_methods', nargs='+', choices=list(CONVERTERS))
+    parser.add_argument('--label_methods', nargs='+', choices=list(LABEL_FUNCTIONS))
 
+    # other parameter(s)
+    parser.add_argument('--dev_test_sentence_num', default=5000, type=int)
+    parser.add_argument('--train_token_num', default=40000000, type=int)
+    parser.add_argument('--write_deptree', action='store_true')
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--chunk_size', default=1000, type=int)
+    # 'numpy' converts every chunk of sentences with the vectorized engine of batch_converter.py (needs numpy)
+    parser.add_argument('--engine', default='python', choices=['python', 'numpy'])
+    # outputs are written in batches of about this many characters
+    parser.add_argument('--write_buffer_size', default=1 << 20, type=int)
+    parser.add_argument('--compression', default='none', choices=list(COMPRESSION_SUFFIXES))
+    # also write every tree as the binary action sequence of action_format.py (<stem>.actions, uncompressed)
+    parser.add_argument('--write_actions', action='store_true')
+
+    # conversion cache: files converted before with the same options are restored instead of converted again
+    parser.add_argument('--cache_dir', default='')
+    parser.add_argument('--cache_max_mb', default=10240, type=int)
+    parser.add_argument('--force', action='store_true')
+
+    # sentence offset index: build (or reuse) a <file>.idx sidecar per source file to seek to --sentence_range
+    # and to report the exact corpus size even when reading stops at the cutoff
+    parser.add_argument('--sentence_index', action='store_true')
+    # convert only the sentences first:last (0-based, last exclusive) of every source file, e.g. 0:100000 or 100000:
+    parser.add_argument('--sentence_range', default='')
+
+    # checkpoints: every --checkpoint_every read sentences, the state of the running file conversion is saved in
+    # --checkpoint_dir (default <output_path>/.checkpoints), and --resume continues an interrupted run from there.
+    # Only uncompressed outputs without --write_actions can be checkpointed.
+    parser.add_argument('--checkpoint_every', default=0, type=int)
+    parser.add_argument('--checkpoint_dir', default='')
+    parser.add_argument('--resume', action='store_true')
+
+    # instrumentation: write per-file stage timings, throughput, rejections and sentence lengths as JSON to
+    # --metrics_file, and show a live progress line with an ETA on stderr with --progress
+    parser.add_argument('--metrics_file', default='')
+    parser.add_argument('--progress', action='store_true')
+
+    # scheduler (scheduler.py): with --jobs above 1, all the files are converted concurrently in that many
+    # processes, largest first, files larger than --split_mb being converted in sentence-range pieces of about that
+    # size; a combined run summary is written to --summary_file (default <output_path>/run_summary.json)
+    parser.add_argument('--jobs', default=1, type=int)
+    parser.add_argument('--split_mb', default=64, type=float)
+    parser.add_argument('--summary_file', default='')
+
+    # sentence selection before validation (sentence_filter.py): --dedup drops the sentences whose token line was
+    # already seen in the run (remembered in a Bloom filter of --dedup_mb MB) and --min_tokens the shorter ones;
+    # --sample_train samples the sentences of train files by length (--length_buckets upper bounds, --bucket_weights
+    # token shares, --seed) instead of taking them from the start of the file until --train_token_num tokens
+    parser.add_argument('--dedup', action='store_true')
+    parser.add_argument('--dedup_mb', default=256, type=float)
+    parser.add_argument('--min_tokens', default=0, type=int)
+    parser.add_argument('--sample_train', action='store_true')
+    parser.add_argument('--length_buckets', nargs='+', default=[], type=int)
+    parser.add_argument('--bucket_weights', nargs='+', type=float)
+    parser.add_argument('--seed', default=0, type=int)
+
+    # profiling (profiling.py): per file, cProfile stats, sampled stacks for flame graphs and the --profile_slowest
+    # slowest sentences are written to --profile_dir (default <output_path>/profile)
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--profile_dir', default='')
+    parser.add_argument('--profile_slowest', default=20, type=int)
+    parser.add_argument('--profile_interval', default=0.005, type=float)
+    return parser
+
+
+# Convert one sentence with every (converter, get_nt) pair and report either the rejection reason or the lines to write,
+# along with the sentence length and the seconds spent in validation, conversion and sanitization (see metrics.py).
+# With write_actions, the (words, leaf labels, actions) of every tree are returned too (see action_format.py).
+# The sentence is validated and indexed once for all the pairs.
+# This is the unit of work shared by the serial loop and the worker processes.
+def convert_sentence(sentence, functions, write_deptree, write_actions=False):
+    start = time.perf_counter()
+    index = DependencyIndex(sentence)
+    rejection = validate_sentence(index)
+    validated = time.perf_counter()
+    if rejection is not None:
+        stats = (len(sentence), validated - start, 0.0, 0.0)
+        if rejection == 'cfcontained':
+            return rejection, f'Cf contained in {sentence_to_str(sentence)}', stats
+        return rejection, None, stats
+    # the forms are sanitized once, ahead of the converters that share them (the Cf check of the forms is part of
+    # the validation)
+    index.sanitized_forms()
+    sanitized = time.perf_counter()
+    phrase_structures = [convert_validated(converter, sentence, get_nt, index) for converter, get_nt in functions]
+    converted = time.perf_counter()
+    tokens = generate_tokens(sentence, index)
+    joined = time.perf_counter()
+    deptree = sentence.conll() if write_deptree else None
+    actions = tree_actions(sentence, functions, index) if write_actions else None
+    stats = (len(sentence), validated - start, converted - sanitized, (sanitized - validated) + (joined - converted))
+    return None, (phrase_structures, tokens, deptree, len(sentence), actions), stats
+
+
+def tree_actions(sentence, functions, index):
+    return [convert_actions(converter, sentence, get_nt, index) for converter, get_nt in functions]
+
+
+# With the numpy engine, the chunk is validated and converted as one batch (which also builds the token lines from
+# the forms it sanitized), whose time is counted as conversion time and shared equally by its sentences. The
+# action sequences are built by the Python walk.
+def convert_chunk(sentences, functions, write_deptree, engine='python', write_actions=False):
+    if engine == 'python':
+        return [
+            convert_sentence(sentence, functions, write_deptree, write_actions)
+            for sentence in sentences
+        ]
+    if __package__:
+        from .batch_converter import convert_batch
+    else:
+        from batch_converter import convert_batch
+    start = time.perf_counter()
+    batch_results = convert_batch(sentences, functions)
+    conversion_time = (time.perf_counter() - start) / max(len(sentences), 1)
+    results = []
+    for sentence, (rejection, phrase_structures, tokens) in zip(sentences, batch_results):
+        if rejection is not None:
+            message = f'Cf contained in {sentence_to_str(sentence)}' if rejection == 'cfcontained' else None
+            results.append((rejection, message, (len(sentence), 0.0, conversion_time, 0.0)))
+            continue
+        if len(sentence) == 1:
+            phrase_structures = [f'({get_nt(sentence[0])} {phrase_structure})'
+                                 for (_, get_nt), phrase_structure in zip(functions, phrase_structures)]
+        deptree = sentence.conll() if write_deptree else None
+        actions = tree_actions(sentence, functions, DependencyIndex(sentence)) if write_actions else None
+        results.append((None, (phrase_structures, tokens, deptree, len(sentence), actions),
+                        (len(sentence), 0.0, conversion_time, 0.0)))
+    return results
+
+
+def iter_chunks(corpus, chunk_size):
+    chunk = []
+    for sentence in corpus:
+        chunk.append(sentence)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Yield convert_sentence results in corpus order.
+# With several workers, sentences are sent to a process pool in ordered chunks. Only a bounded number of chunks
+# is in flight, so the caller can stop consuming (at the dev/test or train cutoff) without converting the rest.
+def iter_conversions(corpus, functions, write_deptree, workers=1,
+                     chunk_size=1000, engine='python', write_actions=False):
+    if workers <= 1 and engine == 'python':
+        for sentence in corpus:
+            yield convert_sentence(sentence, functions, write_deptree, write_actions)
+        return
+    if workers <= 1:
+        for chunk in iter_chunks(corpus, chunk_size):
+            yield from convert_chunk(chunk, functions, write_deptree, engine, write_actions)
+        return
+
+    import multiprocessing
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for chunk in iter_chunks(corpus, chunk_size):
+            pending.append(
+                pool.apply_async(convert_chunk,
+                                 (chunk, functions, write_deptree, engine, write_actions)))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+# With a checkpoint, the state is saved every args.checkpoint_every read sentences, and a resume_state loaded
+# from it continues the conversion where that state was saved.
+# The stage timings and counters of the file are collected in `metrics` (a FileMetrics), if given.
+# With a sentence_filter (see sentence_filter.py), or --sample_train for a train file, only the sentences it
+# selects are validated and converted. The sentence timings are also passed to `profile` (a FileProfile), if given.
+def convert_conllu_file(args, conllu_file, functions, output_dirs, deptree_path, log, exclude_ids=None,
+                        checkpoint=None, resume_state=None, metrics=None, sentence_filter=None, profile=None):
+    first, last = parse_sentence_range(args.sentence_range) if args.sentence_range else (0, None)
+    # the index is closed with the outputs, and also if the conversion fails before they are opened
+    with ExitStack() as stack:
+        index = stack.enter_context(SentenceIndex.open(conllu_file)) if args.sentence_index else None
+
+        if resume_state is not None:
+            next_block = resume_state['next_block']
+            read_sentence_num = resume_state['read_sentences']
+            processed_sentence_num = resume_state['converted_sentences']
+            token_num = resume_state['converted_tokens']
+            counts = Counter(resume_state['counts'])
+            output_sizes = resume_state['output_sizes']
+            messages = list(resume_state['log'])
+            log(f'Resuming {conllu_file.name} from sentence {read_sentence_num}.')
+        else:
+            next_block = first
+            read_sentence_num = 0
+            processed_sentence_num = 0
+            token_num = 0
+            counts = Counter()
+            output_sizes = {}
+            messages = []
+        reached_cutoff = False
+
+        # the messages are kept for the checkpoints, so that the log of a resumed file is complete
+        def log_message(message):
+            log(message)
+            messages.append(message)
+
+        # full pyconll sentences are only needed to write the dependency trees back out
+        corpus = iter_sentences(conllu_file, full=args.write_deptree, exclude_ids=exclude_ids,
+                                first=next_block, last=last, index=index, numbered=True)
+        sampled = args.sample_train and "train" in conllu_file.stem
+        if sampled or sentence_filter is not None:
+            if __package__:
+                from .sentence_filter import sample_blocks, select_blocks
+            else:
+                from sentence_filter import sample_blocks, select_blocks
+        if sampled:
+            # the sample is drawn again from the whole range when resuming, with the same seed
+            block_choice, selection_counts = sample_blocks(
+                iter_sentences(conllu_file, exclude_ids=exclude_ids, first=first, last=last, index=index,
+                               numbered=True),
+                args.train_token_num, sorted(args.length_buckets), args.bucket_weights,
+                random.Random(f'{args.seed}:{conllu_file.name}'), sentence_filter)
+            if resume_state is None:
+                counts.update(selection_counts)
+            corpus = select_blocks(corpus, block_choice)
+        # the (block number, reason) of the sentences the filter dropped ahead of the conversions; they are counted
+        # when the conversions pass them, so that a checkpoint does not count drops after its next_block
+        dropped = deque()
+
+        def count_dropped(before=None):
+            while dropped and (before is None or dropped[0][0] < before):
+                counts[dropped.popleft()[1]] += 1
+
+        # with sampling, only the sampled sentences are filtered here, so that only they are remembered as seen
+        if sentence_filter is not None:
+            corpus = sentence_filter.filter(corpus, lambda block_num, reason: dropped.append((block_num, reason)))
+        # the block numbers of the sentences in flight; conversions come back in corpus order, one per sentence
+        block_nums = deque()
+
+        def iter_corpus():
+            while True:
+                start_time = time.perf_counter()
+                numbered_sentence = next(corpus, None)
+                if metrics is not None:
+                    metrics.add_time('parse', time.perf_counter() - start_time)
+                if numbered_sentence is None:
+                    return
+                block_num, sentence = numbered_sentence
+                block_nums.append(block_num)
+                yield sentence
+
+        conversions = iter_conversions(iter_corpus(), functions, args.write_deptree,
+                                       args.workers, args.chunk_size, args.engine, args.write_actions)
+        writers = []
+
+        def open_writer(path):
+            writer = BatchedWriter(path, args.write_buffer_size, args.compression,
+                                   resume_size=output_sizes.get(str(path)))
+            writers.append((str(path), writer))
+            return stack.enter_context(writer)
+
+        def save_checkpoint(block_num):
+            checkpoint.save({
+                'next_block': block_num,
+                'read_sentences': read_sentence_num,
+                'converted_sentences': processed_sentence_num,
+                'converted_tokens': token_num,
+                'counts': counts,
+                'output_sizes': {path: writer.checkpoint() for path, writer in writers},
+                'log': messages,
+            })
+
+        tree_files = [open_writer(os.path.join(output_dir, f'{conllu_file.stem}.txt')) for output_dir in output_dirs]
+        token_files = [open_writer(os.path.join(output_dir, f'{conllu_file.stem}.tokens')) for output_dir in output_dirs]
+        h = open_writer(deptree_path) if args.write_deptree else None
+        action_files = [stack.enter_context(ActionWriter(os.path.join(output_dir, conllu_file.stem)))
+                        for output_dir in output_dirs] if args.write_actions else []
+        stack.enter_context(closing(conversions))
+        if index is not None:
+            corpus_size = count_range_sentences(index, first, last, exclude_ids)
+        progress = stack.enter_context(closing(ProgressLine(conllu_file.name))) if args.progress else None
+        start = read_sentence_num
+        for i, (rejection, result, stats) in enumerate(conversions, start):
+            block_num = block_nums.popleft()
+            count_dropped(block_num)
+            if metrics is not None:
+                metrics.add_sentence(stats[0], rejection, stats[1:])
+            if profile is not None:
+                profile.add_sentence(block_num, stats)
+            if progress is not None and progress.due():
+                progress.update(i, token_num, done_fraction(
+                    args, conllu_file, processed_sentence_num, token_num, i, corpus_size if index is not None else None))
+            if checkpoint is not None and args.checkpoint_every and i > start and i % args.checkpoint_every == 0:
+                save_checkpoint(block_num)
+            if i % 100000 == 0:
+                log_message(f'{i} data has been converted.')
+            read_sentence_num = i + 1
+            if rejection is not None:
+                if rejection == 'cfcontained':
+                    log_message(result)
+                counts[rejection] += 1
+                continue
+            phrase_structures, tokens, deptree, sentence_token_num, actions = result
+            write_start = time.perf_counter()
+            for f, phrase_structure in zip(tree_files, phrase_structures):
+                f.write_line(phrase_structure)
+            for g in token_files:
+                g.write_line(tokens)
+            if args.write_deptree:
+                h.write_line(deptree + '\n')
+            if args.write_actions:
+                for a, (words, leaf_labels, tree) in zip(action_files, actions):
+                    a.write(words, leaf_labels, tree)
+            if metrics is not None:
+                metrics.add_time('write', time.perf_counter() - write_start)
+
+            processed_sentence_num += 1
+            token_num += sentence_token_num
+            if reached_file_cutoff(args, conllu_file, processed_sentence_num, token_num):
+                reached_cutoff = True
+                break
+        if not reached_cutoff:
+            count_dropped()
+
+    # the sentences the filter or the sampling dropped are part of the corpus too
+    if index is None:
+        corpus_size = counts['corpus_sentences'] if sampled else None
+    summary = log_file_summary(log, counts, read_sentence_num, processed_sentence_num, token_num, reached_cutoff,
+                               corpus_size, counts['duplicate'] + counts['short'])
+    if args.dedup:
+        log(f'Duplicate sentences: {counts["duplicate"]}')
+        log(f'Duplicate filter false positive rate: {sentence_filter.seen.false_positive_rate():.2e}')
+    if args.min_tokens:
+        log(f'Sentences with less than {args.min_tokens} tokens: {counts["short"]}')
+    if sampled:
+        log(f'Sampled sentences: {counts["sampled_sentences"]} ({counts["sampled_tokens"]} tokens)')
+    return summary
 
-def convert_conllu_files(args):
-    conllu_files_to_convert, method_str, output_dir = generate_path_info(args)
 
-    converter, get_nt = setup_functions(args)
+# extract xx sentence for dev/test set, and about train_token_num tokens for train
+def reached_file_cutoff(args, conllu_file, processed_sentence_num, token_num):
+    if "train" in conllu_file.stem:
+        return token_num > args.train_token_num
+    return processed_sentence_num == args.dev_test_sentence_num
+
+
+# Log the statistics of a converted file and return its counts.
+# Without the corpus size, it is counted from the read sentences and the dropped_num sentences the filter dropped.
+def log_file_summary(log, counts, read_sentence_num, processed_sentence_num, token_num, reached_cutoff,
+                     corpus_size=None, dropped_num=0):
+    # the rest of the file is not read once the cutoff is reached, so without an index the corpus size is only
+    # a lower bound then
+    if corpus_size is not None:
+        log(f'Corpus size (sent): {corpus_size}')
+    elif reached_cutoff:
+        log(f'Corpus size (sent): {read_sentence_num + dropped_num}+ (stopped reading at the cutoff)')
+    else:
+        log(f'Corpus size (sent): {read_sentence_num + dropped_num}')
+    log(f'Converted sentences: {processed_sentence_num}')
+    log(f'and tokens: {token_num}')
+
+    log(f'Non-projective sentences: {counts["nonproj"]}')
+    log(f'Root-non-projective sentences: {counts["root_nonproj"]}')
+    log(f'Sentences with None: {counts["contain_none"]}')
+    log(f'Sentences with empty node: {counts["inclempty"]}')
+    log(f'Sentences with control character: {counts["cfcontained"]}')
+    log(f'Sentences with not root contained: {counts["notcontainroot"]}')
+    return dict(counts, read_sentences=read_sentence_num, reached_cutoff=reached_cutoff,
+                converted_sentences=processed_sentence_num, converted_tokens=token_num)
+
+
+# The done fraction of a file for the progress line: the part of the cutoff reached so far, or the part of the
+# corpus read so far if the corpus size is known and that is further.
+def done_fraction(args, conllu_file, processed_sentence_num, token_num, read_sentence_num, corpus_size=None):
+    if "train" in conllu_file.stem:
+        fraction = token_num / args.train_token_num if args.train_token_num > 0 else 0.0
+    else:
+        fraction = processed_sentence_num / args.dev_test_sentence_num if args.dev_test_sentence_num > 0 else 0.0
+    if corpus_size:
+        fraction = max(fraction, read_sentence_num / corpus_size)
+    return fraction
+
+
+# The number of sentences of the range that are not excluded, from the index alone.
+def count_range_sentences(index, first, last, exclude_ids):
+    last = len(index) if last is None else min(last, len(index))
+    if not exclude_ids:
+        return max(last - first, 0)
+    return sum(1 for i in range(first, last) if index.sent_id(i) not in exclude_ids)
+
+
+# The options besides the method that change the converted output of a file.
+def get_cache_options(args, conllu_file, exclude_ids=None):
+    options = {'name': conllu_file.name, 'compression': args.compression}
+    if args.write_actions:
+        options['actions'] = True
+    if args.min_tokens:
+        options['min_tokens'] = args.min_tokens
+    if args.sample_train and "train" in conllu_file.stem:
+        options['sample'] = {'length_buckets': sorted(args.length_buckets), 'bucket_weights': args.bucket_weights,
+                             'seed': args.seed}
+    if args.sentence_range:
+        options['sentence_range'] = parse_sentence_range(args.sentence_range)
+    if exclude_ids:
+        import hashlib
+        options['excluded_sent_ids'] = hashlib.sha256('\n'.join(sorted(exclude_ids)).encode('utf-8')).hexdigest()
+    if "train" in conllu_file.stem:
+        return dict(options, train_token_num=args.train_token_num)
+    return dict(options, dev_test_sentence_num=args.dev_test_sentence_num)
+
+
+# The converted outputs of a run: (method_strs, output_dirs, functions, deptree directory or None).
+def setup_outputs(args):
+    method_grid = setup_method_grid(args)
+    method_strs = [method_str for method_str, _, _ in method_grid]
+    output_dirs = [os.path.join(args.output_path, method_str) for method_str in method_strs]
+    functions = [(converter, get_nt) for _, converter, get_nt in method_grid]
+    original_deptree_dir = None
     if args.write_deptree:
         original_deptree_dir = Path(os.path.join(args.output_path, "original_deptree"))
         if not original_deptree_dir.exists():
             original_deptree_dir.mkdir()
+    return method_strs, output_dirs, functions, original_deptree_dir
+
+
+def open_cache(args):
+    if not args.cache_dir:
+        return None
+    if __package__:
+        from .conversion_cache import ConversionCache
+    else:
+        from conversion_cache import ConversionCache
+    return ConversionCache(args.cache_dir, args.cache_max_mb << 20)
+
+
+# (cache key, file name in the cache entry, output path) of every output of this file
+def get_cached_outputs(args, cache, conllu_file, method_strs, output_dirs, deptree_path, exclude_ids=None):
+    if __package__:
+        from .conversion_cache import cache_key, hash_file
+    else:
+        from conversion_cache import cache_key, hash_file
+    cached_outputs = []
+    file_hash = hash_file(conllu_file)
+    options = get_cache_options(args, conllu_file, exclude_ids)
+    for output_kind, output_dir in zip(method_strs, output_dirs):
+        key = cache_key(file_hash, output_kind, CONVERTER_VERSION, options)
+        for extension in ['txt', 'tokens']:
+            output_path = compressed_path(os.path.join(output_dir, f'{conllu_file.stem}.{extension}'),
+                                          args.compression)
+            cached_outputs.append((key, f'output.{extension}', output_path))
+        if args.write_actions:
+            for suffix in [ACTIONS_SUFFIX, VOCAB_SUFFIX]:
+                cached_outputs.append((key, f'output{suffix}',
+                                       os.path.join(output_dir, f'{conllu_file.stem}{suffix}')))
+    if args.write_deptree:
+        key = cache_key(file_hash, 'original_deptree', CONVERTER_VERSION, options)
+        cached_outputs.append((key, 'output.conllu', compressed_path(deptree_path, args.compression)))
+    return cached_outputs
+
+
+# Restore the outputs of a file from the cache and return the manifest of the conversion, or None if some
+# output is not cached (or --force).
+def restore_cached_outputs(args, cache, cached_outputs):
+    manifests = [cache.lookup(key) for key, _, _ in cached_outputs]
+    if args.force or None in manifests:
+        return None
+    for key, name, output_path in cached_outputs:
+        cache.restore(key, name, output_path)
+    return manifests[0]
+
+
+def store_cached_outputs(cache, cached_outputs, conllu_file, counts, file_log):
+    manifest = {'source': str(conllu_file), 'counts': counts, 'log': file_log}
+    for key in dict.fromkeys(key for key, _, _ in cached_outputs):
+        cache.store(key, {name: output_path for output_key, name, output_path in cached_outputs
+                          if output_key == key}, manifest)
+
+
+# With --jobs above 1, the files are converted concurrently by the scheduler of scheduler.py instead.
+def convert_conllu_files(args):
+    # the duplicates of a file depend on the files converted before it
+    if args.dedup and (args.jobs > 1 or args.cache_dir or args.checkpoint_every > 0 or args.resume):
+        raise ValueError('--dedup cannot be used with --jobs, --cache_dir or checkpoints.')
+    if (args.sample_train or args.min_tokens or args.profile) and args.jobs > 1:
+        raise ValueError('--sample_train, --min_tokens and --profile cannot be used with --jobs.')
+    if args.jobs > 1:
+        if __package__:
+            from .scheduler import schedule_conllu_files
+        else:
+            from scheduler import schedule_conllu_files
+        return schedule_conllu_files(args, logger)
+
+    conllu_files_to_convert = find_conllu_files(args.source_path)
+    method_strs, output_dirs, functions, original_deptree_dir = setup_outputs(args)
+    method_str = ', '.join(method_strs)
+    cache = open_cache(args)
+    exclude_ids = load_sent_ids(args.G18_conllid_file) if args.G18_conllid_file else None
+    checkpointing = args.checkpoint_every > 0 or args.resume
+    if checkpointing and args.compression != 'none':
+        raise ValueError('Checkpoints need uncompressed outputs (--compression none).')
+    if checkpointing and args.write_actions:
+        raise ValueError('Checkpoints cannot be used with --write_actions.')
+    checkpoint_dir = args.checkpoint_dir or os.path.join(args.output_path, '.checkpoints')
+    checkpoints = []
+    run_metrics = RunMetrics(REJECTION_ERRORS) if args.metrics_file else None
+    sentence_filter = None
+    if args.dedup or args.min_tokens:
+        if __package__:
+            from .sentence_filter import SentenceFilter
+        else:
+            from sentence_filter import SentenceFilter
+        sentence_filter = SentenceFilter(args.dedup_mb if args.dedup else 0, args.min_tokens)
 
     for conllu_file in conllu_files_to_convert:
         logger.info(f'Converting {conllu_file.name} with {method_str} method.')
-        corpus = pyconll.load_from_file(str(conllu_file))
-        
-        processed_sentence_num = 0
-        token_num = 0
-
-        inclempty_count = 0
-        cfcontained_count = 0
-        contain_none_count = 0
-        nonproj_count = 0
-        root_nonproj_count = 0
-        notcontainroot_count = 0
-
-        with open(os.path.join(output_dir, f'{conllu_file.stem}.txt'), 'w') as f, \
-             open(os.path.join(output_dir,f'{conllu_file.stem}.tokens'), 'w') as g, \
-             original_deptree_dir.joinpath(conllu_file.name).open('w') as h:
-            for i, sentence in enumerate(corpus):
-                if i % 100000 == 0:
-                    logger.info(f'{i} data has been converted.')
-                try:
-                    phrase_structure = general_converter(
-                        converter, sentence, get_nt)
-                    if len(sentence) == 1:
-                        phrase_structure = f'({get_nt(sentence[0])} {phrase_structure})'
-                    f.write(phrase_structure)
-                    f.write('\n')
-                    g.write(generate_tokens(sentence))
-                    g.write('\n')
-                    if args.write_deptree:
-                        h.write(sentence.conll())
-                        h.write('\n\n')
-
-                    processed_sentence_num += 1
-                    token_num += len(sentence)
-                    # extract xx sentence for dev/test set
-                    if "train" not in conllu_file.stem and processed_sentence_num == args.dev_test_sentence_num:
-                        break
-                    if "train" in conllu_file.stem and token_num > args.train_token_num:
-                        break
-                except KeyError:
-                    inclempty_count += 1
-                    continue
-                except ContainNoneError:
-                    contain_none_count += 1
-                    continue
-                except NonProjError:
-                    nonproj_count += 1
-                    continue
-                except RootNonProjError:
-                    root_nonproj_count += 1
-                    continue
-                except CFContainedError:
-                    logger.info(f'Cf contained in {sentence_to_str(sentence)}')
-                    cfcontained_count += 1
-                    continue
-                except NotContainRootError:
-                    notcontainroot_count += 1
-                    continue
-
-        logger.info(f'Corpus size (sent): {len(corpus)}')
-        logger.info(f'Converted sentences: {processed_sentence_num}')
-        logger.info(f'and tokens: {token_num}')
-
-        logger.info(f'Non-projective sentences: {nonproj_count}')
-        logger.info(f'Root-non-projective sentences: {root_nonproj_count}')
-        logger.info(f'Sentences with None: {contain_none_count}')
-        logger.info(f'Sentences with empty node: {inclempty_count}')
-        logger.info(f'Sentences with control character: {cfcontained_count}')
-        logger.info(f'Sentences with not root contained: {notcontainroot_count}')
-
-def remove_data_in_evalset(source_file, G18_conllid_file, tmp_file):
-    conllid_set = set()
-    with open(G18_conllid_file) as f:
-        for conllid in f:
-            conllid_set.add(conllid.strip())
-    with open(source_file) as f, open(tmp_file, 'w') as g:
-        for line in f:
-            if line.startswith('#') and line.split(' ')[1] == 'sent_id':
-                if line.split(' ')[3].strip() in conllid_set:
-                    to_add = False
+        deptree_path = original_deptree_dir.joinpath(conllu_file.name) if args.write_deptree else None
+
+        cached_outputs = []
+        if cache is not None:
+            cached_outputs = get_cached_outputs(args, cache, conllu_file, method_strs, output_dirs, deptree_path,
+                                                exclude_ids)
+            manifest = restore_cached_outputs(args, cache, cached_outputs)
+            if manifest is not None:
+                for message in manifest['log']:
+                    logger.info(message)
+                if run_metrics is not None:
+                    run_metrics.add_cached_file(conllu_file.name)
+                continue
+
+        checkpoint = resume_state = None
+        if checkpointing:
+            checkpoint_options = dict(get_cache_options(args, conllu_file, exclude_ids), outputs=method_strs,
+                                      write_deptree=args.write_deptree, source=source_signature(conllu_file))
+            checkpoint = Checkpoint(checkpoint_path(checkpoint_dir, conllu_file), checkpoint_options)
+            resume_state = checkpoint.load() if args.resume else None
+            checkpoints.append(checkpoint)
+            if resume_state is not None and resume_state.get('done'):
+                logger.info(f'{conllu_file.name} was converted before the interruption.')
+                for message in resume_state['log']:
+                    logger.info(message)
+                if run_metrics is not None:
+                    run_metrics.add_resumed_file(conllu_file.name)
+                continue
+        file_log = list(resume_state['log']) if resume_state is not None else []
+
+        def log(message):
+            logger.info(message)
+            file_log.append(message)
+
+        file_metrics = FileMetrics(conllu_file.name) if run_metrics is not None else None
+        with ExitStack() as stack:
+            profile = None
+            if args.profile:
+                if __package__:
+                    from .profiling import FileProfile
                 else:
-                    to_add = True
-                    g.write(f'{line}')
-            else:
-                if to_add:
-                    g.write(f'{line}')
-    return
+                    from profiling import FileProfile
+                profile = stack.enter_context(FileProfile(
+                    args.profile_dir or os.path.join(args.output_path, 'profile'), conllu_file,
+                    args.profile_slowest, args.profile_interval))
+            counts = convert_conllu_file(args, conllu_file, functions, output_dirs, deptree_path, log, exclude_ids,
+                                         checkpoint, resume_state, file_metrics, sentence_filter, profile)
+        if run_metrics is not None:
+            file_metrics.finish()
+            run_metrics.add_file(file_metrics)
+        # the checkpoints of the converted files are kept until the end of the run, so that --resume skips them
+        if checkpoint is not None:
+            checkpoint.save({'done': True, 'log': file_log})
 
-if __name__ == '__main__':
-    args = parser.parse_args()
-    conllu_files_to_convert, method_str, output_dir = generate_path_info(args)
+        if cache is not None:
+            store_cached_outputs(cache, cached_outputs, conllu_file, counts, file_log)
 
-    if args.G18_conllid_file:
-        f = tempfile.TemporaryDirectory()
-        for conllu_file in conllu_files_to_convert:
-            remove_data_in_evalset(conllu_file, args.G18_conllid_file, f'{f.name}/{conllu_file.name}')
-        args.source_path = f.name
+    for checkpoint in checkpoints:
+        checkpoint.remove()
+    if run_metrics is not None:
+        run_metrics.write(args.metrics_file)
 
-    conllu_files_to_convert, method_str, output_dir = generate_path_info(args)
 
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def main(argv=None, prog=None):
+    args = build_parser(prog).parse_args(argv)
 
-    handler = FileHandler(filename=f'{output_dir}/convert.log')
-    handler.setLevel(DEBUG)
-    handler.setFormatter(Formatter(fmt))
-    logger.addHandler(handler)
+    for method_str, _, _ in setup_method_grid(args):
+        output_dir = os.path.join(args.output_path, method_str)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        handler = FileHandler(filename=f'{output_dir}/convert.log')
+        handler.setLevel(DEBUG)
+        handler.setFormatter(Formatter(fmt))
+        logger.addHandler(handler)
 
     convert_conllu_files(args)
+
+
+if __name__ == '__main__':
+    main()
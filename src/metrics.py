@@ -0,0 +1,150 @@
+"""
+Per-stage timings and counters of a convert_conllu_files run (--metrics_file, --progress).
+
+The conversion of a file is split into the stages of STAGES: reading and parsing the CoNLL-U blocks, validating
+the dependency tree (indexing, projectivity and root-crossing checks, and the scan of the forms for control
+characters), converting it with every method, sanitizing the forms and building the token line, and writing the
+outputs. FileMetrics accumulates the time spent in each stage, the
+rejections by the error general_converter raises for them (see REJECTION_ERRORS), and the histogram of sentence
+lengths. With several workers, the stage times of the worker processes are summed, so they can add up to more
+than the wall-clock time of the file.
+
+The metrics of all the files of a run are written as one JSON file by RunMetrics.write.
+"""
+
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+STAGES = ['parse', 'validation', 'conversion', 'sanitization', 'write']
+
+
+def rate(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+
+class FileMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.rejections = Counter()
+        self.length_histogram = Counter()
+        self.read_sentences = 0
+        self.converted_sentences = 0
+        self.converted_tokens = 0
+        self.start_time = time.perf_counter()
+        self.elapsed = None
+
+    def add_time(self, stage, seconds):
+        self.stage_seconds[stage] += seconds
+
+    # Record a read sentence with the (validation, conversion, sanitization) seconds convert_sentence measured.
+    def add_sentence(self, sentence_token_num, rejection, timings):
+        self.read_sentences += 1
+        self.length_histogram[sentence_token_num] += 1
+        for stage, seconds in zip(STAGES[1:4], timings):
+            self.stage_seconds[stage] += seconds
+        if rejection is not None:
+            self.rejections[rejection] += 1
+        else:
+            self.converted_sentences += 1
+            self.converted_tokens += sentence_token_num
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.start_time
+
+    def to_dict(self, rejection_errors):
+        return {
+            'elapsed_seconds': self.elapsed,
+            'read_sentences': self.read_sentences,
+            'converted_sentences': self.converted_sentences,
+            'converted_tokens': self.converted_tokens,
+            'sentences_per_second': rate(self.read_sentences, self.elapsed),
+            'tokens_per_second': rate(self.converted_tokens, self.elapsed),
+            'stage_seconds': self.stage_seconds,
+            'rejections': {
+                rejection_errors[rejection].__name__: {
+                    'reason': rejection,
+                    'count': count,
+                    'rate': count / self.read_sentences,
+                }
+                for rejection, count in sorted(self.rejections.items())
+            },
+            'sentence_length_histogram': {str(length): count
+                                          for length, count in sorted(self.length_histogram.items())},
+        }
+
+
+class RunMetrics:
+    def __init__(self, rejection_errors):
+        self.rejection_errors = rejection_errors
+        self.files = {}
+        self.start_time = time.perf_counter()
+
+    def add_file(self, file_metrics):
+        self.files[file_metrics.name] = file_metrics.to_dict(self.rejection_errors)
+
+    def add_cached_file(self, name):
+        self.files[name] = {'cached': True}
+
+    # A file converted by the interrupted run that --resume continues.
+    def add_resumed_file(self, name):
+        self.files[name] = {'resumed': True}
+
+    def write(self, path):
+        elapsed = time.perf_counter() - self.start_time
+        converted = [metrics for metrics in self.files.values()
+                     if not (metrics.get('cached') or metrics.get('resumed'))]
+        stage_seconds = dict.fromkeys(STAGES, 0.0)
+        for metrics in converted:
+            for stage, seconds in metrics['stage_seconds'].items():
+                stage_seconds[stage] += seconds
+        read_sentences = sum(metrics['read_sentences'] for metrics in converted)
+        converted_tokens = sum(metrics['converted_tokens'] for metrics in converted)
+        total = {
+            'elapsed_seconds': elapsed,
+            'read_sentences': read_sentences,
+            'converted_sentences': sum(metrics['converted_sentences'] for metrics in converted),
+            'converted_tokens': converted_tokens,
+            'sentences_per_second': rate(read_sentences, elapsed),
+            'tokens_per_second': rate(converted_tokens, elapsed),
+            'stage_seconds': stage_seconds,
+        }
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.files, 'total': total}, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+# A progress line on stderr, rewritten in place. Callers update it when due(), i.e. every `interval` seconds.
+# The ETA is estimated from the done fraction reported by the caller.
+class ProgressLine:
+    def __init__(self, name, stream=None, interval=0.5):
+        self.name = name
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.start_time = self.last_time = time.perf_counter()
+
+    def due(self):
+        return time.perf_counter() - self.last_time >= self.interval
+
+    def update(self, read_sentences, converted_tokens, fraction=None):
+        self.last_time = time.perf_counter()
+        elapsed = self.last_time - self.start_time
+        line = f'{self.name}: {read_sentences} sent, {converted_tokens} tok, {read_sentences / max(elapsed, 1e-9):.0f} sent/s'
+        if fraction:
+            fraction = min(fraction, 1.0)
+            line += f', {fraction:.1%}, ETA {format_seconds(elapsed * (1 - fraction) / fraction)}'
+        self.stream.write(f'\r{line}\033[K')
+        self.stream.flush()
+
+    def close(self):
+        self.stream.write('\n')
+        self.stream.flush()
+
+
+def format_seconds(seconds):
+    seconds = max(int(seconds), 0)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
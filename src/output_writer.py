@@ -0,0 +1,87 @@
+"""
+Batched line writer for the converted outputs (.txt, .tokens and the optional deptree files).
+
+Lines are collected in memory and written with one large write every `buffer_size` characters instead of several
+small writes per sentence. The output is written to `<path>.tmp` and renamed to `<path>` only when the writer
+is closed without error, so a crashed or interrupted run never leaves a truncated file that looks complete.
+Outputs can be gzip or zstd compressed (zstd needs the optional `zstandard` package).
+
+For checkpointed runs, checkpoint() makes everything written so far durable and returns the size of the .tmp file,
+and an uncompressed writer can be reopened with resume_size to drop what was written after that checkpoint.
+"""
+
+import os
+
+COMPRESSION_SUFFIXES = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def compressed_path(path, compression):
+    return f'{path}{COMPRESSION_SUFFIXES[compression]}'
+
+
+def open_compressed(path, compression):
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(path, 'wb')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compressed outputs need the zstandard package (pip install zstandard)')
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+
+class BatchedWriter:
+    def __init__(self, path, buffer_size=1 << 20, compression='none', resume_size=None):
+        self.path = compressed_path(path, compression)
+        self.tmp_path = f'{self.path}.tmp'
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.buffered_size = 0
+        if resume_size is None:
+            self.file = open_compressed(self.tmp_path, compression)
+        elif compression != 'none':
+            raise ValueError('only uncompressed outputs can be resumed')
+        else:
+            self.file = open(self.tmp_path, 'r+b')
+            self.file.truncate(resume_size)
+            self.file.seek(resume_size)
+
+    def write_line(self, line):
+        self.lines.append(line)
+        self.buffered_size += len(line) + 1
+        if self.buffered_size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            self.file.write('\n'.join(self.lines).encode('utf-8'))
+            self.lines = []
+            self.buffered_size = 0
+
+    def checkpoint(self):
+        self.flush()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    # on error, the partial output is left in the .tmp file
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
@@ -0,0 +1,128 @@
+"""
+Profiling of the conversion of each file (`--profile`), to find out where the time goes when a corpus converts
+unexpectedly slowly.
+
+While a file is converted, FileProfile runs cProfile and a sampling thread that records the stack of the converting
+thread every --profile_interval seconds, and keeps the --profile_slowest sentences that took longest to validate,
+convert and sanitize. When the file is done, it writes to --profile_dir (default <output_path>/profile):
+
+    <file>.pstats          cProfile statistics (python -m pstats, snakeviz, ...)
+    <file>.collapsed       sampled stacks in the collapsed format of flamegraph.pl / speedscope / inferno:
+                           one "outer;...;inner count" line per distinct stack
+    <file>.slowest.json    the slowest sentences: block number, sent_id, length and stage seconds
+    <file>.slowest.conllu  their CoNLL-U blocks, which can be fed to benchmarks/run_benchmarks.py --corpus
+
+Only the process converting the file is profiled, so profile with --workers 1. With the numpy engine, the time
+of a chunk is shared equally by its sentences and the slowest sentences are not meaningful.
+"""
+
+import cProfile
+import heapq
+import json
+import os
+import sys
+import threading
+from collections import Counter
+try:
+    from .conllu_reader import comment_sent_id, read_conllu_blocks
+except ImportError:
+    from conllu_reader import comment_sent_id, read_conllu_blocks
+
+
+def frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+# Samples the stack of one thread (by default the calling one) from a background thread.
+class StackSampler:
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class FileProfile:
+    def __init__(self, profile_dir, conllu_file, slowest_num=20, interval=0.005):
+        self.profile_dir = profile_dir
+        self.conllu_file = conllu_file
+        self.slowest_num = slowest_num
+        self.interval = interval
+        # min-heap of (seconds, block number, length, stage seconds) of the slowest sentences so far
+        self.slowest = []
+
+    def __enter__(self):
+        self.sampler = StackSampler(self.interval)
+        self.profiler = cProfile.Profile()
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.disable()
+        self.sampler.stop()
+        if exc_type is None:
+            self.write()
+
+    # Record a converted or rejected sentence with the (length, validation, conversion, sanitization seconds)
+    # convert_sentence measured.
+    def add_sentence(self, block_num, stats):
+        item = (sum(stats[1:]), block_num, stats[0], stats[1:])
+        if len(self.slowest) < self.slowest_num:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def write(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, self.conllu_file.name)
+        self.profiler.dump_stats(f'{path}.pstats')
+        self.sampler.write_collapsed(f'{path}.collapsed')
+
+        slowest = sorted(self.slowest, reverse=True)
+        blocks = self.read_blocks({block_num for _, block_num, _, _ in slowest})
+        records = []
+        for seconds, block_num, length, (validation, conversion, sanitization) in slowest:
+            sent_id = next(filter(None, (comment_sent_id(line) for line in blocks[block_num] if line[0] == '#')), None)
+            records.append({
+                'block': block_num, 'sent_id': sent_id, 'length': length, 'seconds': seconds,
+                'stage_seconds': {'validation': validation, 'conversion': conversion,
+                                  'sanitization': sanitization},
+            })
+        with open(f'{path}.slowest.json', 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+        with open(f'{path}.slowest.conllu', 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write('\n'.join(blocks[record['block']]) + '\n\n')
+
+    # The lines of the given blocks of the file, read again from the file.
+    def read_blocks(self, block_nums):
+        blocks = {}
+        if block_nums:
+            for block_num, lines in read_conllu_blocks(self.conllu_file, last=max(block_nums) + 1, numbered=True):
+                if block_num in block_nums:
+                    blocks[block_num] = lines
+        return blocks
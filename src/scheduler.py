@@ -0,0 +1,416 @@
+"""
+Concurrent conversion of all the files of a run (`--jobs N`), e.g. of a whole UD release.
+
+Converting the files one after another lets the largest train file alone set the wall time of the run. The
+scheduler instead converts the files in N processes at once, and splits the files larger than --split_mb into
+sentence-range pieces of about that size (using the sentence index of sentence_index.py, kept under
+<output_path>/.split_index unless --sentence_index). The pieces are started largest first, so that the small files
+fill in around the large ones, and the pieces of a file in sentence order.
+Only 2 * N pieces are submitted at a time, so that the pieces after the cutoff of a file are mostly not started.
+
+Each piece is converted by convert_piece into part files, without the dev/test or train cutoff of its file, and
+returns what happened to each of its sentences. The parent merges the pieces of a file in sentence order into the
+usual outputs, replaying the sentence records like the serial loop of convert_conllu_file does: the cutoff, the
+statistics and the convert.log messages of every file are the same as in a serial run. Once the cutoff of a file
+is reached, its remaining pieces are cancelled (those already running are converted to no use). The messages of the files are logged in the order of the serial
+run, as soon as the files before them are done.
+
+The per-file counts (or the cache manifest of a restored file) are written as one JSON run summary, with the
+totals of the run, to --summary_file (default <output_path>/run_summary.json).
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack, closing
+try:
+    from .action_format import ActionReader, ActionWriter
+    from .conllu_reader import iter_sentences, load_sent_ids
+    from .converter import REJECTION_ERRORS, find_conllu_files
+    from .generate_dataset import (count_range_sentences, get_cached_outputs, iter_conversions, log_file_summary,
+                                   open_cache, reached_file_cutoff, restore_cached_outputs, setup_outputs,
+                                   store_cached_outputs)
+    from .metrics import FileMetrics, ProgressLine, RunMetrics
+    from .output_writer import BatchedWriter
+    from .sentence_index import INDEX_SUFFIX, SentenceIndex, parse_sentence_range
+except ImportError:
+    from action_format import ActionReader, ActionWriter
+    from conllu_reader import iter_sentences, load_sent_ids
+    from converter import REJECTION_ERRORS, find_conllu_files
+    from generate_dataset import (count_range_sentences, get_cached_outputs, iter_conversions, log_file_summary,
+                                  open_cache, reached_file_cutoff, restore_cached_outputs, setup_outputs,
+                                  store_cached_outputs)
+    from metrics import FileMetrics, ProgressLine, RunMetrics
+    from output_writer import BatchedWriter
+    from sentence_index import INDEX_SUFFIX, SentenceIndex, parse_sentence_range
+
+
+# Split the sentences first:last of an indexed file into ranges of about piece_bytes bytes.
+# Return the (first, last, byte size) of every range.
+def split_range(index, first, last, piece_bytes):
+    last = len(index) if last is None else min(last, len(index))
+    if first >= last:
+        return [(first, last, 0)]
+    start, end = index.starts[first], index.ends[last - 1]
+    piece_num = max(1, round((end - start) / piece_bytes))
+    bounds = [first]
+    for k in range(1, piece_num):
+        bound = bisect.bisect_left(index.starts, start + (end - start) * k // piece_num, first, last)
+        if bound > bounds[-1]:
+            bounds.append(bound)
+    bounds.append(last)
+    return [(piece_first, piece_last, index.ends[piece_last - 1] - index.starts[piece_first])
+            for piece_first, piece_last in zip(bounds, bounds[1:])]
+
+
+def part_paths(part_dir, output_num):
+    trees = [os.path.join(part_dir, f'{k}.txt') for k in range(output_num)]
+    tokens = [os.path.join(part_dir, f'{k}.tokens') for k in range(output_num)]
+    actions = [os.path.join(part_dir, str(k)) for k in range(output_num)]
+    return trees, tokens, os.path.join(part_dir, 'deptree'), actions
+
+
+# Convert the sentences first:last of a file into part files in part_dir, with the options of args but without the
+# cutoff of the file (the piece only stops at the cutoff a file starting with it would have).
+# Return the (rejection, sentence length, Cf message, stage seconds) of every read sentence, the stage seconds being
+# those of STAGES, so that the merge only counts the time of the sentences before the cutoff.
+def convert_piece(args, conllu_file, functions, part_dir, first, last, use_index, exclude_ids=None):
+    os.makedirs(part_dir)
+    index = SentenceIndex.open(conllu_file, split_index_path(args, conllu_file)) if use_index else None
+    corpus = iter_sentences(conllu_file, full=args.write_deptree, exclude_ids=exclude_ids, first=first, last=last,
+                            index=index)
+    # the parse seconds of the sentences in flight; conversions come back in corpus order, one per sentence
+    parse_seconds = deque()
+
+    def iter_corpus():
+        while True:
+            start_time = time.perf_counter()
+            sentence = next(corpus, None)
+            if sentence is None:
+                return
+            parse_seconds.append(time.perf_counter() - start_time)
+            yield sentence
+
+    records = []
+    processed_sentence_num = token_num = 0
+    tree_paths, token_paths, deptree_path, action_paths = part_paths(part_dir, len(functions))
+    with ExitStack() as stack:
+        if index is not None:
+            stack.enter_context(index)
+        tree_files = [stack.enter_context(BatchedWriter(path, args.write_buffer_size)) for path in tree_paths]
+        token_files = [stack.enter_context(BatchedWriter(path, args.write_buffer_size)) for path in token_paths]
+        h = stack.enter_context(BatchedWriter(deptree_path, args.write_buffer_size)) if args.write_deptree else None
+        action_files = [stack.enter_context(ActionWriter(path)) for path in action_paths] if args.write_actions else []
+        conversions = stack.enter_context(closing(iter_conversions(
+            iter_corpus(), functions, args.write_deptree, 1, args.chunk_size, args.engine, args.write_actions)))
+        for rejection, result, stats in conversions:
+            parse_time = parse_seconds.popleft()
+            if rejection is not None:
+                records.append((rejection, stats[0], result if rejection == 'cfcontained' else None,
+                                (parse_time, ) + stats[1:] + (0.0, )))
+                continue
+            phrase_structures, tokens, deptree, sentence_token_num, actions = result
+            write_start = time.perf_counter()
+            for f, phrase_structure in zip(tree_files, phrase_structures):
+                f.write_line(phrase_structure)
+            for g in token_files:
+                g.write_line(tokens)
+            if args.write_deptree:
+                h.write_line(deptree + '\n')
+            if args.write_actions:
+                for a, (words, leaf_labels, tree) in zip(action_files, actions):
+                    a.write(words, leaf_labels, tree)
+            records.append((None, sentence_token_num, None,
+                            (parse_time, ) + stats[1:] + (time.perf_counter() - write_start, )))
+            processed_sentence_num += 1
+            token_num += sentence_token_num
+            if reached_file_cutoff(args, conllu_file, processed_sentence_num, token_num):
+                break
+    return records
+
+
+# Copy the first record_num records of a part file (all of them if record_num is None) to writer. A record is a
+# line, or with blank_line_records, the lines up to and including a blank line (the dependency tree blocks).
+def copy_part(path, writer, record_num=None, blank_line_records=False):
+    copied = 0
+    with open(path, encoding='utf-8', newline='\n') as f:
+        for line in f:
+            if copied == record_num:
+                break
+            line = line[:-1]
+            writer.write_line(line)
+            if not blank_line_records or not line:
+                copied += 1
+
+
+def copy_actions(path, writer, record_num=None):
+    with ActionReader(path) as reader:
+        for copied, record in enumerate(reader):
+            if copied == record_num:
+                break
+            writer.write(*reader.lookup(record))
+
+
+# The merge of the converted pieces of a file into its outputs, in sentence order.
+# The outputs are opened with the first merged piece, so that only the files in progress keep theirs open.
+class FileMerge:
+    def __init__(self, args, conllu_file, output_dirs, deptree_path, piece_num, corpus_size=None, metrics=None):
+        self.args = args
+        self.conllu_file = conllu_file
+        self.output_dirs = output_dirs
+        self.deptree_path = deptree_path
+        self.piece_num = piece_num
+        self.corpus_size = corpus_size
+        self.metrics = metrics
+        self.log = []
+        self.counts = Counter()
+        self.read_sentence_num = self.processed_sentence_num = self.token_num = 0
+        self.merged_piece_num = 0
+        self.reached_cutoff = False
+        self.stack = None
+
+    def open_outputs(self):
+        self.stack = ExitStack()
+        stem = self.conllu_file.stem
+        self.tree_files = [self.open_writer(os.path.join(output_dir, f'{stem}.txt')) for output_dir in self.output_dirs]
+        self.token_files = [self.open_writer(os.path.join(output_dir, f'{stem}.tokens'))
+                            for output_dir in self.output_dirs]
+        self.deptree_file = self.open_writer(self.deptree_path) if self.args.write_deptree else None
+        self.action_files = [self.stack.enter_context(ActionWriter(os.path.join(output_dir, stem)))
+                             for output_dir in self.output_dirs] if self.args.write_actions else []
+
+    def open_writer(self, path):
+        return self.stack.enter_context(BatchedWriter(path, self.args.write_buffer_size, self.args.compression))
+
+    def done(self):
+        return self.reached_cutoff or self.merged_piece_num == self.piece_num
+
+    # Merge the next piece of the file, until the cutoff of the file is reached.
+    def add_piece(self, part_dir, records):
+        if self.stack is None:
+            self.open_outputs()
+        self.merged_piece_num += 1
+        kept = 0
+        for rejection, sentence_token_num, message, stage_seconds in records:
+            i = self.read_sentence_num
+            if i % 100000 == 0:
+                self.log.append(f'{i} data has been converted.')
+            self.read_sentence_num = i + 1
+            if self.metrics is not None:
+                self.metrics.add_sentence(sentence_token_num, rejection, stage_seconds[1:4])
+                self.metrics.add_time('parse', stage_seconds[0])
+                self.metrics.add_time('write', stage_seconds[4])
+            if rejection is not None:
+                if rejection == 'cfcontained':
+                    self.log.append(message)
+                self.counts[rejection] += 1
+                continue
+            kept += 1
+            self.processed_sentence_num += 1
+            self.token_num += sentence_token_num
+            if reached_file_cutoff(self.args, self.conllu_file, self.processed_sentence_num, self.token_num):
+                self.reached_cutoff = True
+                break
+
+        write_start = time.perf_counter()
+        record_num = kept if self.reached_cutoff else None
+        tree_paths, token_paths, deptree_path, action_paths = part_paths(part_dir, len(self.tree_files))
+        for path, writer in zip(tree_paths + token_paths, self.tree_files + self.token_files):
+            copy_part(path, writer, record_num)
+        if self.deptree_file is not None:
+            copy_part(deptree_path, self.deptree_file, record_num, blank_line_records=True)
+        for path, writer in zip(action_paths, self.action_files):
+            copy_actions(path, writer, record_num)
+        shutil.rmtree(part_dir)
+        if self.metrics is not None:
+            self.metrics.add_time('write', time.perf_counter() - write_start)
+
+    # Close the outputs and log the statistics of the file; return its counts.
+    def finish(self):
+        if self.stack is None:
+            self.open_outputs()
+        self.stack.close()
+        if self.metrics is not None:
+            self.metrics.finish()
+        return log_file_summary(self.log.append, self.counts, self.read_sentence_num, self.processed_sentence_num,
+                                self.token_num, self.reached_cutoff, self.corpus_size)
+
+
+# The sentence index of a file converted by the scheduler. With --sentence_index, it is the usual <file>.idx sidecar,
+# like in a serial run. Otherwise, the index is only needed to split the file, and it is kept under
+# <output_path>/.split_index rather than next to the file, whose directory may be read-only.
+def split_index_path(args, conllu_file):
+    if args.sentence_index:
+        return None
+    path_hash = hashlib.sha256(os.path.abspath(conllu_file).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(args.output_path, '.split_index', f'{path_hash}-{conllu_file.name}{INDEX_SUFFIX}')
+
+
+# The pieces of a file as (first, last, byte size, use_index), and its corpus size for the log if --sentence_index.
+def plan_file(args, conllu_file, exclude_ids=None):
+    first, last = parse_sentence_range(args.sentence_range) if args.sentence_range else (0, None)
+    file_size = os.path.getsize(conllu_file)
+    piece_bytes = args.split_mb * (1 << 20)
+    if not args.sentence_index and file_size <= piece_bytes:
+        return [(first, last, file_size, False)], None
+    sidecar_path = split_index_path(args, conllu_file)
+    if sidecar_path is not None:
+        os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+    with SentenceIndex.open(conllu_file, sidecar_path) as index:
+        corpus_size = count_range_sentences(index, first, last, exclude_ids) if args.sentence_index else None
+        if file_size <= piece_bytes:
+            return [(first, last, file_size, True)], corpus_size
+        return [piece + (True, ) for piece in split_range(index, first, last, piece_bytes)], corpus_size
+
+
+# The messages are logged to the logger of the caller: run as a script, generate_dataset.py is the __main__ module,
+# and the logger of the generate_dataset module imported here would have none of its handlers.
+def schedule_conllu_files(args, logger):
+    if args.checkpoint_every > 0 or args.resume:
+        raise ValueError('Checkpoints cannot be used with --jobs.')
+    start_time = time.perf_counter()
+    conllu_files = find_conllu_files(args.source_path)
+    method_strs, output_dirs, functions, original_deptree_dir = setup_outputs(args)
+    method_str = ', '.join(method_strs)
+    cache = open_cache(args)
+    exclude_ids = load_sent_ids(args.G18_conllid_file) if args.G18_conllid_file else None
+    run_metrics = RunMetrics(REJECTION_ERRORS) if args.metrics_file else None
+
+    # the log messages of every file, logged in file order as soon as the files before it are logged
+    file_logs = [None] * len(conllu_files)
+    logged_num = 0
+
+    def log_done_files():
+        nonlocal logged_num
+        while logged_num < len(file_logs) and file_logs[logged_num] is not None:
+            logger.info(f'Converting {conllu_files[logged_num].name} with {method_str} method.')
+            for message in file_logs[logged_num]:
+                logger.info(message)
+            logged_num += 1
+
+    summaries = {}
+    cached_outputs = {}
+    merges = {}
+    # (piece number, first, last, byte size, use_index) of the pieces of every file that are not submitted yet
+    file_pieces = {}
+    for file_num, conllu_file in enumerate(conllu_files):
+        deptree_path = original_deptree_dir.joinpath(conllu_file.name) if args.write_deptree else None
+        if cache is not None:
+            cached_outputs[file_num] = get_cached_outputs(args, cache, conllu_file, method_strs, output_dirs,
+                                                          deptree_path, exclude_ids)
+            manifest = restore_cached_outputs(args, cache, cached_outputs[file_num])
+            if manifest is not None:
+                file_logs[file_num] = manifest['log']
+                summaries[conllu_file.name] = dict(manifest['counts'], cached=True)
+                if run_metrics is not None:
+                    run_metrics.add_cached_file(conllu_file.name)
+                continue
+        pieces, corpus_size = plan_file(args, conllu_file, exclude_ids)
+        file_pieces[file_num] = deque((piece_num, ) + piece for piece_num, piece in enumerate(pieces))
+        file_metrics = FileMetrics(conllu_file.name) if run_metrics is not None else None
+        merges[file_num] = FileMerge(args, conllu_file, output_dirs, deptree_path, len(pieces), corpus_size,
+                                     file_metrics)
+    log_done_files()
+
+    all_merges = list(merges.values())
+    total_bytes = sum(piece[3] for pieces in file_pieces.values() for piece in pieces) or 1
+    merged_bytes = 0
+    progress = ProgressLine('all files') if args.progress else None
+    part_root = tempfile.mkdtemp(prefix='.parts-', dir=args.output_path)
+    try:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            futures = {}
+            file_futures = {file_num: [] for file_num in merges}
+            pending = set()
+
+            # Submit pieces until 2 * jobs are pending, the largest next piece of the files first.
+            def submit_pieces():
+                while len(pending) < 2 * args.jobs:
+                    next_pieces = [(pieces[0][3], -file_num) for file_num, pieces in file_pieces.items() if pieces]
+                    if not next_pieces:
+                        return
+                    file_num = -max(next_pieces)[1]
+                    piece_num, first, last, size, use_index = file_pieces[file_num].popleft()
+                    part_dir = os.path.join(part_root, f'{file_num}-{piece_num}')
+                    future = executor.submit(convert_piece, args, conllu_files[file_num], functions, part_dir,
+                                             first, last, use_index, exclude_ids)
+                    futures[future] = (file_num, piece_num, part_dir, size)
+                    file_futures[file_num].append(future)
+                    pending.add(future)
+
+            # the converted pieces of every file that wait for the pieces before them
+            results = {file_num: {} for file_num in merges}
+
+            submit_pieces()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending -= done
+                for future in done:
+                    file_num, piece_num = futures[future][:2]
+                    if future.cancelled() or file_num not in merges:
+                        continue
+                    results[file_num][piece_num] = future
+                    merge = merges[file_num]
+                    while merge.merged_piece_num in results[file_num] and not merge.done():
+                        piece_future = results[file_num].pop(merge.merged_piece_num)
+                        _, _, part_dir, size = futures[piece_future]
+                        merge.add_piece(part_dir, piece_future.result())
+                        merged_bytes += size
+                    if merge.done():
+                        # the pieces after the cutoff are not needed
+                        file_pieces[file_num].clear()
+                        for other_future in file_futures[file_num]:
+                            if other_future.cancel():
+                                pending.discard(other_future)
+                        del merges[file_num]
+                        counts = merge.finish()
+                        file_logs[file_num] = merge.log
+                        summaries[merge.conllu_file.name] = dict(counts, pieces=merge.piece_num)
+                        if run_metrics is not None:
+                            run_metrics.add_file(merge.metrics)
+                        if cache is not None:
+                            store_cached_outputs(cache, cached_outputs[file_num], merge.conllu_file, counts,
+                                                 merge.log)
+                        log_done_files()
+                submit_pieces()
+                if progress is not None:
+                    progress.update(sum(merge.read_sentence_num for merge in all_merges),
+                                    sum(merge.token_num for merge in all_merges), merged_bytes / total_bytes)
+    finally:
+        shutil.rmtree(part_root, ignore_errors=True)
+        if progress is not None:
+            progress.close()
+
+    # files are listed in the order of the serial run
+    summaries = {conllu_file.name: summaries[conllu_file.name] for conllu_file in conllu_files}
+    if run_metrics is not None:
+        run_metrics.write(args.metrics_file)
+    write_run_summary(args.summary_file or os.path.join(args.output_path, 'run_summary.json'), summaries,
+                      time.perf_counter() - start_time, args.jobs)
+
+
+def write_run_summary(path, summaries, elapsed, jobs):
+    converted = [summary for summary in summaries.values() if not summary.get('cached')]
+    rejections = Counter()
+    for summary in summaries.values():
+        rejections.update({reason: summary.get(reason, 0) for reason in REJECTION_ERRORS})
+    total = {
+        'files': len(summaries),
+        'cached_files': len(summaries) - len(converted),
+        'jobs': jobs,
+        'elapsed_seconds': elapsed,
+        'read_sentences': sum(summary['read_sentences'] for summary in summaries.values()),
+        'converted_sentences': sum(summary['converted_sentences'] for summary in summaries.values()),
+        'converted_tokens': sum(summary['converted_tokens'] for summary in summaries.values()),
+        'rejections': dict(sorted(rejections.items())),
+    }
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'files': summaries, 'total': total}, f, indent=2)
+    os.replace(tmp_path, path)
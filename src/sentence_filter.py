@@ -0,0 +1,164 @@
+"""
+Optional stages that choose the sentences to convert before they are validated and converted, for noisy inputs
+such as web-crawl shards.
+
+SentenceFilter drops the sentences whose sanitized token line (as generate_tokens writes it) was already seen in
+the run (--dedup), and those with fewer than --min_tokens tokens. The token lines seen are remembered as hashes
+in a Bloom filter of --dedup_mb megabytes shared by all the files of the run, so memory stays bounded whatever
+the corpus size; the price is that a small fraction of unique sentences (the false positive rate of the filter,
+logged per file) is dropped as well.
+
+sample_blocks chooses the sentences of a train file with length-bucketed reservoir sampling (--sample_train)
+instead of taking the sentences from the start of the file until --train_token_num tokens. Sentences are put in
+buckets by length (--length_buckets gives the upper bounds), and every bucket gets the share of
+--train_token_num given by --bucket_weights (by default, one bucket). Each bucket keeps the sentences with the
+largest random keys that fit in its token budget, a uniform sample of its sentences. The file is read twice: the
+first pass only keeps (key, block number, length) per sampled sentence, and the second converts the chosen blocks
+in file order. Sentences rejected by validation are always kept (without using the budget), so that the
+rejection statistics of the file stay complete.
+
+With both, the sampling pass leaves out the short sentences and those seen in the files converted before, but only
+the sentences that are sampled are added to the lines seen, by the filter of the second pass, so the files
+converted later only lose the duplicates of sentences that are in the outputs. A sentence repeated within the
+train file can be sampled more than once; its repetitions are then dropped by the second pass.
+"""
+
+import hashlib
+import heapq
+import math
+import random
+from bisect import bisect_left
+from collections import Counter
+try:
+    from .converter import CFContainedError, ContainNoneError, DependencyIndex, generate_tokens, validate_sentence
+except ImportError:
+    from converter import CFContainedError, ContainNoneError, DependencyIndex, generate_tokens, validate_sentence
+
+BLOOM_HASH_NUM = 7
+
+
+class BloomFilter:
+    def __init__(self, size_bytes, hash_num=BLOOM_HASH_NUM):
+        self.bits = bytearray(max(size_bytes, 1))
+        self.bit_num = len(self.bits) * 8
+        self.hash_num = hash_num
+        self.item_num = 0
+
+    # Return True if the 16-byte digest was (probably) added before, without adding it.
+    def contains(self, digest):
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return all(self.bits[position >> 3] & 1 << (position & 7)
+                   for position in ((h1 + i * h2) % self.bit_num for i in range(self.hash_num)))
+
+    # Add a 16-byte digest; return True if it was (probably) added before.
+    def add(self, digest):
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        seen = True
+        for i in range(self.hash_num):
+            position = (h1 + i * h2) % self.bit_num
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                seen = False
+                self.bits[position >> 3] |= mask
+        if not seen:
+            self.item_num += 1
+        return seen
+
+    # The probability that an unseen digest is reported as seen, with the digests added so far.
+    def false_positive_rate(self):
+        return (1 - math.exp(-self.hash_num * self.item_num / self.bit_num)) ** self.hash_num
+
+
+class SentenceFilter:
+    def __init__(self, dedup_mb=0, min_tokens=0):
+        self.seen = BloomFilter(int(dedup_mb * (1 << 20))) if dedup_mb else None
+        self.min_tokens = min_tokens
+
+    # 'duplicate' or 'short' if the sentence should be dropped, else None. Sentences whose forms cannot be
+    # sanitized are kept, for validation to reject them. With remember=False, the token line of a kept sentence is
+    # not added to the lines seen (for the sampling pass, whose sentences are not all written).
+    def drop_reason(self, sentence, remember=True):
+        try:
+            tokens = generate_tokens(sentence)
+        except (CFContainedError, ContainNoneError):
+            return None
+        if self.min_tokens and len(tokens.split(' ')) < self.min_tokens:
+            return 'short'
+        if self.seen is not None:
+            digest = hashlib.blake2b(tokens.encode('utf-8'), digest_size=16).digest()
+            seen = self.seen.add(digest) if remember else self.seen.contains(digest)
+            if seen:
+                return 'duplicate'
+        return None
+
+    # Yield the (block number, sentence) pairs of numbered_sentences that are not dropped, calling
+    # on_drop(block number, reason) for the dropped ones. The reader may run ahead of the conversions, so callers
+    # that save checkpoints count the drops once the conversions have passed them.
+    def filter(self, numbered_sentences, on_drop, remember=True):
+        for block_num, sentence in numbered_sentences:
+            reason = self.drop_reason(sentence, remember)
+            if reason is None:
+                yield block_num, sentence
+            else:
+                on_drop(block_num, reason)
+
+
+# The token budget of every bucket: token_num split by the weights (equal weights by default).
+def bucket_budgets(token_num, bucket_num, weights=None):
+    weights = weights or [1.0] * bucket_num
+    if len(weights) != bucket_num:
+        raise ValueError(f'{bucket_num} length buckets need {bucket_num} weights, not {len(weights)}.')
+    return [token_num * weight / sum(weights) for weight in weights]
+
+
+# Choose the blocks to convert among numbered_sentences (see the module docstring). Return the sorted block
+# numbers and the counts of the sentences the filter dropped, of the sampled sentences and of all the sentences.
+def sample_blocks(numbered_sentences, token_num, bucket_bounds, weights=None, rng=None, sentence_filter=None):
+    rng = rng or random.Random(0)
+    budgets = bucket_budgets(token_num, len(bucket_bounds) + 1, weights)
+    reservoirs = [[] for _ in budgets]
+    bucket_tokens = [0] * len(budgets)
+    chosen = []
+    counts = Counter()
+
+    def count_sentences(numbered_sentences):
+        for numbered_sentence in numbered_sentences:
+            counts['corpus_sentences'] += 1
+            yield numbered_sentence
+
+    numbered_sentences = count_sentences(numbered_sentences)
+    # the sentences seen before this file are not sampled; the lines of the sampled ones are only remembered when
+    # they are converted (see the module docstring)
+    if sentence_filter is not None:
+        numbered_sentences = sentence_filter.filter(
+            numbered_sentences, lambda block_num, reason: counts.update([reason]), remember=False)
+    for block_num, sentence in numbered_sentences:
+        if validate_sentence(DependencyIndex(sentence)) is not None:
+            chosen.append(block_num)
+            continue
+        length = len(sentence)
+        bucket = bisect_left(bucket_bounds, length)
+        heapq.heappush(reservoirs[bucket], (rng.random(), block_num, length))
+        bucket_tokens[bucket] += length
+        while bucket_tokens[bucket] > budgets[bucket]:
+            _, _, dropped_length = heapq.heappop(reservoirs[bucket])
+            bucket_tokens[bucket] -= dropped_length
+    for reservoir in reservoirs:
+        chosen += [block_num for _, block_num, _ in reservoir]
+    counts['sampled_sentences'] = sum(len(reservoir) for reservoir in reservoirs)
+    counts['sampled_tokens'] = sum(bucket_tokens)
+    return sorted(chosen), counts
+
+
+# Yield the (block number, sentence) pairs of numbered_sentences whose block number is in the sorted block_nums.
+def select_blocks(numbered_sentences, block_nums):
+    position = 0
+    for block_num, sentence in numbered_sentences:
+        while position < len(block_nums) and block_nums[position] < block_num:
+            position += 1
+        if position == len(block_nums):
+            return
+        if block_nums[position] == block_num:
+            yield block_num, sentence
@@ -0,0 +1,180 @@
+"""
+Per-file sentence offset index, stored in a sidecar file next to the CoNLL-U file (`<file>.idx`).
+
+For every sentence, the index records the byte span of its block, its number of token lines (including
+multiword tokens and empty nodes, i.e. len(sentence)) and its sent_id. With it, a reader can seek straight to a
+sentence range (to resume a run, to split a file into shards, ...) and token cutoffs can be computed from the
+cumulative token counts without parsing anything.
+
+The sidecar is a fixed header followed by flat arrays of unsigned 64-bit integers and the concatenated sent_ids:
+
+    header:     magic, sentence number n, size and mtime (ns) of the indexed file
+    starts:     n byte offsets where the sentence blocks start
+    ends:       n byte offsets just after the last line of each block
+    tokens:     n + 1 cumulative token counts (tokens[i] tokens come before sentence i)
+    id_offsets: n + 1 offsets of the sent_ids in the id blob
+    id blob:    utf-8 sent_ids (empty for sentences without one)
+
+It is written with the array module and loaded with mmap, so opening the index of a large file does not read it.
+"""
+
+import bisect
+import io
+import mmap
+import os
+import stat
+import struct
+import tempfile
+from array import array
+
+INDEX_SUFFIX = '.idx'
+MAGIC = b'CONLLIDX'
+HEADER = struct.Struct('<8sQQQ')
+
+
+def index_path(source_path):
+    return f'{source_path}{INDEX_SUFFIX}'
+
+
+def source_signature(source_path):
+    stat = os.stat(source_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def parse_sent_id(line):
+    key, sep, value = line[1:].partition(b'=')
+    if sep and key.strip() == b'sent_id':
+        return value.strip()
+    return None
+
+
+# Scan the file once and write its index. Blocks are delimited like read_conllu_blocks does
+# (lines that are empty after stripping ASCII whitespace separate them).
+def build_index(source_path, target_path=None):
+    starts, ends = array('Q'), array('Q')
+    tokens, id_offsets = array('Q', [0]), array('Q', [0])
+    ids = bytearray()
+    token_num = 0
+
+    def add_sentence(start, end, sentence_token_num, sent_id):
+        starts.append(start)
+        ends.append(end)
+        tokens.append(tokens[-1] + sentence_token_num)
+        ids.extend(sent_id)
+        id_offsets.append(len(ids))
+
+    with open(source_path, 'rb') as f:
+        offset = 0
+        start = None
+        for line in f:
+            stripped = line.strip()
+            if stripped:
+                if start is None:
+                    start, token_num, sent_id = offset, 0, b''
+                if stripped[:1] == b'#':
+                    sent_id = parse_sent_id(stripped) or sent_id
+                else:
+                    token_num += 1
+            elif start is not None:
+                add_sentence(start, offset, token_num, sent_id)
+                start = None
+            offset += len(line)
+        if start is not None:
+            add_sentence(start, offset, token_num, sent_id)
+
+    target_path = target_path or index_path(source_path)
+    size, mtime_ns = source_signature(source_path)
+    # a temporary file of its own, as other processes may be building the same index at the same time
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{os.path.basename(target_path)}.', suffix='.tmp',
+                                    dir=os.path.dirname(target_path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(starts), size, mtime_ns))
+            for values in [starts, ends, tokens, id_offsets]:
+                values.tofile(f)
+            f.write(ids)
+        # readable by whoever can read the source file, rather than by its owner only
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(source_path).st_mode) & 0o666)
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return target_path
+
+
+class SentenceIndex:
+    def __init__(self, source_path, sidecar_path=None):
+        self.source_path = source_path
+        with open(sidecar_path or index_path(source_path), 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, self.source_size, self.source_mtime_ns = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            self.mm.close()
+            raise ValueError(f'Not a sentence index: {sidecar_path or index_path(source_path)}')
+        self.view = memoryview(self.mm)
+        position = HEADER.size
+        arrays = []
+        for length in [n, n, n + 1, n + 1]:
+            arrays.append(self.view[position:position + 8 * length].cast('Q'))
+            position += 8 * length
+        self.starts, self.ends, self.tokens, self.id_offsets = arrays
+        self.ids = self.view[position:]
+
+    # Load the index of source_path, building (or rebuilding, if the file changed since) the sidecar first.
+    # The sidecar is <source_path>.idx unless another sidecar_path is given.
+    @classmethod
+    def open(cls, source_path, sidecar_path=None):
+        path = sidecar_path or index_path(source_path)
+        if os.path.exists(path):
+            index = cls(source_path, path)
+            if index.is_current():
+                return index
+            index.close()
+        build_index(source_path, path)
+        return cls(source_path, path)
+
+    def is_current(self):
+        return (self.source_size, self.source_mtime_ns) == source_signature(self.source_path)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def token_num(self, first=0, last=None):
+        last = len(self) if last is None else last
+        return self.tokens[last] - self.tokens[first]
+
+    def sent_id(self, i):
+        sent_id = bytes(self.ids[self.id_offsets[i]:self.id_offsets[i + 1]]).decode('utf-8')
+        return sent_id or None
+
+    # The end (exclusive) of the shortest range of sentences from `first` on with more than token_num tokens,
+    # or len(self) if the rest of the file does not have that many tokens.
+    def token_cutoff(self, first, token_num):
+        last = bisect.bisect_right(self.tokens, self.tokens[first] + token_num, first + 1)
+        return min(last, len(self))
+
+    # A text stream of the source file positioned at the start of sentence `first`.
+    def open_at(self, first):
+        f = open(self.source_path, 'rb')
+        if first < len(self):
+            f.seek(self.starts[first])
+        else:
+            f.seek(0, 2)
+        return io.TextIOWrapper(f, encoding='utf-8')
+
+    def close(self):
+        for view in [self.starts, self.ends, self.tokens, self.id_offsets, self.ids, self.view]:
+            view.release()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Parse a "first:last" sentence range (either side may be empty) into (first, last), with last None for the end.
+def parse_sentence_range(sentence_range):
+    first, _, last = sentence_range.partition(':')
+    return int(first or 0), int(last) if last else None
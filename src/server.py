@@ -0,0 +1,236 @@
+"""
+Long-running conversion service, so that jobs converting parser output on the fly do not start a process (and
+import the converter) per batch.
+
+    python -m src serve --unix_socket /tmp/dep-to-const.sock --workers 4
+    python -m src serve --port 8765
+
+The protocol is newline-delimited JSON. A request is one line:
+
+    {"id": 1, "method": "left", "label": "POS", "conllu": "<CoNLL-U sentences>"}
+    {"id": 2, "method": "flat", "label": "X", "path": "/data/dev.conllu"}
+
+and the answer is one line per sentence, in order,
+
+    {"id": 1, "index": 0, "tree": "(VERBP ...)", "tokens": "I heard a noise"}
+    {"id": 1, "index": 1, "rejection": "nonproj"}
+
+followed by a summary line with the counts and the latency of the request:
+
+    {"id": 1, "done": true, "sentences": 2, "converted": 1, "first_result_ms": 3.1, "latency_ms": 3.4}
+
+A request line may be up to --max_request_mb megabytes (64 by default); a longer one is answered with an error
+line, {"id": null, "error": ...}, and the connection is closed. Clients should open their connection with a
+matching stream limit too, e.g. asyncio.open_connection(..., limit=64 << 20), as the answer line of a very long
+sentence can exceed the 64 KiB default of asyncio as well.
+
+Sentences are converted in chunks of --chunk_size on a pool of --workers processes. The processes are started
+and warmed up (converter functions, label tables) once, when the server starts. Each connection keeps at most
+two chunks per worker in flight and waits for the client to read the answers before converting more, so a slow
+client does not make the server buffer its whole input. Requests on one connection are answered in order.
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+try:
+    from .conllu_reader import LightSentence, read_conllu_blocks
+    from .converter import CONVERTERS, LABEL_FUNCTIONS
+    from .generate_dataset import convert_chunk, logger
+except ImportError:
+    from conllu_reader import LightSentence, read_conllu_blocks
+    from converter import CONVERTERS, LABEL_FUNCTIONS
+    from generate_dataset import convert_chunk, logger
+
+WARM_UP_SENTENCE = ['1\tA\ta\tDET\t_\t_\t2\tdet\t_\t_', '2\tb\tb\tNOUN\t_\t_\t0\troot\t_\t_']
+
+
+def build_parser(prog=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--unix_socket', default='')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=8765, type=int)
+    # 0 converts in a thread of the server process
+    parser.add_argument('--workers', default=os.cpu_count() or 1, type=int)
+    parser.add_argument('--chunk_size', default=200, type=int)
+    parser.add_argument('--max_request_mb', default=64, type=float)
+    return parser
+
+
+# Run in every worker process when it starts: convert a sentence with every method and label, so that the
+# modules, label tables and caches are loaded before the first request.
+def warm_up():
+    functions = [(converter, get_nt) for converter in CONVERTERS.values() for get_nt in LABEL_FUNCTIONS.values()]
+    convert_chunk([LightSentence(WARM_UP_SENTENCE)], functions, False)
+
+
+def convert_blocks(blocks, functions):
+    return convert_chunk([LightSentence(lines) for lines in blocks], functions, False)
+
+
+# The sentence blocks of CoNLL-U text, split like read_conllu_blocks does.
+def iter_text_blocks(text):
+    sentence_lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            sentence_lines.append(line)
+        elif sentence_lines:
+            yield sentence_lines
+            sentence_lines = []
+    if sentence_lines:
+        yield sentence_lines
+
+
+class ConversionServer:
+    def __init__(self, workers=1, chunk_size=200, max_request_mb=64):
+        self.chunk_size = chunk_size
+        self.request_limit = int(max_request_mb * (1 << 20))
+        self.max_pending = 2 * max(workers, 1)
+        if workers > 0:
+            self.executor = ProcessPoolExecutor(workers, initializer=warm_up)
+            # start (and warm up) the processes now rather than on the first request
+            for future in [self.executor.submit(warm_up) for _ in range(workers)]:
+                future.result()
+        else:
+            self.executor = ThreadPoolExecutor(1, initializer=warm_up)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self.handle_request(line, writer)
+        except ConnectionError:
+            pass
+        except ValueError as e:
+            # a request line longer than the stream limit: the rest of it cannot be told from the next request
+            try:
+                await send(writer, {'id': None, 'error': f'{type(e).__name__}: {e}'})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line, writer):
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            functions = [(CONVERTERS[request.get('method', 'flat')], LABEL_FUNCTIONS[request.get('label', 'X')])]
+            if 'conllu' in request:
+                blocks = iter_text_blocks(request['conllu'])
+            else:
+                blocks = read_conllu_blocks(request['path'])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            await send(writer, {'id': request_id, 'error': f'{type(e).__name__}: {e}'})
+            return
+
+        loop = asyncio.get_running_loop()
+        sentence_num = converted_num = 0
+        first_result = None
+        pending = []
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, list, islice(blocks, self.chunk_size))
+                if chunk:
+                    pending.append(loop.run_in_executor(self.executor, convert_blocks, chunk, functions))
+                if pending and (len(pending) >= self.max_pending or not chunk):
+                    for rejection, result, _ in await pending.pop(0):
+                        if rejection is None:
+                            phrase_structures, tokens = result[:2]
+                            answer = {'id': request_id, 'index': sentence_num,
+                                      'tree': phrase_structures[0], 'tokens': tokens}
+                            converted_num += 1
+                        else:
+                            answer = {'id': request_id, 'index': sentence_num, 'rejection': rejection}
+                        writer.write(json_line(answer))
+                        sentence_num += 1
+                    if first_result is None:
+                        first_result = time.perf_counter()
+                    # backpressure: wait until the client has read enough of the answers
+                    await writer.drain()
+                if not chunk and not pending:
+                    break
+        except Exception as e:
+            # any failure of the request is answered, so that the client does not wait for a summary
+            for future in pending:
+                future.cancel()
+            if not isinstance(e, (OSError, ValueError)):
+                logger.exception(f'Request {request_id} failed.')
+            await send(writer, {'id': request_id, 'error': f'{type(e).__name__}: {e}'})
+            return
+        finally:
+            # the source file of a path request is closed even if the request stopped before its end
+            blocks.close()
+
+        end = time.perf_counter()
+        latency_ms = (end - start) * 1000
+        logger.info(f'Request {request_id}: {sentence_num} sentences, {converted_num} converted, '
+                    f'{latency_ms:.1f} ms.')
+        await send(writer, {
+            'id': request_id, 'done': True, 'sentences': sentence_num, 'converted': converted_num,
+            'first_result_ms': ((first_result or end) - start) * 1000, 'latency_ms': latency_ms,
+        })
+
+    async def start(self, unix_socket='', host='127.0.0.1', port=8765):
+        if unix_socket:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_socket, limit=self.request_limit)
+        return await asyncio.start_server(self.handle_connection, host, port, limit=self.request_limit)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def json_line(message):
+    return (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+async def send(writer, message):
+    writer.write(json_line(message))
+    await writer.drain()
+
+
+# Client side: send a request on a connection and yield its answer lines, up to and including the summary
+# (or error) line.
+async def request(reader, writer, message):
+    await send(writer, message)
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('The server closed the connection.')
+        answer = json.loads(line)
+        yield answer
+        if answer.get('done') or 'error' in answer:
+            return
+
+
+async def serve(args):
+    conversion_server = ConversionServer(args.workers, args.chunk_size, args.max_request_mb)
+    try:
+        server = await conversion_server.start(args.unix_socket, args.host, args.port)
+        logger.info(f'Serving on {args.unix_socket or f"{args.host}:{args.port}"} with {args.workers} workers.')
+        async with server:
+            await server.serve_forever()
+    finally:
+        conversion_server.close()
+
+
+def main(argv=None, prog=None):
+    args = build_parser(prog).parse_args(argv)
+    from logging import StreamHandler
+    logger.addHandler(StreamHandler())
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,70 +1,206 @@
 """
 input:  conllu file
 output: train / dev / test set
+
+Sentence blocks are copied as raw bytes (no pyconll round-trip) from a memory-mapped source file.
+Several shards (--id) are split in parallel processes.
+
+split policies:
+    head:  the first --sent sentences go to dev, the next --sent sentences to test, and the rest to train
+    ratio: sentences are interleaved so that --dev_ratio / --test_ratio of them go to dev / test
+    hash:  a sentence goes to dev / test / train according to the hash of its content, so the split of a
+           sentence does not depend on its position (stable across reshuffled or reshared inputs)
+
+With --sentence_range or --train_token_num, the sentence offset index of the source file (see sentence_index.py)
+is used: the split starts directly at the first sentence of the range, and train stops once it has more than
+--train_token_num tokens, counted from the index without parsing the sentences.
 """
 
+import hashlib
+import mmap
 import os
-import argparse
-import pyconll
 from pathlib import Path
+try:
+    from .sentence_index import SentenceIndex, parse_sentence_range
+except ImportError:
+    from sentence_index import SentenceIndex, parse_sentence_range
 
 SENT = 80
+WRITE_BUFFER_SIZE = 1 << 22
+BLANK_STARTS = {b' ', b'\t', b'\r', b'\n', b'\x0b', b'\x0c'}
+
+
+# Yield every sentence block of the file as bytes, including the line break of its last line.
+# Blocks are separated by blank lines, i.e. lines with only whitespace (such as the '\r' of CRLF files), like in
+# read_conllu_blocks and build_index.
+def iter_raw_blocks(source_path):
+    with open(source_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            position = 0
+            start = None
+            while position < size:
+                line_end = mm.find(b'\n', position)
+                line_end = size if line_end == -1 else line_end + 1
+                # most lines start with a non-space byte, and only the others need to be stripped
+                blank = mm[position:position + 1] in BLANK_STARTS and not mm[position:line_end].strip()
+                if blank and start is not None:
+                    yield mm[start:position]
+                    start = None
+                elif not blank and start is None:
+                    start = position
+                position = line_end
+            if start is not None:
+                block = mm[start:size]
+                yield block if block.endswith(b'\n') else block + b'\n'
+
+
+# Yield (i, block, token number) for the sentences first <= i < last of an indexed file.
+def iter_indexed_blocks(source_path, index, first, last):
+    # an empty file (which has no sentences) cannot be memory-mapped
+    if first >= last:
+        return
+    with open(source_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i in range(first, last):
+            block = mm[index.starts[i]:index.ends[i]]
+            yield i, block if block.endswith(b'\n') else block + b'\n', index.token_num(i, i + 1)
+
+
+def head_policy(sent):
+    def assign(i, block):
+        if i < sent:
+            return 'dev'
+        if i < 2 * sent:
+            return 'test'
+        return 'train'
+    return assign
+
+
+def ratio_policy(dev_ratio, test_ratio):
+    assigned = {'dev': 0, 'test': 0}
+
+    def assign(i, block):
+        # a split takes the sentence when it is behind its share of the first i + 1 sentences
+        for split, ratio in [('dev', dev_ratio), ('test', test_ratio)]:
+            if assigned[split] < int((i + 1) * ratio + 1e-9):
+                assigned[split] += 1
+                return split
+        return 'train'
+    return assign
+
+
+def hash_policy(dev_ratio, test_ratio):
+    def assign(i, block):
+        bucket = int.from_bytes(hashlib.blake2b(block, digest_size=8).digest(), 'big') / 2**64
+        if bucket < dev_ratio:
+            return 'dev'
+        if bucket < dev_ratio + test_ratio:
+            return 'test'
+        return 'train'
+    return assign
 
 
-def tdt_split(source_path, train_path, dev_path, test_path):
-    # it's danger to load corpus as a whole...
-    # corpus = pyconll.load_from_file(source_path)
-    dev_test_sentences = SENT
-    get_dev = True
-    get_test = False
-    sentence_num = 0
-    with open(source_path, 'r') as inputconllu, \
-         open(train_path, 'w')  as trainfile, \
-         open(dev_path, 'w')    as devfile, \
-         open(test_path, 'w')   as testfile:
-        while True:
-            conllu_str = ""
-            while True:
-                line = inputconllu.readline()
-                conllu_str += line
-                if line == "\n" or line == "":
-                    break
-            if line == "":
-                break
-            sentence = pyconll.load.load_from_string(conllu_str)[0]
-            sentence_num += 1
-            if get_dev:
-                devfile.write(sentence.conll())
-                devfile.write('\n\n')
-                if sentence_num == dev_test_sentences:
-                    sentence_num = 0
-                    get_dev = False
-                    get_test = True
-            elif get_test:
-                testfile.write(sentence.conll())
-                testfile.write('\n\n')
-                if sentence_num == dev_test_sentences:
-                    sentence_num = 0
-                    get_test = False
-            else:
-                trainfile.write(sentence.conll())
-                trainfile.write('\n\n')
+def make_policy(policy, sent=SENT, dev_ratio=0.01, test_ratio=0.01):
+    if policy == 'head':
+        return head_policy(sent)
+    if policy == 'ratio':
+        return ratio_policy(dev_ratio, test_ratio)
+    if policy == 'hash':
+        return hash_policy(dev_ratio, test_ratio)
+    raise ValueError(f'Unknown split policy: {policy}')
+
+
+def tdt_split(source_path, train_path, dev_path, test_path, policy='head',
+              sent=SENT, dev_ratio=0.01, test_ratio=0.01, sentence_range=None,
+              train_token_num=None):
+    assign = make_policy(policy, sent, dev_ratio, test_ratio)
+    with open(train_path, 'wb', buffering=WRITE_BUFFER_SIZE) as trainfile, \
+         open(dev_path, 'wb', buffering=WRITE_BUFFER_SIZE)   as devfile, \
+         open(test_path, 'wb', buffering=WRITE_BUFFER_SIZE)  as testfile:
+        outputs = {'train': trainfile, 'dev': devfile, 'test': testfile}
+        if sentence_range is None and train_token_num is None:
+            for i, block in enumerate(iter_raw_blocks(source_path)):
+                output = outputs[assign(i, block)]
+                output.write(block)
+                output.write(b'\n')
+            return
+
+        with SentenceIndex.open(source_path) as index:
+            first, last = parse_sentence_range(sentence_range or ':')
+            last = len(index) if last is None else min(last, len(index))
+            if policy == 'head' and train_token_num is not None:
+                # train is the tail of the range, so its cutoff is known before reading anything
+                last = min(last, index.token_cutoff(min(first + 2 * sent, last), train_token_num))
+            train_tokens = 0
+            for i, block, token_num in iter_indexed_blocks(source_path, index, first, last):
+                split = assign(i - first, block)
+                if split == 'train':
+                    if train_token_num is not None and train_tokens > train_token_num:
+                        continue
+                    train_tokens += token_num
+                outputs[split].write(block)
+                outputs[split].write(b'\n')
     return
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+
+# --id accepts single shard ids and ranges, e.g. "3", "0-15" or "0-3,8".
+def parse_shard_ids(ids):
+    shard_ids = []
+    for part in ids.split(','):
+        first, _, last = part.partition('-')
+        shard_ids += [str(i) for i in range(int(first), int(last or first) + 1)]
+    return shard_ids
+
+
+def split_shard(data_path, shard_id, policy, sent, dev_ratio, test_ratio,
+                sentence_range=None, train_token_num=None):
+    source_path = Path(f'{data_path}/{shard_id.zfill(2)}.conllu')
+    train_path = Path(f'{data_path}/{shard_id.zfill(2)}/train.conllu')
+    dev_path = Path(f'{data_path}/{shard_id.zfill(2)}/dev.conllu')
+    test_path = Path(f'{data_path}/{shard_id.zfill(2)}/test.conllu')
+
+    train_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tdt_split(source_path, train_path, dev_path, test_path, policy, sent,
+              dev_ratio, test_ratio, sentence_range, train_token_num)
+    return shard_id
+
+
+def build_parser(prog=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog)
     parser.add_argument('--lang', default='en')
     parser.add_argument('--id', default='0')
+    # the shards of a language are read from <data_path>/<lang>/<id>.conllu
+    parser.add_argument('--data_path', required=True)
+    parser.add_argument('--policy', default='head', choices=['head', 'ratio', 'hash'])
+    parser.add_argument('--sent', default=SENT, type=int)
+    parser.add_argument('--dev_ratio', default=0.01, type=float)
+    parser.add_argument('--test_ratio', default=0.01, type=float)
+    parser.add_argument('--workers', default=1, type=int)
+    # split only the sentences first:last of every shard, e.g. 0:1000000
+    parser.add_argument('--sentence_range', default=None)
+    parser.add_argument('--train_token_num', default=None, type=int)
+    return parser
 
-    args = parser.parse_args()
 
-    data_path = Path(f'/groups/gab50271/aac13111kt/resource/wiki-pre/split/LM_dataset/{args.lang}')
-    source_path = Path(f'{data_path}/{args.id.zfill(2)}.conllu')
-    train_path = Path(f'{data_path}/{args.id.zfill(2)}/train.conllu')
-    dev_path = Path(f'{data_path}/{args.id.zfill(2)}/dev.conllu')
-    test_path = Path(f'{data_path}/{args.id.zfill(2)}/test.conllu')
+def main(argv=None, prog=None):
+    args = build_parser(prog).parse_args(argv)
 
-    train_path.parent.mkdir(parents=True, exist_ok=True)
+    data_path = Path(f'{args.data_path}/{args.lang}')
+    shard_args = [(data_path, shard_id, args.policy, args.sent, args.dev_ratio, args.test_ratio,
+                   args.sentence_range, args.train_token_num)
+                  for shard_id in parse_shard_ids(args.id)]
+    if args.workers > 1:
+        from multiprocessing import Pool
+        with Pool(args.workers) as pool:
+            pool.starmap(split_shard, shard_args)
+    else:
+        for shard in shard_args:
+            split_shard(*shard)
 
-    tdt_split(source_path, train_path, dev_path, test_path)
 
+if __name__ == '__main__':
+    main()
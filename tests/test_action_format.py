@@ -0,0 +1,62 @@
+import pyconll
+
+from src.action_format import *
+from src.conllu_reader import LightSentence
+from src.converter import *
+from tests.test_converter import ROOT_NONPROJ, SAMPLE_CONLLU
+from tests.test_generate_dataset import SENTENCES, run_conversion, write_corpus
+
+FUNCTIONS = [(converter, get_nt) for converter in [flat_converter, left_converter, right_converter]
+             for get_nt in [get_X_nt, get_pos_nt, get_merge_pos_nt, get_dep_nt]]
+
+
+def fixture_sentences():
+    sentences = [pyconll.load.load_from_string(conllu)[0] for conllu in [SAMPLE_CONLLU, ROOT_NONPROJ]]
+    sentences += [LightSentence(sentence.split('\n')) for sentence in SENTENCES]
+    # a multiword token and a form with brackets and a space
+    sentences.append(LightSentence([
+        '1-2\tdon\'t\t_\t_\t_\t_\t_\t_\t_\t_', '1\tdo\tdo\tAUX\t_\t_\t3\taux\t_\t_',
+        '2\tn\'t\tnot\tPART\t_\t_\t3\tadvmod\t_\t_', '3\tgo (away)\tgo\tVERB\t_\t_\t0\troot\t_\t_',
+        '4\tnow\tnow\tADV\t_\t_\t3\tadvmod\t_\t_']))
+    return sentences
+
+
+def test_actions_decode_to_text():
+    tree_num = 0
+    for sentence in fixture_sentences():
+        index = DependencyIndex(sentence)
+        if validate_sentence(index) is not None:
+            continue
+        for converter, get_nt in FUNCTIONS:
+            words, leaf_labels, actions = convert_actions(converter, sentence, get_nt, index)
+            assert decode_actions(words, leaf_labels, actions) == convert_validated(converter, sentence, get_nt, index)
+            assert actions.count(SHIFT) == len(words) == len(leaf_labels)
+            tree_num += 1
+    assert tree_num == 4 * len(FUNCTIONS)
+
+
+def test_action_file_round_trip(tmp_path):
+    sentences = [sentence for sentence in fixture_sentences() if validate_sentence(DependencyIndex(sentence)) is None]
+    with ActionWriter(tmp_path / 'trees') as writer:
+        for sentence in sentences:
+            writer.write(*convert_actions(left_converter, sentence, get_dep_nt, DependencyIndex(sentence)))
+    with ActionReader(tmp_path / 'trees') as reader:
+        decoded = [reader.decode(record) for record in reader]
+        assert all(isinstance(part, memoryview) for record in reader for part in record)
+    assert decoded == [convert_validated(left_converter, sentence, get_dep_nt, DependencyIndex(sentence))
+                       for sentence in sentences]
+
+
+def test_empty_action_file(tmp_path):
+    ActionWriter(tmp_path / 'empty').close()
+    with ActionReader(tmp_path / 'empty') as reader:
+        assert list(reader) == []
+
+
+def test_conversion_writes_actions(tmp_path):
+    write_corpus(tmp_path / 'source', 'dev', 20)
+    outputs, _ = run_conversion(tmp_path, 'actions', ['--write_actions'],
+                                method_args=('--convert_methods', 'flat', 'right', '--label_methods', 'X', 'POS'))
+    for method_str in ['flat-X', 'right-POS']:
+        with ActionReader(tmp_path / 'actions' / method_str / 'dev') as reader:
+            assert [reader.decode(record) for record in reader] == outputs[f'{method_str}/dev.txt'].splitlines()
@@ -0,0 +1,33 @@
+import pytest
+
+from src import convert_stream, convert_file
+from src.__main__ import cli, main
+from src.converter import NonProjError
+from tests.test_generate_dataset import SENTENCES
+
+
+def test_convert_stream():
+    blocks = [SENTENCES[0], SENTENCES[1], SENTENCES[3]]
+    assert list(convert_stream(blocks, method='left', label='POS')) == [
+        '(VERBP (PRONP I) (VERBP (VERBP heard) (NOUNP (DETP a) (NOUNP noise))))',
+        '(INTJP (INTJP Yes))',
+    ]
+    with pytest.raises(NonProjError):
+        list(convert_stream(blocks, errors='raise'))
+
+
+def test_convert_file(tmp_path):
+    source_path = tmp_path / 'dev.conllu'
+    source_path.write_text('\n\n'.join(SENTENCES) + '\n')
+    assert list(convert_file(source_path, label='DEP')) == list(convert_stream(SENTENCES, label='DEP'))
+
+
+def test_main_needs_a_command(capsys):
+    assert main([]) == 2
+    assert 'convert' in capsys.readouterr().err
+
+
+def test_console_script_usage(capsys, monkeypatch):
+    monkeypatch.setattr('sys.argv', ['dep-to-const'])
+    assert cli() == 2
+    assert capsys.readouterr().err.startswith('usage: dep-to-const {convert,split,serve}')
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+import pyconll
+
+pytest.importorskip('numpy')
+
+from src.batch_converter import convert_batch
+from src.conllu_reader import LightSentence
+from src.converter import *
+from tests.test_converter import ROOT_NONPROJ, SAMPLE_CONLLU
+from tests.test_generate_dataset import SENTENCES
+
+FUNCTIONS = [(converter, get_nt) for converter in [flat_converter, left_converter, right_converter]
+             for get_nt in [get_X_nt, get_pos_nt, get_merge_pos_nt, get_dep_nt]]
+
+
+def python_engine(sentence):
+    index = DependencyIndex(sentence)
+    rejection = validate_sentence(index)
+    if rejection is not None:
+        return rejection, None, None
+    return (None, [converter(sentence, index.root, get_nt, index).rstrip() for converter, get_nt in FUNCTIONS],
+            generate_tokens(sentence))
+
+
+def attach_spans(rng, heads, lo, hi, parent, single=False):
+    while lo <= hi:
+        end = hi if single else rng.randint(lo, hi)
+        head = rng.randint(lo, end)
+        heads[head] = parent
+        attach_spans(rng, heads, lo, head - 1, head)
+        attach_spans(rng, heads, head + 1, end, head)
+        lo = end + 1
+
+
+# A random projective tree, with one token reattached to a random head (often non-projective, or a cycle) in a
+# third of the sentences, and some multiword tokens.
+def random_sentence(rng, max_length=30):
+    length = rng.randint(1, max_length)
+    heads = [0] * (length + 1)
+    attach_spans(rng, heads, 1, length, 0, single=True)
+    if length > 1 and rng.random() < 0.3:
+        dependent = rng.choice([i for i in range(1, length + 1) if heads[i] != 0])
+        heads[dependent] = rng.choice([i for i in range(1, length + 1) if i != dependent])
+    lines = []
+    for i in range(1, length + 1):
+        if i < length and rng.random() < 0.05:
+            lines.append(f'{i}-{i + 1}\tab\t_\t_\t_\t_\t_\t_\t_\t_')
+        deprel = 'root' if heads[i] == 0 else rng.choice(['nsubj', 'obj', 'amod', 'nmod:poss'])
+        form = rng.choice(['a', '(b)', 'c d', 'e'])
+        upos = rng.choice(['NOUN', 'DET', 'PRON', 'VERB'])
+        lines.append(f'{i}\t{form}\t_\t{upos}\t_\t_\t{heads[i]}\t{deprel}\t_\t_')
+    return LightSentence(lines)
+
+
+def test_batch_matches_python_engine():
+    sentences = [pyconll.load.load_from_string(conllu)[0] for conllu in [SAMPLE_CONLLU, ROOT_NONPROJ]]
+    sentences += [LightSentence(sentence.split('\n')) for sentence in SENTENCES]
+    rng = random.Random(0)
+    sentences += [random_sentence(rng) for _ in range(500)]
+    results = convert_batch(sentences, FUNCTIONS)
+    assert results == [python_engine(sentence) for sentence in sentences]
+    assert {rejection for rejection, _, _ in results} >= {None, 'nonproj', 'root_nonproj', 'cfcontained'}
+
+
+def test_long_sentences_match_python_engine():
+    rng = random.Random(1)
+    sentences = [random_sentence(rng, 400) for _ in range(30)]
+    assert convert_batch(sentences, FUNCTIONS[:2]) == [
+        (rejection, structures and structures[:2], tokens)
+        for rejection, structures, tokens in map(python_engine, sentences)]
+
+
+def test_batch_general_converter():
+    sentence = pyconll.load.load_from_string(SAMPLE_CONLLU)[0]
+    nonproj_sentence = pyconll.load.load_from_string(ROOT_NONPROJ)[0]
+    assert batch_general_converter(left_converter, [sentence, nonproj_sentence], get_pos_nt) == [
+        (None, general_converter(left_converter, sentence, get_pos_nt)), ('root_nonproj', None)]
@@ -0,0 +1,58 @@
+import pyconll
+
+from src.conllu_reader import *
+
+CONLLU = """# newdoc id = doc
+# sent_id = 1
+1	I	I	PRON	_	_	2	nsubj	_	_
+2	heard	hear	VERB	_	_	0	root	_	_
+
+
+# sent_id = 2
+1-2	dont	_	_	_	_	_	_	_	_
+1	do	do	AUX	_	_	3	aux	_	_
+2	n't	not	PART	_	_	3	advmod	_	_
+3	go	go	VERB	_	_	0	root	_	_
+"""
+
+
+def test_iter_sentences_matches_pyconll(tmp_path):
+    source_path = tmp_path / 'sample.conllu'
+    source_path.write_text(CONLLU)
+    streamed = [sentence.conll() for sentence in iter_sentences(source_path, full=True)]
+    loaded = [sentence.conll() for sentence in pyconll.load_from_file(str(source_path))]
+    assert streamed == loaded and len(streamed) == 2
+
+
+def test_light_sentences_match_pyconll(tmp_path):
+    source_path = tmp_path / 'sample.conllu'
+    source_path.write_text(CONLLU)
+    columns = ['id', 'form', 'upos', 'head', 'deprel']
+    for light, full in zip(iter_sentences(source_path),
+                           pyconll.load_from_file(str(source_path))):
+        assert light.id == full.id and len(light) == len(full)
+        for light_token, full_token in zip(light, full):
+            assert [getattr(light_token, c) for c in columns] == [getattr(full_token, c) for c in columns]
+            assert light_token.is_multiword() == full_token.is_multiword()
+
+
+def test_excluded_sentences_are_skipped(tmp_path):
+    source_path = tmp_path / 'sample.conllu'
+    source_path.write_text(CONLLU)
+    assert [sentence.id for sentence in iter_sentences(source_path, exclude_ids={'1'})] == ['2']
+    assert [sentence.id for sentence in iter_sentences(source_path, full=True, exclude_ids={'2'})] == ['1']
+
+
+# sources are UTF-8 like for pyconll.load_from_file, whatever the locale
+def test_utf8_sources_under_c_locale(tmp_path):
+    import os
+    import subprocess
+    import sys
+    source_path = tmp_path / 'sample.conllu'
+    source_path.write_text(CONLLU.replace('heard', 'café'), encoding='utf-8')
+    script = ('import sys; from src.conllu_reader import iter_sentences; '
+              'sys.stdout.buffer.write(iter_sentences(sys.argv[1]).__next__()[1].form.encode("utf-8"))')
+    env = dict(os.environ, LC_ALL='C', LANG='C', PYTHONUTF8='0', PYTHONIOENCODING='ascii')
+    output = subprocess.run([sys.executable, '-c', script, str(source_path)], env=env, check=True,
+                            capture_output=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.decode('utf-8') == 'café'
@@ -0,0 +1,17 @@
+from src.conversion_cache import *
+
+
+def test_store_restore_and_evict(tmp_path):
+    cache = ConversionCache(tmp_path / 'cache', max_bytes=350)
+    output = tmp_path / 'dev.txt'
+    keys = []
+    for i in range(3):
+        output.write_text(f'{i}' * 100)
+        keys.append(cache_key('hash', f'flat-X-{i}', '1', {}))
+        cache.store(keys[-1], {'output.txt': output}, {'log': [f'{i}']})
+
+    # every entry takes about 150 bytes, so only the two most recent ones fit
+    assert cache.lookup(keys[0]) is None
+    assert cache.lookup(keys[2])['log'] == ['2']
+    cache.restore(keys[1], 'output.txt', output)
+    assert output.read_text() == '1' * 100
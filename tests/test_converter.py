@@ -108,3 +108,59 @@ def test_right_dep_converter():
 
 def test_rootcross_included():
     assert not rootcross_included(sentence) and rootcross_included(nonproj_sentence)
+
+
+def test_dependency_index():
+    index = DependencyIndex(sentence)
+    assert index.root is sentence[1]
+    assert index.left_children[2] == [1] and index.right_children[2] == [4, 7]
+    assert index.children(4) == [3, 4, 6]
+
+
+def test_deep_chain_converters():
+    length = 20000
+    lines = []
+    for i in range(1, length + 1):
+        head, deprel = (i + 1, 'dep') if i < length else (0, 'root')
+        lines.append(f'{i}\tw\tw\tNOUN\t_\t_\t{head}\t{deprel}\t_\t_')
+    chain = pyconll.load.load_from_string('\n'.join(lines) + '\n')[0]
+    flat = general_converter(flat_converter, chain, get_X_nt)
+    left = general_converter(left_converter, chain, get_X_nt)
+    right = general_converter(right_converter, chain, get_X_nt)
+    assert flat == left == right
+    assert left.count('(X w)') == length and left.count('(') == 2 * length - 1
+
+
+def test_emit_flat_matches_stack_walk():
+    for test_sentence in [sentence, nonproj_sentence]:
+        index = DependencyIndex(test_sentence)
+        for get_nt in [get_X_nt, get_dep_nt]:
+            assert emit_flat(index, int(index.root.id), get_nt) == emit_bracketing(
+                index, int(index.root.id), get_nt, expand_flat)
+
+
+def test_bracketing_matches_pformat():
+    for converter in [flat_converter, left_converter, right_converter]:
+        for get_nt in [get_X_nt, get_pos_nt, get_merge_pos_nt, get_dep_nt]:
+            phrase_structure = general_converter(converter, sentence, get_nt)
+            assert to_tree(phrase_structure).pformat(margin=1e100) == phrase_structure
+
+
+def test_validate_sentence():
+    assert validate_sentence(DependencyIndex(sentence)) is None
+    assert validate_sentence(DependencyIndex(nonproj_sentence)) == 'root_nonproj'
+    crossing = pyconll.load.load_from_string(SAMPLE_CONLLU.replace('6\tpaper\tpaper\tNOUN\tNN\tNumber=Sing\t4', '6\tpaper\tpaper\tNOUN\tNN\tNumber=Sing\t1'))[0]
+    assert validate_sentence(DependencyIndex(crossing)) == 'nonproj'
+
+
+def test_label_tables():
+    assert [get_merge_pos_nt(token) for token in sentence] == ['NOUNP', 'VERBP', 'NOUNP', 'NOUNP', 'ADPP', 'NOUNP', 'PUNCTP']
+    # tags outside the UD sets are labeled like the precomputed ones
+    assert get_dep_nt(nonproj_sentence[12]) == 'nmod:poss'
+    assert MERGED_POS_LABELS['PROPN'] == 'NOUNP' and POS_LABELS[None] == 'NoneP'
+
+
+def test_tokens_reuse_sanitized_forms():
+    parens = pyconll.load.load_from_string(SAMPLE_CONLLU.replace('\tpaper\t', '\t(paper)\t'))[0]
+    index = DependencyIndex(parens)
+    assert generate_tokens(parens, index) == generate_tokens(parens) == 'I heard a noise like -LRB-paper-RRB- .'
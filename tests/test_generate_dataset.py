@@ -0,0 +1,226 @@
+import json
+import logging
+import time
+
+import pytest
+
+from src.conllu_reader import LightSentence
+from src.generate_dataset import *
+
+# 1: projective, 2: non-projective, 3: crossing above root, 4: single token, 5: Cf character in a form
+SENTENCES = [
+    """1	I	I	PRON	_	_	2	nsubj	_	_
+2	heard	hear	VERB	_	_	0	root	_	_
+3	a	a	DET	_	_	4	det	_	_
+4	noise	noise	NOUN	_	_	2	obj	_	_""",
+    """1	a	a	DET	_	_	3	det	_	_
+2	b	b	NOUN	_	_	4	nsubj	_	_
+3	c	c	NOUN	_	_	4	obj	_	_
+4	d	d	VERB	_	_	0	root	_	_""",
+    """1	That	that	PRON	_	_	3	nsubj	_	_
+2	is	be	AUX	_	_	0	root	_	_
+3	why	why	ADV	_	_	2	advmod	_	_""",
+    """1	Yes	yes	INTJ	_	_	0	root	_	_""",
+    """1	zero​width	z	NOUN	_	_	0	root	_	_""",
+]
+
+
+def write_corpus(source_dir, stem, sentence_num):
+    source_dir.mkdir(parents=True, exist_ok=True)
+    blocks = [
+        f'# sent_id = {stem}-{i}\n{SENTENCES[i % len(SENTENCES)]}\n'
+        for i in range(sentence_num)
+    ]
+    (source_dir / f'{stem}.conllu').write_text('\n'.join(blocks) + '\n')
+
+
+def run_conversion(tmp_path, name, extra_args, write_deptree=True,
+                   method_args=('--convert_method', 'left', '--use_pos_label')):
+    extra_args = list(method_args) + extra_args
+    source_dir = tmp_path / 'source'
+    output_path = tmp_path / name
+    args = build_parser().parse_args([
+        '--source_path', str(source_dir), '--output_path', str(output_path),
+        '--dev_test_sentence_num', '7', '--train_token_num', '30'
+    ] + (['--write_deptree'] if write_deptree else []) + extra_args)
+    for method_str, _, _ in setup_method_grid(args):
+        (output_path / method_str).mkdir(parents=True, exist_ok=True)
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+    try:
+        convert_conllu_files(args)
+    finally:
+        logger.removeHandler(handler)
+
+    outputs = {
+        path.relative_to(output_path).as_posix(): path.read_text()
+        for path in output_path.glob('**/*') if path.is_file() and path.suffix != '.idx'
+    }
+    return outputs, sorted(record.getMessage() for record in records)
+
+
+def test_parallel_conversion_matches_serial(tmp_path):
+    write_corpus(tmp_path / 'source', 'dev', 40)
+    write_corpus(tmp_path / 'source', 'train', 60)
+    serial = run_conversion(tmp_path, 'serial', [])
+    parallel = run_conversion(tmp_path, 'parallel',
+                              ['--workers', '2', '--chunk_size', '3'])
+    assert serial == parallel
+
+    light_outputs, light_messages = run_conversion(tmp_path, 'light', [], write_deptree=False)
+    assert light_messages == serial[1]
+    assert light_outputs == {
+        path: text for path, text in serial[0].items()
+        if not path.startswith('original_deptree')
+    }
+
+    outputs, messages = serial
+    assert outputs['left-POS/dev.txt'].count('\n') == 7
+    assert outputs['left-POS/train.tokens'].count('\n') == 13
+    assert 'Non-projective sentences: 3' in messages
+    assert 'Root-non-projective sentences: 3' in messages
+
+
+def test_numpy_engine_matches_python(tmp_path):
+    pytest.importorskip('numpy')
+    write_corpus(tmp_path / 'source', 'dev', 40)
+    write_corpus(tmp_path / 'source', 'train', 60)
+    grid = ['--convert_methods', 'flat', 'left', 'right', '--label_methods', 'X', 'M_POS']
+    python_engine = run_conversion(tmp_path, 'python', [], method_args=grid)
+    assert run_conversion(tmp_path, 'numpy', ['--engine', 'numpy', '--chunk_size', '7'], method_args=grid) == python_engine
+    assert run_conversion(tmp_path, 'numpy_workers', ['--engine', 'numpy', '--workers', '2', '--chunk_size', '7'],
+                          method_args=grid) == python_engine
+
+
+def test_method_grid_matches_single_runs(tmp_path):
+    write_corpus(tmp_path / 'source', 'dev', 20)
+    grid_outputs, _ = run_conversion(
+        tmp_path, 'grid', [], method_args=['--convert_methods', 'flat', 'right', '--label_methods', 'X', 'DEP'])
+    assert len([path for path in grid_outputs if path.endswith('.txt')]) == 4
+    for convert_method in ['flat', 'right']:
+        for label_flag in ['--without_label', '--use_dep_label']:
+            outputs, _ = run_conversion(
+                tmp_path, f'{convert_method}{label_flag}', [], method_args=['--convert_method', convert_method, label_flag])
+            for path, text in outputs.items():
+                assert grid_outputs[path] == text
+
+
+def test_cached_rerun_restores_outputs_and_log(tmp_path, monkeypatch):
+    write_corpus(tmp_path / 'source', 'dev', 20)
+    cache_args = ['--cache_dir', str(tmp_path / 'cache')]
+    first = run_conversion(tmp_path, 'first', cache_args)
+
+    def fail(*args):
+        raise AssertionError('converted again')
+
+    monkeypatch.setattr('src.generate_dataset.convert_conllu_file', fail)
+    assert run_conversion(tmp_path, 'second', cache_args) == first
+    with pytest.raises(AssertionError):
+        run_conversion(tmp_path, 'forced', cache_args + ['--force'])
+
+
+def test_G18_sentences_are_excluded(tmp_path):
+    write_corpus(tmp_path / 'source', 'dev', 20)
+    conllid_file = tmp_path / 'G18_conllid.txt'
+    conllid_file.write_text('dev-0\ndev-5\n')
+    outputs, _ = run_conversion(tmp_path, 'G18', ['--G18_conllid_file', str(conllid_file)])
+    deptrees = outputs['original_deptree/dev.conllu']
+    assert '# sent_id = dev-0\n' not in deptrees and '# sent_id = dev-5\n' not in deptrees
+    assert deptrees.startswith('# sent_id = dev-3\n')
+    assert outputs['left-POS/dev.txt'].count('\n') == 6
+
+
+def test_sentence_range_with_index_matches_scan(tmp_path):
+    write_corpus(tmp_path / 'source', 'dev', 30)
+    range_args = ['--sentence_range', '5:']
+    scanned, scanned_messages = run_conversion(tmp_path, 'scanned', range_args)
+    indexed, indexed_messages = run_conversion(tmp_path, 'indexed', range_args + ['--sentence_index'])
+    assert scanned == indexed
+    assert scanned['original_deptree/dev.conllu'].startswith('# sent_id = dev-5\n')
+    # reading stops at the cutoff, but the index knows the size of the whole range
+    assert 'Corpus size (sent): 16+ (stopped reading at the cutoff)' in scanned_messages
+    assert 'Corpus size (sent): 25' in indexed_messages
+
+
+def test_resumed_conversion_matches_uninterrupted(tmp_path, monkeypatch):
+    write_corpus(tmp_path / 'source', 'train', 60)
+    checkpoint_args = ['--checkpoint_every', '4']
+    uninterrupted, _ = run_conversion(tmp_path, 'uninterrupted', checkpoint_args)
+
+    converted = []
+
+    def convert_until_interrupted(sentence, functions, write_deptree, write_actions=False):
+        if len(converted) == 10:
+            raise KeyboardInterrupt
+        converted.append(sentence)
+        return convert_sentence(sentence, functions, write_deptree, write_actions)
+
+    with monkeypatch.context() as m:
+        m.setattr('src.generate_dataset.convert_sentence', convert_until_interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            run_conversion(tmp_path, 'resumed', checkpoint_args)
+    assert (tmp_path / 'resumed' / '.checkpoints' / 'train.conllu.checkpoint.json').exists()
+
+    resumed, messages = run_conversion(tmp_path, 'resumed', checkpoint_args + ['--resume'])
+    assert 'Resuming train.conllu from sentence 8.' in messages
+    assert resumed == uninterrupted
+
+
+def test_resume_skips_converted_files(tmp_path, monkeypatch):
+    write_corpus(tmp_path / 'source', 'dev', 20)
+    write_corpus(tmp_path / 'source', 'train', 60)
+    checkpoint_args = ['--checkpoint_every', '4']
+    uninterrupted, _ = run_conversion(tmp_path, 'uninterrupted', checkpoint_args)
+
+    converted = []
+
+    def convert_until_interrupted(sentence, functions, write_deptree, write_actions=False):
+        if len(converted) == 30:
+            raise KeyboardInterrupt
+        converted.append(sentence)
+        return convert_sentence(sentence, functions, write_deptree, write_actions)
+
+    monkeypatch.setattr('src.generate_dataset.convert_sentence', convert_until_interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run_conversion(tmp_path, 'resumed', checkpoint_args)
+    checkpoint_dir = tmp_path / 'resumed' / '.checkpoints'
+    assert json.loads((checkpoint_dir / 'dev.conllu.checkpoint.json').read_text())['state']['done']
+
+    converted.clear()
+    resumed, messages = run_conversion(tmp_path, 'resumed', checkpoint_args + ['--resume'])
+    # dev.conllu is not converted again, and its log is replayed
+    assert all(sentence.id.startswith('train-') for sentence in converted)
+    assert 'dev.conllu was converted before the interruption.' in messages
+    assert 'Converted sentences: 7' in messages
+    assert resumed == uninterrupted
+    assert not list(checkpoint_dir.iterdir())
+
+
+def test_metrics_file(tmp_path, capsys):
+    write_corpus(tmp_path / 'source', 'dev', 20)
+    metrics_file = tmp_path / 'metrics.json'
+    run_conversion(tmp_path, 'metrics', ['--metrics_file', str(metrics_file), '--progress'])
+    metrics = json.loads(metrics_file.read_text())['files']['dev.conllu']
+    assert set(metrics['stage_seconds']) == {'parse', 'validation', 'conversion', 'sanitization', 'write'}
+    assert metrics['read_sentences'] == 16
+    assert metrics['converted_sentences'] == 7
+    assert metrics['rejections']['NonProjError'] == {'reason': 'nonproj', 'count': 3, 'rate': 3 / 16}
+    assert metrics['rejections']['CFContainedError']['count'] == 3
+    assert sum(metrics['sentence_length_histogram'].values()) == 16
+    assert capsys.readouterr().err.endswith('\n')
+
+
+def test_sanitization_is_timed_apart_from_conversion(monkeypatch):
+    def slow_sanitize_form(form):
+        time.sleep(0.01)
+        return form
+
+    monkeypatch.setattr('src.converter.sanitize_form', slow_sanitize_form)
+    sentence = LightSentence(SENTENCES[0].splitlines())
+    functions = [(CONVERTERS['flat'], LABEL_FUNCTIONS['X'])]
+    rejection, _, (_, _, conversion, sanitization) = convert_sentence(sentence, functions, False)
+    assert rejection is None
+    assert sanitization >= 0.04 > conversion
@@ -0,0 +1,42 @@
+import gzip
+
+import pytest
+
+from src.output_writer import *
+
+
+def test_batched_writer(tmp_path):
+    path = tmp_path / 'dev.txt'
+    with BatchedWriter(path, buffer_size=8) as writer:
+        for i in range(5):
+            writer.write_line(f'line {i}')
+        assert not path.exists()
+    assert path.read_text() == ''.join(f'line {i}\n' for i in range(5))
+
+
+def test_compressed_writer(tmp_path):
+    with BatchedWriter(tmp_path / 'dev.tokens', compression='gzip') as writer:
+        writer.write_line('a b c')
+    assert gzip.open(tmp_path / 'dev.tokens.gz', 'rt').read() == 'a b c\n'
+
+
+def test_failed_output_is_not_renamed(tmp_path):
+    with pytest.raises(RuntimeError):
+        with BatchedWriter(tmp_path / 'dev.txt') as writer:
+            writer.write_line('a b c')
+            raise RuntimeError
+    assert not (tmp_path / 'dev.txt').exists()
+
+
+def test_resume_truncates_to_checkpoint(tmp_path):
+    path = tmp_path / 'dev.txt'
+    with pytest.raises(RuntimeError):
+        with BatchedWriter(path) as writer:
+            writer.write_line('a b c')
+            size = writer.checkpoint()
+            writer.write_line('lost')
+            writer.flush()
+            raise RuntimeError
+    with BatchedWriter(path, resume_size=size) as writer:
+        writer.write_line('d e')
+    assert path.read_text() == 'a b c\nd e\n'
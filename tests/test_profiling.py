@@ -0,0 +1,45 @@
+import json
+import pstats
+import time
+
+from src.conllu_reader import read_conllu_blocks
+from src.profiling import *
+from tests.test_generate_dataset import run_conversion, write_corpus
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_stack_sampler(tmp_path):
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    busy_loop(0.1)
+    sampler.stop()
+    assert any(stack.split(';')[-1].startswith('busy_loop (test_profiling.py:') for stack in sampler.stacks)
+    sampler.write_collapsed(tmp_path / 'stacks.collapsed')
+    for line in (tmp_path / 'stacks.collapsed').read_text().splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert stack in sampler.stacks and int(count) == sampler.stacks[stack]
+
+
+def test_profile_outputs(tmp_path):
+    write_corpus(tmp_path / 'source', 'dev', 20)
+    profile_dir = tmp_path / 'profile'
+    run_conversion(tmp_path, 'profiled', ['--profile', '--profile_dir', str(profile_dir), '--profile_slowest', '3'])
+
+    stats = pstats.Stats(str(profile_dir / 'dev.conllu.pstats'))
+    assert any(function == 'convert_sentence' for _, _, function in stats.stats)
+    assert (profile_dir / 'dev.conllu.collapsed').exists()
+
+    slowest = json.loads((profile_dir / 'dev.conllu.slowest.json').read_text())
+    assert len(slowest) == 3
+    assert [record['seconds'] for record in slowest] == sorted((record['seconds'] for record in slowest), reverse=True)
+    blocks = dict(read_conllu_blocks(tmp_path / 'source' / 'dev.conllu', numbered=True))
+    for record in slowest:
+        assert record['sent_id'] == f'dev-{record["block"]}'
+        assert record['length'] == sum(not line.startswith('#') for line in blocks[record['block']])
+    assert list(read_conllu_blocks(profile_dir / 'dev.conllu.slowest.conllu')) == [
+        blocks[record['block']] for record in slowest]
@@ -0,0 +1,89 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from src.generate_dataset import build_parser
+from src.metrics import STAGES
+from src.scheduler import *
+from src.sentence_index import SentenceIndex
+from tests.test_generate_dataset import run_conversion, write_corpus
+
+
+def write_treebanks(source_dir):
+    write_corpus(source_dir / 'UD_A', 'a-ud-train', 300)
+    write_corpus(source_dir / 'UD_A', 'a-ud-dev', 40)
+    write_corpus(source_dir / 'UD_B', 'b-ud-train', 50)
+    write_corpus(source_dir / 'UD_B', 'b-ud-test', 9)
+
+
+def test_split_range(tmp_path):
+    write_corpus(tmp_path, 'train', 100)
+    with SentenceIndex.open(tmp_path / 'train.conllu') as index:
+        pieces = split_range(index, 10, None, (index.ends[99] - index.starts[10]) / 4)
+        assert len(pieces) == 4
+        assert [first for first, _, _ in pieces[1:]] == [last for _, last, _ in pieces[:-1]]
+        assert pieces[0][0] == 10 and pieces[-1][1] == 100
+        assert sum(size for _, _, size in pieces) <= index.ends[99] - index.starts[10]
+        assert split_range(index, 0, 5, 1 << 20) == [(0, 5, index.ends[4] - index.starts[0])]
+
+
+def test_scheduled_conversion_matches_serial(tmp_path):
+    write_treebanks(tmp_path / 'source')
+    # a train cutoff past the end of a file, and one inside a piece of the other train file
+    cutoff_args = ['--train_token_num', '200', '--dev_test_sentence_num', '25']
+    serial, serial_messages = run_conversion(tmp_path, 'serial', cutoff_args)
+    scheduled, scheduled_messages = run_conversion(
+        tmp_path, 'scheduled', cutoff_args + ['--jobs', '3', '--split_mb', '0.002', '--write_actions'])
+
+    summary = json.loads(scheduled.pop('run_summary.json'))
+    # the files are split with sentence indexes kept with the outputs, not next to the (maybe read-only) sources
+    assert not list((tmp_path / 'source').glob('**/*.idx'))
+    assert list((tmp_path / 'scheduled' / '.split_index').glob('*-a-ud-train.conllu.idx'))
+    scheduled = {path: output for path, output in scheduled.items() if '.actions' not in path}
+    assert scheduled == serial
+    assert scheduled_messages == serial_messages
+    assert summary['files']['a-ud-train.conllu']['pieces'] > 1
+    assert summary['files']['a-ud-train.conllu']['reached_cutoff']
+    assert not summary['files']['b-ud-train.conllu']['reached_cutoff']
+    assert summary['total']['files'] == 4
+    assert summary['total']['converted_sentences'] == sum(
+        file_summary['converted_sentences'] for file_summary in summary['files'].values())
+    with ActionReader(tmp_path / 'scheduled' / 'left-POS' / 'a-ud-train') as reader:
+        assert [reader.decode(record) for record in reader] == serial['left-POS/a-ud-train.txt'].splitlines()
+
+
+# Run as a script, generate_dataset.py is the __main__ module, whose logger has the convert.log handlers.
+def test_script_run_logs_scheduled_files(tmp_path):
+    write_treebanks(tmp_path / 'source')
+
+    def run_script(name, extra_args):
+        output_path = tmp_path / name
+        subprocess.run([sys.executable, 'generate_dataset.py', '--source_path', str(tmp_path / 'source'),
+                        '--output_path', str(output_path), '--convert_method', 'left', '--use_pos_label',
+                        '--dev_test_sentence_num', '25', '--train_token_num', '200'] + extra_args,
+                       cwd=Path(__file__).parent.parent / 'src', check=True)
+        lines = (output_path / 'left-POS' / 'convert.log').read_text().splitlines()
+        return [line.split(' :', 1)[1] for line in lines]
+
+    serial = run_script('serial', [])
+    assert serial
+    assert run_script('scheduled', ['--jobs', '3', '--split_mb', '0.002']) == serial
+
+
+def test_merge_counts_time_up_to_the_cutoff(tmp_path):
+    write_corpus(tmp_path, 'dev', 40)
+    args = build_parser().parse_args(['--dev_test_sentence_num', '7', '--convert_method', 'left', '--use_pos_label'])
+    _, _, functions, _ = setup_outputs(args)
+    (tmp_path / 'out').mkdir()
+    merge = FileMerge(args, tmp_path / 'dev.conllu', [tmp_path / 'out'], None, 2, metrics=FileMetrics('dev.conllu'))
+    # the cutoff is reached inside the second piece, which converts 7 sentences of its own
+    for piece_num, (first, last) in enumerate([(0, 10), (10, None)]):
+        part_dir = tmp_path / str(piece_num)
+        records = convert_piece(args, tmp_path / 'dev.conllu', functions, part_dir, first, last, False)
+        # every sentence takes one second in every stage
+        merge.add_piece(part_dir, [record[:3] + ((1.0, ) * len(STAGES), ) for record in records])
+    merge.finish()
+    assert merge.reached_cutoff
+    assert merge.read_sentence_num == 16 < 10 + len(records)
+    assert all(16 <= merge.metrics.stage_seconds[stage] < 17 for stage in STAGES)
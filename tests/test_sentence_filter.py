@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from src.conllu_reader import LightSentence
+from src.converter import find_conllu_files
+from src.generate_dataset import reached_file_cutoff
+from src.sentence_filter import *
+from tests.test_generate_dataset import SENTENCES, run_conversion, write_corpus
+
+
+def chain_sentence(length, form='w'):
+    return LightSentence([f'{i}\t{form}{i}\t_\tNOUN\t_\t_\t{i + 1 if i < length else 0}\t{"dep" if i < length else "root"}\t_\t_'
+                          for i in range(1, length + 1)])
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1 << 10)
+    digests = [hashlib.blake2b(str(i).encode(), digest_size=16).digest() for i in range(100)]
+    assert not any(bloom.add(digest) for digest in digests)
+    assert all(bloom.add(digest) for digest in digests)
+    assert bloom.item_num == 100 and bloom.false_positive_rate() < 1e-3
+
+
+def test_sentence_filter():
+    sentence_filter = SentenceFilter(dedup_mb=1, min_tokens=2)
+    sentences = [LightSentence(sentence.split('\n')) for sentence in SENTENCES] * 2
+    dropped = []
+    kept = [block_num for block_num, _ in sentence_filter.filter(enumerate(sentences), lambda *drop: dropped.append(drop))]
+    # the single-token sentence is short, the Cf sentence is left for validation to reject
+    assert kept == [0, 1, 2, 4, 9]
+    assert dropped == [(3, 'short'), (5, 'duplicate'), (6, 'duplicate'), (7, 'duplicate'), (8, 'short')]
+
+
+def test_sample_blocks():
+    rng = random.Random(1)
+    sentences = [chain_sentence(rng.randint(1, 60)) for _ in range(400)]
+    # a non-projective sentence is always kept
+    sentences.append(LightSentence(SENTENCES[1].split('\n')))
+    block_nums, counts = sample_blocks(enumerate(sentences), 1000, [10, 30], [1, 2, 1], random.Random(0))
+    assert block_nums == sorted(block_nums) and block_nums[-1] == 400
+    lengths = [len(sentences[block_num]) for block_num in block_nums[:-1]]
+    assert counts['sampled_sentences'] == len(lengths) and counts['sampled_tokens'] == sum(lengths) <= 1000
+    bucket_tokens = [sum(length for length in lengths if low < length <= high)
+                     for low, high in [(0, 10), (10, 30), (30, 60)]]
+    assert 200 <= bucket_tokens[0] <= 250 and 440 <= bucket_tokens[1] <= 500 and 190 <= bucket_tokens[2] <= 250
+    assert sample_blocks(enumerate(sentences), 1000, [10, 30], [1, 2, 1], random.Random(0))[0] == block_nums
+    assert list(select_blocks(enumerate(sentences), block_nums)) == [(i, sentences[i]) for i in block_nums]
+
+
+def test_conversion_with_dedup(tmp_path):
+    write_corpus(tmp_path / 'source', 'dev', 40)
+    write_corpus(tmp_path / 'source', 'train', 60)
+    outputs, messages = run_conversion(tmp_path, 'dedup', ['--dedup', '--dedup_mb', '0.1'], write_deptree=False)
+    # only the first occurrence of every sentence is converted, in the first file converted
+    assert sorted(outputs['left-POS/dev.tokens'].splitlines() + outputs['left-POS/train.tokens'].splitlines()) == [
+        'I heard a noise', 'Yes']
+    assert 'Duplicate sentences: 28' in messages and 'Duplicate sentences: 48' in messages
+    # the dropped sentences are part of the corpus size
+    assert 'Corpus size (sent): 40' in messages and 'Corpus size (sent): 60' in messages
+
+
+def test_conversion_with_sampling(tmp_path):
+    write_corpus(tmp_path / 'source', 'train', 100)
+    outputs, messages = run_conversion(tmp_path, 'sampled', ['--sample_train', '--length_buckets', '1', '--seed', '3'],
+                                       write_deptree=False)
+    tokens = outputs['left-POS/train.tokens'].splitlines()
+    # 15 of the 30 tokens of each bucket
+    assert sorted(set(tokens)) == ['I heard a noise', 'Yes'] and tokens.count('Yes') == 15
+    assert tokens.count('I heard a noise') == 3
+    assert 'Sampled sentences: 18 (27 tokens)' in messages
+    assert 'Corpus size (sent): 100' in messages
+    assert 'Non-projective sentences: 20' in messages
+
+
+def test_resumed_conversion_with_min_tokens_and_workers(tmp_path, monkeypatch):
+    write_corpus(tmp_path / 'source', 'train', 60)
+    filter_args = ['--min_tokens', '2', '--checkpoint_every', '3']
+    uninterrupted, _ = run_conversion(tmp_path, 'uninterrupted', filter_args, write_deptree=False)
+
+    # interrupt the main loop while the workers have chunks (and dropped sentences) read ahead of it
+    checked = []
+
+    def cutoff_until_interrupted(*args):
+        if len(checked) == 6:
+            raise KeyboardInterrupt
+        checked.append(args)
+        return reached_file_cutoff(*args)
+
+    parallel_args = filter_args + ['--workers', '2', '--chunk_size', '2']
+    with monkeypatch.context() as m:
+        m.setattr('src.generate_dataset.reached_file_cutoff', cutoff_until_interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            run_conversion(tmp_path, 'resumed', parallel_args, write_deptree=False)
+    resumed, messages = run_conversion(tmp_path, 'resumed', parallel_args + ['--resume'], write_deptree=False)
+    assert 'Resuming train.conllu from sentence 24.' in messages
+    assert resumed == uninterrupted
+    assert 'Sentences with less than 2 tokens: 7' in messages
+
+
+def test_sampled_sentences_are_the_only_ones_seen(tmp_path, monkeypatch):
+    source_dir = tmp_path / 'source'
+    source_dir.mkdir()
+    blocks = '\n'.join(f'1\tw{i}\tw\tINTJ\t_\t_\t0\troot\t_\t_\n' for i in range(20))
+    # the train file is converted first, and the test file has the same sentences
+    (source_dir / 'a-train.conllu').write_text(blocks)
+    (source_dir / 'b-test.conllu').write_text(blocks)
+    monkeypatch.setattr('src.generate_dataset.find_conllu_files', lambda path: sorted(find_conllu_files(path)))
+    outputs, messages = run_conversion(tmp_path, 'sampled', [
+        '--sample_train', '--dedup', '--dedup_mb', '0.1', '--train_token_num', '5', '--dev_test_sentence_num', '100'],
+        write_deptree=False)
+    train = outputs['left-POS/a-train.tokens'].splitlines()
+    test = outputs['left-POS/b-test.tokens'].splitlines()
+    # only the sentences written to the train outputs were seen before the test file
+    assert len(train) == 5
+    assert sorted(train + test) == sorted(f'w{i}' for i in range(20))
@@ -0,0 +1,66 @@
+import os
+
+from src.conllu_reader import read_conllu_blocks
+from src.sentence_index import *
+
+CONLLU = """# sent_id = a
+1	I	I	PRON	_	_	2	nsubj	_	_
+2	heard	hear	VERB	_	_	0	root	_	_
+
+   
+1	No	no	INTJ	_	_	0	root	_	_
+
+# sent_id = c
+1-2	dont	_	_	_	_	_	_	_	_
+1	do	do	AUX	_	_	3	aux	_	_
+2	n't	not	PART	_	_	3	advmod	_	_
+3	go	go	VERB	_	_	0	root	_	_"""
+
+
+def test_index_matches_reader(tmp_path):
+    source_path = tmp_path / 'sample.conllu'
+    source_path.write_text(CONLLU)
+    blocks = list(read_conllu_blocks(source_path))
+    with SentenceIndex.open(source_path) as index:
+        assert os.path.exists(index_path(source_path))
+        assert len(index) == len(blocks) == 3
+        assert [index.sent_id(i) for i in range(3)] == ['a', None, 'c']
+        assert [index.token_num(i, i + 1) for i in range(3)] == [2, 1, 4]
+        assert index.token_cutoff(0, 2) == 2 and index.token_cutoff(1, 10) == 3
+        for first in range(4):
+            assert list(read_conllu_blocks(source_path, first=first, index=index)) == blocks[first:]
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    source_path = tmp_path / 'sample.conllu'
+    source_path.write_text(CONLLU)
+    with SentenceIndex.open(source_path) as index:
+        assert len(index) == 3
+    source_path.write_text(CONLLU + '\n\n# sent_id = d\n1\tYes\tyes\tINTJ\t_\t_\t0\troot\t_\t_\n')
+    with SentenceIndex.open(source_path) as index:
+        assert len(index) == 4 and index.sent_id(3) == 'd'
+
+    # the index is written to a temporary file of its own and renamed
+    assert sorted(os.listdir(tmp_path)) == ['sample.conllu', 'sample.conllu.idx']
+    assert os.stat(index_path(source_path)).st_mode & 0o444 == os.stat(source_path).st_mode & 0o444
+
+
+def test_parse_sentence_range():
+    assert parse_sentence_range('10:20') == (10, 20)
+    assert parse_sentence_range('10:') == (10, None)
+    assert parse_sentence_range(':5') == (0, 5)
+
+
+# the index reads sources as UTF-8 whatever the locale, like read_conllu_blocks
+def test_open_at_reads_utf8_under_c_locale(tmp_path):
+    import subprocess
+    import sys
+    source_path = tmp_path / 'sample.conllu'
+    source_path.write_text(CONLLU.replace('dont', 'café'), encoding='utf-8')
+    script = ('import sys; from src.sentence_index import SentenceIndex; '
+              'index = SentenceIndex.open(sys.argv[1]); '
+              'sys.stdout.buffer.write(index.open_at(2).read().encode("utf-8"))')
+    env = dict(os.environ, LC_ALL='C', LANG='C', PYTHONUTF8='0', PYTHONIOENCODING='ascii')
+    output = subprocess.run([sys.executable, '-c', script, str(source_path)], env=env, check=True,
+                            capture_output=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.decode('utf-8').startswith('# sent_id = c') and 'café' in output.stdout.decode('utf-8')
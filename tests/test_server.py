@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from src.api import convert_stream
+from src.server import ConversionServer, request
+from tests.test_generate_dataset import SENTENCES
+
+
+async def run_requests(socket_path, messages, max_request_mb=64):
+    server = ConversionServer(workers=0, chunk_size=2, max_request_mb=max_request_mb)
+    try:
+        async with await server.start(unix_socket=socket_path):
+            reader, writer = await asyncio.open_unix_connection(socket_path, limit=64 << 20)
+            answers = [[answer async for answer in request(reader, writer, message)] for message in messages]
+            writer.close()
+            return answers
+    finally:
+        server.close()
+
+
+def test_server_streams_trees_in_order(tmp_path):
+    source_path = tmp_path / 'dev.conllu'
+    source_path.write_text('\n\n'.join(SENTENCES * 3) + '\n')
+    answers = asyncio.run(run_requests(str(tmp_path / 'server.sock'), [
+        {'id': 1, 'method': 'left', 'label': 'POS', 'conllu': '\n\n'.join(SENTENCES)},
+        {'id': 2, 'path': str(source_path)},
+        {'id': 3, 'method': 'diagonal'},
+    ]))
+    first, second, error = answers
+    assert [answer['index'] for answer in first[:-1]] == list(range(5))
+    assert [answer['tree'] for answer in first if 'tree' in answer] == list(
+        convert_stream(SENTENCES, method='left', label='POS'))
+    assert first[1] == {'id': 1, 'index': 1, 'rejection': 'nonproj'}
+    assert first[-1]['done'] and first[-1]['sentences'] == 5 and first[-1]['converted'] == 2
+    assert second[-1]['sentences'] == 15 and second[-1]['latency_ms'] >= second[-1]['first_result_ms']
+    assert error == [{'id': 3, 'error': "KeyError: 'diagonal'"}]
+
+
+def test_server_answers_unexpected_errors(tmp_path, monkeypatch):
+    closed = []
+
+    def read_blocks(path):
+        try:
+            yield from [sentence.splitlines() for sentence in SENTENCES]
+        finally:
+            closed.append(path)
+
+    def fail(blocks, functions):
+        raise RuntimeError('worker failed')
+
+    monkeypatch.setattr('src.server.read_conllu_blocks', read_blocks)
+    monkeypatch.setattr('src.server.convert_blocks', fail)
+    answers = asyncio.run(run_requests(str(tmp_path / 'server.sock'), [
+        {'id': 1, 'path': 'dev.conllu'},
+        {'id': 2, 'conllu': SENTENCES[0]},
+    ]))
+    assert answers == [[{'id': 1, 'error': 'RuntimeError: worker failed'}],
+                       [{'id': 2, 'error': 'RuntimeError: worker failed'}]]
+    assert closed == ['dev.conllu']
+
+
+def test_server_accepts_requests_larger_than_64_kib(tmp_path):
+    sentence = '1\tYes\tyes\tINTJ\t_\t_\t2\tdiscourse\t_\t_\n2\tno\tno\tINTJ\t_\t_\t0\troot\t_\t_'
+    message = {'id': 1, 'conllu': '\n\n'.join([sentence] * 2000)}
+    assert len(json.dumps(message)) > 64 << 10
+    answers, = asyncio.run(run_requests(str(tmp_path / 'server.sock'), [message]))
+    assert answers[-1]['done'] and answers[-1]['converted'] == 2000
+
+    # a request over the limit is answered with an error line
+    answers, = asyncio.run(run_requests(str(tmp_path / 'small.sock'), [message], max_request_mb=0.05))
+    assert len(answers) == 1 and answers[0]['id'] is None and answers[0]['error'].startswith('ValueError')
@@ -0,0 +1,65 @@
+import pyconll
+
+from src.tdt_split import *
+
+
+def write_source(path, sentence_num):
+    blocks = [
+        f'# sent_id = {i}\n1\tw{i}\tw\tNOUN\t_\t_\t0\troot\t_\t_\n'
+        for i in range(sentence_num)
+    ]
+    path.write_text('\n'.join(blocks) + '\n')
+
+
+def split(tmp_path, policy, **kwargs):
+    paths = [tmp_path / f'{name}.conllu' for name in ['train', 'dev', 'test']]
+    tdt_split(tmp_path / 'source.conllu', *paths, policy=policy, **kwargs)
+    return [pyconll.load_from_file(str(path)) for path in paths]
+
+
+def test_head_split(tmp_path):
+    write_source(tmp_path / 'source.conllu', 10)
+    train, dev, test = split(tmp_path, 'head', sent=3)
+    assert [s.id for s in dev] == ['0', '1', '2']
+    assert [s.id for s in test] == ['3', '4', '5']
+    assert [s.id for s in train] == ['6', '7', '8', '9']
+    # blocks are copied as they are, which is what the pyconll round-trip used to write
+    assert (tmp_path / 'dev.conllu').read_text() == ''.join(s.conll() + '\n\n' for s in dev)
+
+
+def test_ratio_and_hash_splits(tmp_path):
+    write_source(tmp_path / 'source.conllu', 100)
+    train, dev, test = split(tmp_path, 'ratio', dev_ratio=0.1, test_ratio=0.2)
+    assert len(dev) == 10 and 19 <= len(test) <= 20 and len(train) + len(dev) + len(test) == 100
+    train, dev, test = split(tmp_path, 'hash', dev_ratio=0.1, test_ratio=0.2)
+    assert len(train) + len(dev) + len(test) == 100 and dev and test
+    assert split(tmp_path, 'hash', dev_ratio=0.1, test_ratio=0.2)[1][0].id == dev[0].id
+
+
+def test_parse_shard_ids():
+    assert parse_shard_ids('0-3,8') == ['0', '1', '2', '3', '8']
+
+
+def test_indexed_split_with_range_and_token_cutoff(tmp_path):
+    write_source(tmp_path / 'source.conllu', 20)
+    train, dev, test = split(tmp_path, 'head', sent=2, sentence_range='2:', train_token_num=2)
+    assert [s.id for s in dev] == ['2', '3'] and [s.id for s in test] == ['4', '5']
+    assert [s.id for s in train] == ['6', '7', '8']
+    train, dev, test = split(tmp_path, 'ratio', dev_ratio=0.5, test_ratio=0.0,
+                             sentence_range='0:10', train_token_num=2)
+    assert [s.id for s in dev] == ['1', '3', '5', '7', '9'] and [s.id for s in train] == ['0', '2', '4']
+
+
+def test_crlf_source(tmp_path):
+    (tmp_path / 'source.conllu').write_bytes(
+        b'# sent_id = 0\r\n1\tw0\tw\tNOUN\t_\t_\t0\troot\t_\t_\r\n\r\n'
+        b'# sent_id = 1\r\n1\tw1\tw\tNOUN\t_\t_\t0\troot\t_\t_\r\n \r\n')
+    assert [block.count(b'\n') for block in iter_raw_blocks(tmp_path / 'source.conllu')] == [2, 2]
+    train, dev, test = split(tmp_path, 'head', sent=1)
+    assert [s.id for s in dev] == ['0'] and [s.id for s in test] == ['1'] and len(train) == 0
+
+
+def test_indexed_split_of_empty_source(tmp_path):
+    (tmp_path / 'source.conllu').write_bytes(b'')
+    assert [len(sentences) for sentences in split(tmp_path, 'head', sent=1, train_token_num=5)] == [0, 0, 0]
+    assert [len(sentences) for sentences in split(tmp_path, 'ratio', sentence_range='0:10')] == [0, 0, 0]